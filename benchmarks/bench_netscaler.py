@@ -0,0 +1,193 @@
+"""Call count, latency and memory benchmark for the netscaler lookups.
+
+Runs netscaler_adc_servers_from_vservers (lb and cs vservers), netscaler_adc_servers_from_url
+and netscaler_adm_vserver_from_ip against the local NITRO stand-in in every mode, and reports
+wall time, NITRO requests per resource, connections and peak Python memory. The stand-in
+runs in a child process, hostnames of the URLs resolve through a static table of the
+generated topology and each scenario starts from an empty process session cache.
+
+    python benchmarks/bench_netscaler.py --latency 0.02
+    python benchmarks/bench_netscaler.py --vservers 5000 --members 50 --terms 200 --modes bulk,cache
+    python benchmarks/bench_netscaler.py --check
+
+--check runs the topology and terms recorded in netscaler_call_counts.json and exits with 1
+when any scenario needs more requests than recorded there, --update-baseline rewrites it.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import urllib3
+
+from collection import load_lookup
+from nitro_standin import StandInProcess, Topology, redirect_connections
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netscaler_call_counts.json')
+LOOKUPS = ('vservers_lb', 'vservers_cs', 'url', 'ip')
+MODES = ('default', 'bulk', 'cache')
+
+
+def parse_list(value):
+    return [item for item in value.split(',') if item]
+
+
+def parse_option(value):
+    name, _, option = value.partition('=')
+    try:
+        return name, json.loads(option)
+    except ValueError:
+        return name, option
+
+
+def static_resolver(records):
+    def resolve_ip(hostname, nameserver=''):
+        return records.get(hostname, []), hostname + '.'
+    return resolve_ip
+
+
+def scenario_runs(topology, lookups, terms_count):
+    """(name, lookup plugin, terms, options) of every scenario."""
+    domain = topology.domain
+    adm = {'adm_hostname': f"adm.{domain}"}
+    adc = {'adc_hostname': topology.adc_hostname(0)}
+    lb_names = [topology.lb_vserver(0, number % topology.vservers)[0] for number in range(terms_count)]
+    cs_names = [topology.cs_vserver(0, number % topology.cs_vservers)[0] for number in range(terms_count)] if topology.cs_vservers else []
+    # cs addresses answer directly, lb addresses only after the cs query misses
+    addresses = [
+        topology.cs_vserver(number % topology.adcs, number // topology.adcs % topology.cs_vservers)[1]
+        if number % 2 == 0 and topology.cs_vservers else
+        topology.lb_vserver(number % topology.adcs, number // topology.adcs % topology.vservers)[1]
+        for number in range(terms_count)
+    ]
+    runs = {
+        'vservers_lb': ('netscaler_adc_servers_from_vservers', lb_names, dict(adc, vserver_type='lb', url='https://www.example.net/')),
+        'vservers_cs': ('netscaler_adc_servers_from_vservers', cs_names, dict(adc, vserver_type='cs', url=f"https://site.{domain}/s2/cart")),
+        'url': ('netscaler_adc_servers_from_url', topology.urls(terms_count), adm),
+        'ip': ('netscaler_adm_vserver_from_ip', addresses, dict(adm, protocol='SSL')),
+    }
+    return [(name,) + runs[name] for name in lookups if runs[name][1]]
+
+
+def mode_options(mode, cache_dir):
+    # every lookup gets its own snapshots, the ADM one would otherwise be shared
+    if mode == 'default':
+        return [('default', {})]
+    if mode == 'bulk':
+        return [('bulk', {'bulk': True})]
+    if mode == 'cache':
+        # a cold run fills the snapshots, the warm run after it is answered from them
+        return [('cache_cold', {'cache': 'on', 'cache_dir': cache_dir}), ('cache_warm', {'cache': 'on', 'cache_dir': cache_dir})]
+    raise ValueError(f"unknown mode {mode}")
+
+
+def run_scenario(standin, nitro, lookup, terms, options):
+    nitro.logout_nitro_sessions()
+    standin.reset_counts()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = lookup.run(terms, variables={}, username='nsroot', password='nsroot', **options)
+    wall_time = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if len(result) != len(terms):
+        raise RuntimeError(f"expected {len(terms)} results, lookup returned {len(result)}")
+    counts, connections = standin.counts()
+    return {
+        'wall_time': round(wall_time, 4),
+        'requests': sum(count for resource, count in counts.items() if resource != 'logout'),
+        'connections': connections,
+        'resources': dict(sorted(counts.items())),
+        'peak_memory': peak_memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--adcs', type=int, default=2)
+    parser.add_argument('--vservers', type=int, default=50, help='lb vservers per ADC')
+    parser.add_argument('--members', type=int, default=10, help='backend servers per lb vserver')
+    parser.add_argument('--cs-vservers', type=int, default=5, help='cs vservers per ADC')
+    parser.add_argument('--policies', type=int, default=20, help='policies per cs vserver')
+    parser.add_argument('--terms', type=int, default=50, help='terms per lookup')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--lookups', type=parse_list, default=list(LOOKUPS), help='comma separated, of ' + ','.join(LOOKUPS))
+    parser.add_argument('--modes', type=parse_list, default=list(MODES), help='comma separated, of ' + ','.join(MODES))
+    parser.add_argument('--option', type=parse_option, action='append', default=[],
+                        help='extra option for every lookup, e.g. max_workers=1 (repeatable)')
+    parser.add_argument('--check', action='store_true', help='fail when requests exceed the recorded baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='record the request counts as the new baseline')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+    baseline = None
+    if args.check:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        # request counts only compare on the topology they were recorded with
+        for name, value in baseline['topology'].items():
+            setattr(args, name, value)
+        args.terms = baseline['terms']
+        args.lookups = list(LOOKUPS)
+        args.modes = list(MODES)
+    # the stand-in certificate is self-signed and the lookups do not verify it
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    topology = Topology(args.adcs, args.vservers, args.members, args.cs_vservers, args.policies)
+    standin = StandInProcess(topology, args.latency)
+    redirect_connections(standin.port)
+    cache_dir = tempfile.mkdtemp(prefix='netscaler_bench_')
+    nitro = None
+    requests = dict()
+    try:
+        if not args.json:
+            print(f"{'scenario':<24} {'terms':>6} {'wall s':>9} {'requests':>9} {'conns':>6} {'peak KiB':>9}  resources")
+        for name, plugin, terms, lookup_options in scenario_runs(topology, args.lookups, args.terms):
+            lookup, module = load_lookup(plugin)
+            nitro = sys.modules['ansible_collections.cencora.itoa.plugins.module_utils.nitro']
+            if hasattr(module, 'resolve_ip'):
+                resolve_ip = static_resolver(topology.dns())
+                module.resolve_ip = resolve_ip
+                sys.modules['ansible_collections.cencora.itoa.plugins.module_utils.dns_cache'].resolve_ip = resolve_ip
+            for mode in args.modes:
+                for mode_name, options in mode_options(mode, os.path.join(cache_dir, name)):
+                    scenario = f"{name}/{mode_name}"
+                    result = run_scenario(standin, nitro, lookup, terms, dict(lookup_options, **options, **dict(args.option)))
+                    requests[scenario] = result['requests']
+                    if args.json:
+                        print(json.dumps(dict(result, scenario=scenario, terms=len(terms))))
+                    else:
+                        resources = ' '.join(f"{resource}={count}" for resource, count in result['resources'].items())
+                        print(f"{scenario:<24} {len(terms):>6} {result['wall_time']:>9.3f} {result['requests']:>9} "
+                              f"{result['connections']:>6} {result['peak_memory'] // 1024:>9}  {resources}")
+    finally:
+        if nitro is not None:
+            nitro.logout_nitro_sessions()
+        standin.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    if args.update_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump({
+                'topology': {name: getattr(args, name) for name in ('adcs', 'vservers', 'members', 'cs_vservers', 'policies')},
+                'terms': args.terms,
+                'requests': requests,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {BASELINE}")
+    if baseline is not None:
+        regressions = [
+            f"{scenario}: {count} requests, baseline {baseline['requests'][scenario]}"
+            for scenario, count in requests.items()
+            if scenario in baseline['requests'] and count > baseline['requests'][scenario]
+        ]
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('Request counts within baseline')
+
+
+if __name__ == '__main__':
+    main()
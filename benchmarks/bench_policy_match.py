@@ -0,0 +1,327 @@
+"""Microbenchmark for content switching policy evaluation in the NetScaler lookups.
+
+Checks that compiled rules give the same result as the former character by character
+evaluator for every rule of the corpus against every URL, then times both. A generated
+csvserver with --policies bindings is then resolved for --urls URLs through PolicyIndex
+and through a scan of the bindings in priority order, which must pick the same policy.
+
+    python benchmarks/bench_policy_match.py
+    python benchmarks/bench_policy_match.py --rounds 200 --policies 2000 --urls 500 --json
+"""
+import argparse
+import json
+import sys
+import time
+
+from ansible.utils.display import Display
+
+from collection import collections_path
+
+display = Display()
+
+RULE_CORPUS = [
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com")',
+    'HTTP.REQ.HOSTNAME.SET_TEXT_MODE(IGNORECASE).EQ("Shop.Example.com")',
+    'HTTP.REQ.HOSTNAME.NE("www.example.com")',
+    'HTTP.REQ.HOSTNAME.CONTAINS("portal")',
+    'HTTP.REQ.HOSTNAME.SERVER.EQ("www.example.com")',
+    'HTTP.REQ.URL.STARTSWITH("/api/")',
+    'HTTP.REQ.URL.PATH.STARTSWITH("/static")',
+    'HTTP.REQ.URL.SET_TEXT_MODE(IGNORECASE).STARTSWITH("/Login")',
+    'HTTP.REQ.URL.CONTAINS("/orders")',
+    'HTTP.REQ.URL.PATH.GET(1).EQ("api")',
+    'HTTP.REQ.URL.LENGTH.GT(20)',
+    'HTTP.REQ.HEADER("Host").EQ("www.example.com")',
+    'CLIENT.IP.SRC.IN_SUBNET(10.0.0.0/8)',
+    'true',
+    '',
+    "REQ.HTTP.URL == '/legacy/*'",
+    "REQ.HTTP.URL == '/legacy/*' && REQ.HTTP.HEADER Host == 'www.example.com'",
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com") && HTTP.REQ.URL.STARTSWITH("/api/")',
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com") || HTTP.REQ.HOSTNAME.EQ("shop.example.com")',
+    'HTTP.REQ.HOSTNAME.EQ("a.example.com") || HTTP.REQ.HOSTNAME.EQ("b.example.com") || HTTP.REQ.HOSTNAME.EQ("www.example.com") || HTTP.REQ.HOSTNAME.EQ("c.example.com")',
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com") || HTTP.REQ.HOSTNAME.EQ("shop.example.com") && HTTP.REQ.URL.CONTAINS("/cart")',
+    '(HTTP.REQ.HOSTNAME.EQ("www.example.com") || HTTP.REQ.HOSTNAME.EQ("shop.example.com")) && HTTP.REQ.URL.STARTSWITH("/api/")',
+    'HTTP.REQ.URL.STARTSWITH("/api/") && (HTTP.REQ.HOSTNAME.EQ("www.example.com") || HTTP.REQ.HOSTNAME.CONTAINS("portal"))',
+    '(HTTP.REQ.HOSTNAME.EQ("www.example.com") && HTTP.REQ.URL.STARTSWITH("/api/")) || (HTTP.REQ.HOSTNAME.EQ("shop.example.com") && HTTP.REQ.URL.STARTSWITH("/cart"))',
+    '(HTTP.REQ.HOSTNAME.EQ("www.example.com") && (HTTP.REQ.URL.STARTSWITH("/api/") || HTTP.REQ.URL.STARTSWITH("/static")))',
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com") && HTTP.REQ.HOSTNAME.NE("shop.example.com") && HTTP.REQ.URL.CONTAINS("/v2/")',
+    '!HTTP.REQ.HOSTNAME.EQ("www.example.com")',
+    'HTTP.REQ.HOSTNAME.EQ("www.example.com") && !HTTP.REQ.URL.CONTAINS("/admin")',
+    'HTTP.REQ.HOSTNAME.EQ( "www.example.com" )',
+    'http.req.hostname.eq("www.example.com")&&http.req.url.path.startswith("/api")',
+]
+
+URL_CORPUS = [
+    'https://www.example.com/',
+    'https://www.example.com/api/v1/orders',
+    'https://www.example.com/api/v2/items/',
+    'https://WWW.Example.com/Static/app.js',
+    'http://www.example.com/login',
+    'https://shop.example.com/cart/checkout',
+    'https://shop.example.com/',
+    'https://portal.example.com/api/health',
+    'https://myportal.example.net/orders/17',
+    'https://a.example.com/legacy/page',
+    'https://c.example.com/admin/console',
+    'http://other.example.org',
+    'https://www.example.com/static',
+    'https://www.example.com/api/',
+]
+
+
+# The evaluator the lookups used before rules were compiled, kept as the reference.
+
+open_list = ['(']
+close_list = [')']
+operator_list = ['|', '&']
+
+
+def convert_to_advanced_expression(rule):
+    return rule.replace("req.http.url == '", 'http.req.url.startswith("').replace("*'", '")')
+
+
+def eval_advanced_expression(rule, hostname, path):
+    rule = rule.replace(']', '')
+    rule_split = rule.split('[')
+    first_part_split = rule_split[0].split('.')[2:]
+    eval_var = rule_split[1]
+    element = first_part_split[0]
+    test = first_part_split[1]
+    ret = False
+    display.vvv(f'Test: {element} {test} {eval_var}')
+    if element == 'hostname':
+        if test == 'eq':
+            ret = bool(hostname == eval_var)
+        elif test == 'ne':
+            ret = bool(hostname != eval_var)
+        elif test == 'contains':
+            ret = bool(eval_var in hostname)
+        else:
+            display.v(f"Test not supported: {test}.")
+    else:
+        if test == 'startswith':
+            ret = bool(path.startswith(eval_var))
+        elif test == 'contains':
+            ret = bool(eval_var in path)
+        else:
+            display.v(f"Test not supported: {test}.")
+    return ret
+
+
+def eval_compound_advanced_expression(rule, hostname, path):
+    display.vvv(f'Expression: "{rule}"')
+    expression = ''
+    previous_char = ''
+    previous_test = False
+    operator = 'or'
+    open_count = 0
+    result = False
+    for i in rule:
+        if i in open_list:
+            display.vvvv(f'Opening parenthesis found.')
+            open_count += 1
+            if expression:
+                expression += i
+        elif i in close_list:
+            display.vvvv(f'Closing parenthesis found.')
+            open_count -= 1
+            if open_count == 0:
+                display.vvvv(f'Top most closing parenthesis found. Expression: "{expression}"')
+                if operator == 'or':
+                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
+                    result = bool(previous_test or recursive_result)
+                else:
+                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
+                    result = bool(previous_test and recursive_result)
+                previous_test = result
+                expression = ''
+            else:
+                expression += i
+        elif i in operator_list and previous_char == i and open_count == 0:
+            display.vvvv(f'Full operator found "{i}{i}"')
+            if i == '|':
+                operator = 'or'
+            else:
+                operator = 'and'
+        elif i in operator_list and open_count == 0:
+            display.vvvv(f'Operator found "{i}"')
+            if expression:
+                display.vvvv(f'Completing expression: "{expression}"')
+                if operator == 'or':
+                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
+                    display.vvvv(f'Recursive result: {recursive_result}')
+                    result = bool(previous_test or recursive_result)
+                else:
+                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
+                    display.vvvv(f'Recursive result: {recursive_result}')
+                    result = bool(previous_test and recursive_result)
+                previous_test = result
+                expression = ''
+        else:
+            expression += i
+        previous_char = i
+    if expression:
+        display.vvvv(f'Completing expression: "{expression}". Operator: "{operator}"')
+        if operator == 'or':
+            result = bool(previous_test or eval_advanced_expression(expression, hostname, path))
+        else:
+            result = bool(previous_test and eval_advanced_expression(expression, hostname, path))
+        previous_test = result
+        expression = ''
+    display.vvvv(f'Returning result: {result}')
+    return result
+
+
+def legacy_policy_match(url, rule):
+    url = url.lower()
+    rule = rule.lower()
+    url_split = url.replace('https://', '').replace('http://', '').split("/")
+    hostname = url_split[0]
+    if len(url_split) > 1 and url_split[-1]:
+        path = '/' + '/'.join(url_split[1:])
+    else:
+        path = ''
+    display.vvv(f"Url: '{url}'")
+    display.vvv(f"Hostname: '{hostname}'")
+    display.vvv(f"Path: '{path}'")
+    display.vvv(f"Policy rule: '{rule}'")
+    if 'req.http' in rule:
+        display.vvv(f"Classic policy expression: {rule} detected. Converting to advanced.")
+        rule = convert_to_advanced_expression(rule)
+    rule = rule.replace('("', '[')
+    rule = rule.replace('")', ']')
+    rule = rule.replace(' ', '')
+    rule = rule.replace('url.path', 'url')
+    rule = rule.replace('get(1).', '')
+    rule = rule.replace('set_text_mode(ignorecase).', '')
+    display.vvv(f"Final optimized rule: '{rule}'")
+    try:
+        result = eval_compound_advanced_expression(rule, hostname, path)
+        display.vvv(f"Expression evaluated to {result}")
+    except Exception as e:
+        display.vvv(f"Error evaluating policy expression {rule}. Error: {e}. Setting result to false.")
+        result = False
+    return result
+
+
+def generate_bindings(count):
+    """csvserver_cspolicy_binding records mixing indexable and unindexable rules."""
+    templates = [
+        'HTTP.REQ.HOSTNAME.EQ("app{n}.example.com")',
+        'HTTP.REQ.URL.PATH.STARTSWITH("/svc{n}/")',
+        'HTTP.REQ.HOSTNAME.EQ("www.example.com") && HTTP.REQ.URL.STARTSWITH("/team{n}")',
+        '(HTTP.REQ.HOSTNAME.EQ("a{n}.example.com") || HTTP.REQ.HOSTNAME.EQ("b{n}.example.com")) && HTTP.REQ.URL.CONTAINS("/v")',
+        'HTTP.REQ.HOSTNAME.CONTAINS("zone{n}")',
+        "REQ.HTTP.URL == '/old{n}/*'",
+    ]
+    return [
+        {
+            'name': 'cs_bench',
+            'policyname': f"pol_{n}",
+            'priority': str(1000 - n) if n % 7 == 0 else str(1000 + n),
+            'rule': templates[n % len(templates)].format(n=n),
+            'targetlbvserver': f"lb_{n}",
+        }
+        for n in range(count)
+    ]
+
+
+def generate_urls(count, policies):
+    urls = []
+    for n in range(count):
+        target = (n * 7919) % max(policies, 1)
+        urls.append([
+            f"https://app{target}.example.com/",
+            f"https://www.example.com/svc{target}/items",
+            f"https://www.example.com/team{target}/page",
+            f"https://a{target}.example.com/v2/",
+            f"https://east.zone{target}.example.com/",
+            f"http://legacy.example.com/old{target}/index.html",
+            f"https://nomatch{n}.example.org/x",
+        ][n % 7])
+    return urls
+
+
+def linear_match(bindings, url, policy_match):
+    for binding in sorted(bindings, key=lambda binding: int(binding['priority'])):
+        if policy_match(url, binding['rule']):
+            return binding
+    return None
+
+
+def time_per_call(function, pairs, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for url, rule in pairs:
+            function(url, rule)
+    return (time.perf_counter() - start) / (rounds * len(pairs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=50, help='passes over every (url, rule) pair')
+    parser.add_argument('--policies', type=int, default=500, help='policies bound to the generated csvserver')
+    parser.add_argument('--urls', type=int, default=200, help='URLs resolved against the generated csvserver')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    collections_path()
+    from ansible_collections.cencora.itoa.plugins.module_utils import netscaler_policy
+
+    pairs = [(url, rule) for rule in RULE_CORPUS for url in URL_CORPUS]
+    mismatches = [
+        (url, rule) for url, rule in pairs
+        if legacy_policy_match(url, rule) != netscaler_policy.policy_match(url, rule)
+    ]
+    for url, rule in mismatches:
+        print(f"mismatch: {rule!r} on {url}", file=sys.stderr)
+
+    netscaler_policy.compile_rule.cache_clear()
+    start = time.perf_counter()
+    for rule in RULE_CORPUS:
+        netscaler_policy.compile_rule(rule)
+    compile_time = (time.perf_counter() - start) / len(RULE_CORPUS)
+    legacy = time_per_call(legacy_policy_match, pairs, args.rounds)
+    compiled = time_per_call(netscaler_policy.policy_match, pairs, args.rounds)
+
+    bindings = generate_bindings(args.policies)
+    urls = generate_urls(args.urls, args.policies)
+    start = time.perf_counter()
+    linear = [linear_match(bindings, url, netscaler_policy.policy_match) for url in urls]
+    linear_time = (time.perf_counter() - start) / len(urls)
+    start = time.perf_counter()
+    policy_index = netscaler_policy.PolicyIndex(bindings)
+    index_build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = [policy_index.match(url) for url in urls]
+    index_time = (time.perf_counter() - start) / len(urls)
+    index_mismatches = [url for url, expected, found in zip(urls, linear, indexed) if expected is not found]
+    for url in index_mismatches:
+        print(f"index mismatch: {url}", file=sys.stderr)
+
+    result = {
+        'pairs': len(pairs),
+        'matches': sum(netscaler_policy.policy_match(url, rule) for url, rule in pairs),
+        'mismatches': len(mismatches),
+        'compile_us': round(compile_time * 1e6, 2),
+        'legacy_us': round(legacy * 1e6, 2),
+        'compiled_us': round(compiled * 1e6, 2),
+        'speedup': round(legacy / compiled, 1),
+        'policies': len(bindings),
+        'urls': len(urls),
+        'index_mismatches': len(index_mismatches),
+        'index_build_ms': round(index_build_time * 1e3, 2),
+        'linear_us': round(linear_time * 1e6, 2),
+        'index_us': round(index_time * 1e6, 2),
+        'index_speedup': round(linear_time / index_time, 1),
+    }
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for name, value in result.items():
+            print(f"{name:>12} {value}")
+    return 1 if mismatches or index_mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Latency and round-trip benchmark for the secrets_safe lookup.
+
+Runs the lookup against the local BeyondTrust stand-in for every combination of term
+count and folder count, and reports wall time, HTTP requests per endpoint and peak
+Python memory. Each scenario starts from an empty process session cache.
+
+    python benchmarks/bench_secrets_safe.py --latency 0.15
+    python benchmarks/bench_secrets_safe.py --terms 100 --folders 1,10 --option bt_secret_search=false --json
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from bt_standin import BtStandIn
+from collection import load_lookup
+
+
+def parse_ints(value):
+    return [int(item) for item in value.split(',')]
+
+
+def parse_option(value):
+    name, _, option = value.partition('=')
+    try:
+        return name, json.loads(option)
+    except ValueError:
+        return name, option
+
+
+def run_scenario(lookup, module, args, terms_count, folders, options):
+    standin = BtStandIn(folders, args.folder_size, args.latency, args.file_size, args.depth,
+                        not args.no_secret_search).start()
+    try:
+        # spread terms over the folders, folder0/secret0, folder1/secret0, ...
+        terms = [f"folder{number % folders}/secret{number // folders}" for number in range(terms_count)]
+        module.signout_bt_sessions()
+        standin.reset_counts()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = lookup.run(terms, variables={}, bt_uri=standin.uri, bt_username='bench', bt_password='bench',
+                            bt_apikey='bench', **options)
+        wall_time = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if len(result[0]) != terms_count:
+            raise RuntimeError(f"expected {terms_count} secrets, lookup returned {len(result[0])}")
+        module.signout_bt_sessions()
+        return {
+            'terms': terms_count,
+            'folders': folders,
+            'wall_time': round(wall_time, 4),
+            'requests': sum(count for endpoint, count in standin.counts.items() if endpoint != 'SignOut'),
+            'endpoints': dict(sorted(standin.counts.items())),
+            'peak_memory': peak_memory,
+        }
+    finally:
+        standin.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--terms', type=parse_ints, default=[1, 10, 100], help='comma separated term counts')
+    parser.add_argument('--folders', type=parse_ints, default=[1, 5, 10], help='comma separated folder counts')
+    parser.add_argument('--folder-size', type=int, default=200, help='secrets per folder')
+    parser.add_argument('--depth', type=int, default=1, help='folder nesting depth')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every request')
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='bytes returned by file downloads')
+    parser.add_argument('--no-secret-search', action='store_true', help='stand-in answers filtered queries with 404')
+    parser.add_argument('--option', type=parse_option, action='append', default=[],
+                        help='extra lookup option, e.g. bt_max_workers=1 (repeatable)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+    lookup, _ = load_lookup('secrets_safe')
+    # sessions are kept by module_utils, they are signed out between scenarios
+    module = sys.modules['ansible_collections.cencora.itoa.plugins.module_utils.beyondtrust']
+    options = dict(args.option)
+    if not args.json:
+        print(f"{'terms':>6} {'folders':>8} {'wall s':>9} {'requests':>9} {'peak KiB':>9}  endpoints")
+    for folders in args.folders:
+        for terms_count in args.terms:
+            if terms_count > folders * args.folder_size:
+                continue
+            result = run_scenario(lookup, module, args, terms_count, folders, options)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                endpoints = ' '.join(f"{endpoint}={count}" for endpoint, count in result['endpoints'].items())
+                print(f"{result['terms']:>6} {result['folders']:>8} {result['wall_time']:>9.3f} "
+                      f"{result['requests']:>9} {result['peak_memory'] // 1024:>9}  {endpoints}")
+
+
+if __name__ == '__main__':
+    main()
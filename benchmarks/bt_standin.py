@@ -0,0 +1,220 @@
+"""Local stand-in for the BeyondTrust Password Safe API used by the secrets_safe lookup.
+
+Implements the endpoints BtApi calls (Auth/SignAppin, Auth/SignOut, Secrets-Safe/Folders,
+Secrets-Safe/Folders/{id}/secrets, Secrets-Safe/Secrets, Secrets-Safe/Secrets/{id} and
+Secrets-Safe/Secrets/{id}/file/download) with generated folders and secrets, a fixed
+per-request latency and per-endpoint request counters.
+
+Run it on its own to point a playbook at it:
+
+    python benchmarks/bt_standin.py --port 8080 --folders 3 --folder-size 200 --latency 0.15
+
+then use bt_uri=http://127.0.0.1:8080/ with any username, password and API key.
+Folders are named folder0, folder1, ... and hold secret0, secret1, ... rotating through
+Credential, Text and File secret types.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BASE_PATH = '/BeyondTrust/api/public/v3'
+SECRET_TYPES = ('Credential', 'Text', 'File')
+
+
+class BtStandIn:
+    """Generated BeyondTrust data served over HTTP from a background thread."""
+
+    def __init__(self, folders=1, folder_size=10, latency=0.0, file_size=1024, depth=1, secret_search=True):
+        self.latency = latency
+        self.file_size = file_size
+        self.secret_search = secret_search
+        self.lock = threading.Lock()
+        self.counts = dict()
+        self.sessions = set()
+        self.folders = []
+        self.folder_paths = dict()
+        self.folder_secrets = dict()
+        self.secrets = dict()
+        for folder_number in range(folders):
+            # with depth > 1 every folder sits under its own chain of team/level parents
+            parent_id = None
+            path = []
+            for level in range(depth - 1):
+                parent_id = self.add_folder(f"team{folder_number}" if level == 0 else f"level{level}", parent_id, path)
+            folder_id = self.add_folder(f"folder{folder_number}", parent_id, path)
+            for secret_number in range(folder_size):
+                self.add_secret(folder_id, f"secret{secret_number}", SECRET_TYPES[secret_number % len(SECRET_TYPES)])
+        self.server = None
+
+    def add_folder(self, name, parent_id, path):
+        folder_id = str(uuid.uuid4())
+        path.append(name)
+        self.folders.append({'Id': folder_id, 'Name': name, 'ParentId': parent_id, 'Description': ''})
+        self.folder_paths[folder_id] = '/'.join(path)
+        self.folder_secrets[folder_id] = []
+        return folder_id
+
+    def add_secret(self, folder_id, title, secret_type):
+        secret = {
+            'Id': str(uuid.uuid4()),
+            'Title': title,
+            'SecretType': secret_type,
+            'FolderId': folder_id,
+            'FolderPath': self.folder_paths[folder_id],
+            'Description': '',
+        }
+        self.folder_secrets[folder_id].append(secret)
+        self.secrets[secret['Id']] = dict(secret, Username=f"user_{title}", Password=f"password_{title}_{folder_id[:8]}")
+        return secret
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    @property
+    def request_count(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+
+    def file_content(self, secret_id):
+        return (secret_id.encode('utf-8') * (self.file_size // len(secret_id) + 1))[:self.file_size]
+
+    def start(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def uri(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def make_handler(standin):
+
+    class BtRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send(self, status, body=b'', content_type='application/json', headers=None):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def session_id(self):
+            for cookie in self.headers.get('Cookie', '').split(';'):
+                name, _, value = cookie.strip().partition('=')
+                if name == 'ASP.NET_SessionId' and value in standin.sessions:
+                    return value
+            return None
+
+        def do_POST(self):
+            time.sleep(standin.latency)
+            path = urlsplit(self.path).path[len(BASE_PATH):]
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if path == '/Auth/SignAppin':
+                standin.count('SignAppin')
+                if not self.headers.get('Authorization', '').startswith('PS-Auth key='):
+                    return self.send(401)
+                session_id = uuid.uuid4().hex
+                standin.sessions.add(session_id)
+                return self.send(200, {'UserId': 1, 'UserName': 'standin'},
+                                 headers={'Set-Cookie': f"ASP.NET_SessionId={session_id}; path=/"})
+            if path == '/Auth/SignOut':
+                standin.count('SignOut')
+                standin.sessions.discard(self.session_id())
+                return self.send(200)
+            standin.count('unknown')
+            self.send(404, {})
+
+        def do_GET(self):
+            time.sleep(standin.latency)
+            url = urlsplit(self.path)
+            parts = url.path[len(BASE_PATH):].strip('/').split('/')
+            if self.session_id() is None:
+                standin.count('unauthorized')
+                return self.send(401)
+            if parts == ['Secrets-Safe', 'Folders']:
+                standin.count('Folders')
+                return self.send(200, standin.folders)
+            if len(parts) == 4 and parts[:2] == ['Secrets-Safe', 'Folders'] and parts[3] == 'secrets':
+                standin.count('FolderSecrets')
+                if parts[2] not in standin.folder_secrets:
+                    return self.send(404, {})
+                return self.send(200, standin.folder_secrets[parts[2]])
+            if parts == ['Secrets-Safe', 'Secrets']:
+                standin.count('SecretSearch')
+                if not standin.secret_search:
+                    return self.send(404, {})
+                query = {name.lower(): values[0] for name, values in parse_qs(url.query).items()}
+                return self.send(200, [
+                    secret
+                    for folder_id, secrets in standin.folder_secrets.items()
+                    if 'path' not in query or standin.folder_paths[folder_id] == query['path']
+                    for secret in secrets
+                    if 'title' not in query or secret['Title'] == query['title']
+                ])
+            if len(parts) == 3 and parts[:2] == ['Secrets-Safe', 'Secrets']:
+                standin.count('Secret')
+                if parts[2] not in standin.secrets:
+                    return self.send(404, {})
+                return self.send(200, standin.secrets[parts[2]])
+            if len(parts) == 5 and parts[:2] == ['Secrets-Safe', 'Secrets'] and parts[3:] == ['file', 'download']:
+                standin.count('FileDownload')
+                if parts[2] not in standin.secrets:
+                    return self.send(404, {})
+                return self.send(200, standin.file_content(parts[2]), content_type='application/octet-stream')
+            standin.count('unknown')
+            self.send(404, {})
+
+    return BtRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--folders', type=int, default=3)
+    parser.add_argument('--folder-size', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=1, help='folder nesting depth')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--file-size', type=int, default=1024, help='bytes returned by file downloads')
+    parser.add_argument('--no-secret-search', action='store_true', help='answer filtered secret queries with 404')
+    args = parser.parse_args()
+    standin = BtStandIn(args.folders, args.folder_size, args.latency, args.file_size, args.depth,
+                        not args.no_secret_search).start(args.host, args.port)
+    print(f"BeyondTrust stand-in listening on {standin.uri}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(standin.counts, sort_keys=True))
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
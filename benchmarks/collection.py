@@ -0,0 +1,28 @@
+"""Load lookup plugins from this checkout without installing the collection."""
+import os
+import sys
+import tempfile
+
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import init_plugin_loader, lookup_loader
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_collections_path = None
+
+
+def collections_path():
+    global _collections_path
+    if _collections_path is None:
+        _collections_path = tempfile.mkdtemp(prefix='cencora_itoa_bench_')
+        namespace = os.path.join(_collections_path, 'ansible_collections', 'cencora')
+        os.makedirs(namespace)
+        os.symlink(REPO_ROOT, os.path.join(namespace, 'itoa'))
+        init_plugin_loader([_collections_path])
+    return _collections_path
+
+
+def load_lookup(name):
+    """Return (lookup plugin instance, plugin module) for cencora.itoa.<name>."""
+    collections_path()
+    lookup = lookup_loader.get(f"cencora.itoa.{name}", loader=DataLoader(), templar=None)
+    return lookup, sys.modules[type(lookup).__module__]
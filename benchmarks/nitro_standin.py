@@ -0,0 +1,499 @@
+"""Local stand-in for the NetScaler ADC and ADM NITRO API used by the netscaler lookups.
+
+Implements the /nitro/v1/config/ endpoints the lookups call: login and logout (answered the
+way ADM answers them on the adm host and the way an ADC does on the others), the ADM
+ns_csvserver and ns_lbvserver inventories, and the ADC lbvserver, csvserver, cspolicy,
+csvserver_cspolicy_binding, lbvserver_service_binding, lbvserver_servicegroup_binding,
+service, servicegroup, servicegroup_servicegroupmember_binding, server and nsconfig
+resources. Requests are answered for a generated topology of any size over HTTPS with a
+self-signed certificate, with a fixed per-request latency and per-resource request
+counters. filter, attrs, count, pagesize/pageno and bulkbindings queries behave like NITRO,
+binding collections are refused without bulkbindings=yes and responses are gzipped when
+the client asks for it.
+
+Every ADC and the ADM are served from the same port, the ADC is picked by the Host header.
+Run it on its own to point a playbook at it:
+
+    python benchmarks/nitro_standin.py --port 8443 --adcs 2 --vservers 5000 --members 50 --latency 0.02
+
+then resolve adm.example.net, adc0.example.net, adc1.example.net, ... to 127.0.0.1 (e.g. in
+/etc/hosts) and use username and password nsroot. The ADC vservers are named lb<adc>_<n> and
+cs<adc>_<n>, <vserver>.example.net stands for a hostname pointing at the vserver address.
+"""
+import argparse
+import base64
+import datetime
+import gzip
+import ipaddress
+import json
+import multiprocessing
+import os
+import ssl
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+API_PATH = '/nitro/v1/config/'
+CONTROL_PATH = '/standin/'
+# resource -> field a /<resource>/<name> request is matched on
+NAME_FIELDS = {
+    'ns_csvserver': 'name',
+    'ns_lbvserver': 'name',
+    'lbvserver': 'name',
+    'csvserver': 'name',
+    'cspolicy': 'policyname',
+    'csaction': 'name',
+    'service': 'name',
+    'server': 'name',
+    'servicegroup': 'servicegroupname',
+    'csvserver_cspolicy_binding': 'name',
+    'lbvserver_service_binding': 'name',
+    'lbvserver_servicegroup_binding': 'name',
+    'servicegroup_servicegroupmember_binding': 'servicegroupname',
+}
+FIRST_VIP = ipaddress.ip_address('172.16.0.1')
+FIRST_BACKEND = ipaddress.ip_address('10.0.0.1')
+
+
+def server_record(name, ip):
+    # the fields an ADC returns for a server
+    return {
+        'name': name, 'ipaddress': ip, 'ipv6address': 'NO', 'domain': '', 'state': 'ENABLED',
+        'td': '0', 'comment': '', 'translationip': '0.0.0.0', 'translationmask': '0.0.0.0',
+        'domainresolveretry': 5, 'domainresolvenow': False, 'querytype': 'A', 'ipv6address_': 'NO',
+        'statechangetimesec': 'Wed Sep 20 14:41:12 2023', 'tickssincelaststatechange': '187440408',
+        'autoscale': 'DISABLED', 'usip': 'NO', 'cka': 'NO', 'tcpb': 'NO', 'cmp': 'NO',
+    }
+
+
+def policy_rule(number, domain):
+    kind = number % 4
+    if kind == 0:
+        return f'HTTP.REQ.HOSTNAME.EQ("app{number}.{domain}")'
+    if kind == 1:
+        return f'HTTP.REQ.URL.PATH.STARTSWITH("/p{number}")'
+    if kind == 2:
+        return f'HTTP.REQ.HOSTNAME.EQ("site.{domain}") && HTTP.REQ.URL.STARTSWITH("/s{number}/")'
+    return f'(HTTP.REQ.HOSTNAME.CONTAINS("h{number}") || HTTP.REQ.URL.CONTAINS("/c{number}")) && HTTP.REQ.HOSTNAME.NE("x.{domain}")'
+
+
+class Topology:
+    """Generated configuration of adcs ADCs and the ADM inventory listing their vservers.
+
+    Every ADC has vservers HTTP lb vservers with members backend servers each, even members
+    bound as services and odd members through one servicegroup per lb vserver, and
+    cs_vservers SSL cs vservers with policies content switching policies each. Names and
+    addresses follow from the numbers, so they are known without building the topology.
+    """
+
+    def __init__(self, adcs=1, vservers=10, members=5, cs_vservers=2, policies=10, domain='example.net'):
+        self.adcs = adcs
+        self.vservers = vservers
+        self.members = members
+        self.cs_vservers = cs_vservers
+        self.policies = policies
+        self.domain = domain
+        self.last_change = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+    def adc_hostname(self, adc):
+        return f"adc{adc}.{self.domain}"
+
+    def lb_vserver(self, adc, number):
+        return f"lb{adc}_{number}", str(FIRST_VIP + adc * (self.vservers + self.cs_vservers) + number)
+
+    def cs_vserver(self, adc, number):
+        return f"cs{adc}_{number}", str(FIRST_VIP + adc * (self.vservers + self.cs_vservers) + self.vservers + number)
+
+    def dns(self):
+        """Hostname of every vserver, <vserver>.<domain>, mapped to its address."""
+        records = dict()
+        for adc in range(self.adcs):
+            for number in range(self.vservers):
+                name, vip = self.lb_vserver(adc, number)
+                records[f"{name}.{self.domain}"] = [vip]
+            for number in range(self.cs_vservers):
+                name, vip = self.cs_vserver(adc, number)
+                records[f"{name}.{self.domain}"] = [vip]
+        return records
+
+    def urls(self, count):
+        """count URLs spread over the cs vservers of all ADCs, every fifth one on an lb vserver."""
+        paths = ['/', '/p1/index.html', '/s2/cart', '/c3/item', '/static/app.js']
+        urls = []
+        for number in range(count):
+            adc = number % self.adcs
+            if number % 5 == 4 or not self.cs_vservers:
+                name = self.lb_vserver(adc, number // self.adcs % self.vservers)[0]
+                urls.append(f"http://{name}.{self.domain}/")
+            else:
+                name = self.cs_vserver(adc, number // self.adcs % self.cs_vservers)[0]
+                urls.append(f"https://{name}.{self.domain}{paths[number % len(paths)]}")
+        return urls
+
+    def build(self):
+        """Return ({adc hostname: {resource: records}}, {ns_csvserver: records, ns_lbvserver: records})."""
+        adcs = dict()
+        adm = {'ns_csvserver': [], 'ns_lbvserver': []}
+        backend_ip = FIRST_BACKEND
+        for adc in range(self.adcs):
+            short_name = f"adc{adc}"
+            collections = {name: [] for name in NAME_FIELDS if not name.startswith('ns_')}
+            adcs[self.adc_hostname(adc)] = collections
+            for number in range(self.vservers):
+                lb_name, vip = self.lb_vserver(adc, number)
+                collections['lbvserver'].append({'name': lb_name, 'servicetype': 'HTTP', 'ipv46': vip, 'port': 80, 'curstate': 'UP'})
+                adm['ns_lbvserver'].append({'name': lb_name, 'hostname': short_name, 'vsvr_ip_address': vip, 'vsvr_type': 'HTTP', 'vsvr_port': 80})
+                sg_name = f"sg_{lb_name}"
+                if self.members > 1:
+                    collections['servicegroup'].append({'servicegroupname': sg_name, 'servicetype': 'HTTP'})
+                    collections['lbvserver_servicegroup_binding'].append({'name': lb_name, 'servicename': sg_name, 'servicegroupname': sg_name})
+                for member in range(self.members):
+                    server_name = f"srv{adc}_{number}_{member}"
+                    server_ip = str(backend_ip)
+                    backend_ip += 1
+                    collections['server'].append(server_record(server_name, server_ip))
+                    if member % 2 == 0:
+                        service_name = f"svc_{server_name}"
+                        collections['service'].append({'name': service_name, 'servername': server_name, 'servicetype': 'HTTP', 'port': 8080, 'ipaddress': server_ip})
+                        collections['lbvserver_service_binding'].append({'name': lb_name, 'servicename': service_name, 'ipv46': server_ip, 'port': 8080})
+                    else:
+                        collections['servicegroup_servicegroupmember_binding'].append({'servicegroupname': sg_name, 'servername': server_name, 'ip': server_ip, 'port': 8080, 'svrstate': 'UP'})
+            for number in range(self.cs_vservers):
+                cs_name, vip = self.cs_vserver(adc, number)
+                collections['csvserver'].append({'name': cs_name, 'servicetype': 'SSL', 'ipv46': vip, 'port': 443, 'lbvserver': self.lb_vserver(adc, 0)[0]})
+                adm['ns_csvserver'].append({'name': cs_name, 'hostname': short_name, 'vsvr_ip_address': vip, 'vsvr_type': 'SSL', 'vsvr_port': 443})
+                for policy_number in range(self.policies):
+                    policy_name = f"pol_{cs_name}_{policy_number}"
+                    rule = policy_rule(policy_number, self.domain)
+                    collections['cspolicy'].append({'policyname': policy_name, 'rule': rule})
+                    binding = {
+                        'name': cs_name,
+                        'policyname': policy_name,
+                        'priority': str(100 + policy_number * 10),
+                        'targetlbvserver': self.lb_vserver(adc, (policy_number + 1) % self.vservers)[0],
+                        'gotopriorityexpression': 'END',
+                    }
+                    # some ADC versions leave the rule out of the binding, the lookups then read the cspolicy
+                    if policy_number % 5 != 4:
+                        binding['rule'] = rule
+                    collections['csvserver_cspolicy_binding'].append(binding)
+        return adcs, adm
+
+    def touch(self):
+        self.last_change += datetime.timedelta(minutes=1)
+
+
+def index_records(collections):
+    index = dict()
+    for resource, records in collections.items():
+        field = NAME_FIELDS[resource]
+        index[resource] = dict()
+        for record in records:
+            index[resource].setdefault(record.get(field), []).append(record)
+    return index
+
+
+class NitroStandIn:
+    """Generated ADC and ADM data served over HTTPS from a background thread."""
+
+    def __init__(self, topology, latency=0.0, username='nsroot', password='nsroot'):
+        self.topology = topology
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.counts = dict()
+        self.connections = 0
+        self.tokens = set()
+        self.adcs, self.adm = topology.build()
+        self.indexes = {hostname: index_records(collections) for hostname, collections in self.adcs.items()}
+        self.indexes['adm'] = index_records(self.adm)
+        self.server = None
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @property
+    def request_count(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+            self.connections = 0
+
+    def start(self, host='127.0.0.1', port=0):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*make_certificate(tempfile.mkdtemp(prefix='nitro_standin_')))
+        standin = self
+
+        class NitroServer(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def get_request(self):
+                sock, address = super().get_request()
+                return context.wrap_socket(sock, server_side=True), address
+
+        self.server = NitroServer((host, port), make_handler(self))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+
+def make_certificate(directory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'nitro-standin')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=30)).sign(key, hashes.SHA256()))
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    with open(certfile, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+def make_handler(standin):
+
+    class NitroRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            self.counted = False
+
+        def count_connection(self):
+            # connections are counted on their first NITRO request, control requests are left out
+            if not self.counted:
+                self.counted = True
+                with standin.lock:
+                    standin.connections += 1
+
+        def send(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if 'gzip' in self.headers.get('Accept-Encoding', '') and len(data) > 512:
+                data = gzip.compress(data, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def not_found(self, message='No such resource'):
+            self.send(404, {'errorcode': 258, 'message': message, 'severity': 'ERROR'})
+
+        def authorized(self):
+            header = self.headers.get('Authorization', '')
+            if header.startswith('Basic '):
+                username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+                return username == standin.username and password == standin.password
+            for cookie in self.headers.get('Cookie', '').split(';'):
+                name, _, value = cookie.strip().partition('=')
+                if name in ('NITRO_AUTH_TOKEN', 'SESSID') and value in standin.tokens:
+                    return True
+            return False
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def do_POST(self):
+            body = self.read_body()
+            path = urlsplit(self.path).path
+            if path == CONTROL_PATH + 'reset':
+                standin.reset_counts()
+                return self.send(200, {})
+            if path == CONTROL_PATH + 'touch':
+                standin.topology.touch()
+                return self.send(200, {})
+            self.count_connection()
+            time.sleep(standin.latency)
+            if path == API_PATH + 'login':
+                standin.count('login')
+                try:
+                    login = json.loads(body)['login']
+                except (ValueError, KeyError):
+                    return self.send(400, {'errorcode': 1, 'message': 'Invalid request', 'severity': 'ERROR'})
+                if login.get('username') != standin.username or login.get('password') != standin.password:
+                    return self.send(401, {'errorcode': 354, 'message': 'Invalid username or password', 'severity': 'ERROR'})
+                token = uuid.uuid4().hex
+                standin.tokens.add(token)
+                if self.headers.get('Host', '').lower().startswith('adm.'):
+                    # ADM names the session inside the login record and sets SESSID
+                    return self.send(200, {'errorcode': 0, 'message': 'Done', 'severity': 'NONE',
+                                           'login': [{'sessionid': token, 'username': login['username']}]},
+                                     headers={'Set-Cookie': f"SESSID={token}; path=/"})
+                return self.send(201, {'errorcode': 0, 'message': 'Done', 'sessionid': token},
+                                 headers={'Set-Cookie': f"NITRO_AUTH_TOKEN={token}; path=/nitro/v1"})
+            if path == API_PATH + 'logout':
+                standin.count('logout')
+                return self.send(201, {'errorcode': 0, 'message': 'Done'})
+            self.not_found()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == CONTROL_PATH + 'counts':
+                with standin.lock:
+                    return self.send(200, {'counts': standin.counts, 'connections': standin.connections})
+            self.count_connection()
+            time.sleep(standin.latency)
+            if not url.path.startswith(API_PATH):
+                return self.not_found()
+            if not self.authorized():
+                standin.count('unauthorized')
+                return self.send(401, {'errorcode': 354, 'message': 'Invalid username or password', 'severity': 'ERROR'})
+            parts = [unquote(part) for part in url.path[len(API_PATH):].split('/')]
+            resource = parts[0]
+            name = parts[1] if len(parts) > 1 else None
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            # collection listings are counted as <resource>/, single objects as <resource>
+            standin.count(f"{resource}/" if name is None else resource)
+            if resource == 'nsconfig':
+                nsconfig = {'lastconfigchangedtime': standin.topology.last_change.strftime('%a %b %d %H:%M:%S %Y'), 'configchanged': True}
+                return self.send(200, {'errorcode': 0, 'message': 'Done', 'severity': 'NONE', 'nsconfig': nsconfig})
+            if resource.startswith('ns_'):
+                collections, index = standin.adm, standin.indexes['adm']
+            else:
+                host = self.headers.get('Host', '').split(':')[0].lower()
+                collections, index = standin.adcs.get(host, {}), standin.indexes.get(host, {})
+            if resource not in collections:
+                return self.not_found()
+            if name is not None:
+                records = index[resource].get(name, [])
+                if not records and not resource.endswith('_binding'):
+                    return self.not_found(f"No such resource [{NAME_FIELDS[resource]}, {name}]")
+            elif resource.endswith('_binding') and query.get('bulkbindings') != 'yes':
+                return self.send(400, {'errorcode': 1092, 'message': 'Argument pre-requisite missing [name, bulkbindings]', 'severity': 'ERROR'})
+            else:
+                records = collections[resource]
+            if 'filter' in query:
+                for condition in query['filter'].split(','):
+                    field, _, value = condition.partition(':')
+                    records = [record for record in records if str(record.get(field)) == value]
+            if query.get('count') == 'yes':
+                return self.send(200, {'errorcode': 0, 'message': 'Done', 'severity': 'NONE', resource: [{'__count': len(records)}]})
+            if 'pagesize' in query:
+                size = int(query['pagesize'])
+                page = int(query.get('pageno', 1))
+                records = records[(page - 1) * size:page * size]
+            if 'attrs' in query:
+                attrs = query['attrs'].split(',')
+                records = [{field: record[field] for field in attrs if field in record} for record in records]
+            body = {'errorcode': 0, 'message': 'Done', 'severity': 'NONE'}
+            # NITRO leaves an empty collection out of the response
+            if records:
+                body[resource] = records
+            self.send(200, body)
+
+    return NitroRequestHandler
+
+
+def serve(topology, latency, connection):
+    standin = NitroStandIn(topology, latency).start()
+    connection.send(standin.port)
+    connection.recv()
+    standin.stop()
+
+
+class StandInProcess:
+    """NitroStandIn run in a child process, so neither its memory nor its CPU time counts against the lookups."""
+
+    def __init__(self, topology, latency=0.0):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(topology, latency, child_connection), daemon=True)
+        self.process.start()
+        self.port = self.connection.recv()
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+
+    def control(self, action, method='GET'):
+        request = urllib.request.Request(f"https://127.0.0.1:{self.port}{CONTROL_PATH}{action}", method=method, data=b'' if method == 'POST' else None)
+        with urllib.request.urlopen(request, context=self.context) as response:
+            return json.load(response)
+
+    def counts(self):
+        """Return (requests per resource, connections) since the last reset."""
+        state = self.control('counts')
+        return state['counts'], state['connections']
+
+    def reset_counts(self):
+        self.control('reset', 'POST')
+
+    def touch(self):
+        self.control('touch', 'POST')
+
+    def stop(self):
+        self.connection.send(None)
+        self.process.join(10)
+
+
+def redirect_connections(port, host='127.0.0.1'):
+    """Send every connection urllib3 makes in this process to the stand-in, whatever host it is for.
+
+    TLS and the Host header still carry the requested hostname, so the ADC is picked the same way.
+    """
+    import urllib3.connection
+    import urllib3.util.connection
+    create_connection = urllib3.util.connection.create_connection
+
+    def standin_connection(address, *args, **kwargs):
+        return create_connection((host, port), *args, **kwargs)
+
+    urllib3.util.connection.create_connection = standin_connection
+    urllib3.connection.connection.create_connection = standin_connection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--adcs', type=int, default=2)
+    parser.add_argument('--vservers', type=int, default=100, help='lb vservers per ADC')
+    parser.add_argument('--members', type=int, default=10, help='backend servers per lb vserver')
+    parser.add_argument('--cs-vservers', type=int, default=10, help='cs vservers per ADC')
+    parser.add_argument('--policies', type=int, default=20, help='policies per cs vserver')
+    parser.add_argument('--domain', default='example.net')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    args = parser.parse_args()
+    topology = Topology(args.adcs, args.vservers, args.members, args.cs_vservers, args.policies, args.domain)
+    standin = NitroStandIn(topology, args.latency).start(args.host, args.port)
+    print(f"NITRO stand-in listening on https://{args.host}:{standin.port}/ for adm.{args.domain} and "
+          + ', '.join(topology.adc_hostname(adc) for adc in range(args.adcs)))
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(standin.counts, sort_keys=True))
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+class ModuleDocFragment(object):
+    # Options of every netscaler lookup, each lookup adds its own ini section to them
+    DOCUMENTATION = r'''
+options:
+    pool_size:
+      description:
+        - Maximum number of keep-alive connections kept open to each ADC and ADM host.
+      default: 10
+      type: int
+    nitro_login:
+      description:
+        - Log in to each ADC and ADM host once and authenticate further requests with the NITRO session token.
+        - Basic authentication is sent on every request when disabled or when the login is refused.
+      default: true
+      type: bool
+    session_ttl:
+      description:
+        - Seconds an idle connection and NITRO session to an ADC or ADM host are kept for reuse by later lookups in the same process.
+        - Sessions still open are logged out when the process exits.
+        - Ansible runs the lookups of every task in a new forked worker process, so a session is only reused by lookups
+          of the same task (for example loop items), every task still logs in once.
+      default: 300
+      type: int
+    cache:
+      description:
+        - Keep snapshots of the NITRO collections of ADM and the ADCs on disk and answer lookups from them.
+        - C(on) reads and updates the snapshots, C(refresh) replaces them with fresh ones, C(off) queries the appliances every time.
+        - Collections are listed in full the first time a snapshot needs them.
+          Snapshots are shared with the other netscaler lookups using the same C(cache_dir).
+      default: 'off'
+      type: str
+      choices:
+        - 'off'
+        - 'on'
+        - 'refresh'
+    cache_dir:
+      description:
+        - Directory the snapshots are kept in, created with mode 0700 when missing.
+      default: '~/.cache/cencora_itoa/netscaler'
+      type: path
+    cache_ttl:
+      description:
+        - Seconds a snapshot is used without asking the appliance whether its configuration changed.
+        - After that an ADC snapshot is kept for another C(cache_ttl) seconds when the last configuration change time
+          of the ADC did not change and replaced otherwise, an ADM inventory snapshot is always replaced.
+      default: 600
+      type: int
+    page_size:
+      description:
+        - Records requested per NITRO call whenever a whole collection or inventory is listed, e.g. with C(bulk) or C(cache).
+        - C(0) lists each collection in a single call.
+      default: 0
+      type: int
+'''
+
+    # Options of the lookups that query ADCs
+    ADC = r'''
+options:
+    max_workers:
+      description:
+        - Maximum number of NITRO requests made in parallel, over all ADCs, while listing collections or following
+          bindings, services, servicegroup members and servers. Set to 1 to make them one after another.
+        - Connection pools are grown to at least this size.
+      default: 4
+      type: int
+    config_source:
+      description:
+        - Read the configuration of the ADC from a saved copy instead of the NITRO API.
+        - Either an C(ns.conf) file or a C(.json) file of NITRO collections (saved NITRO responses merged into one object,
+          or a snapshot written by C(cache)), or a directory holding one such file per ADC named C(<adc_hostname>.conf)
+          or C(<adc_hostname>.json), with or without the domain.
+        - Only C(add)/C(bind) commands of lb and cs vservers, cs policies and actions, services, servicegroups and servers
+          are read from C(ns.conf), so server records carry their name, address and configured state but none of
+          the runtime fields the API returns.
+        - The options that query or cache the NITRO API, such as C(bulk), C(cache), C(index_ttl) and the connection options, are ignored.
+      type: path
+'''
+
+    # Options of the lookups that return server records
+    FIELDS = r'''
+options:
+    fields:
+      description:
+        - Fields of the server records to return, e.g. C([name, ipaddress, state]). Every field when not set.
+        - C(name) is always returned. Only these fields are requested from the ADC, except with C(cache) where snapshots keep whole records.
+      type: list
+      elements: str
+'''
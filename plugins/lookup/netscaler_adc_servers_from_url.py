@@ -14,6 +14,10 @@ DOCUMENTATION = r"""
       - To install it, use C(ansible-galaxy collection install git+https://github.com/abcorp-itops/automation-awx_plugins-itoa.git).
       - You'll also want to create C(collections/requirements.yml) in your AWX playbook that 
         contains this content
+  extends_documentation_fragment:
+    - cencora.itoa.nitro
+    - cencora.itoa.nitro.adc
+    - cencora.itoa.nitro.fields
   options:
     _terms:
       description: url in form of https://my.url.com
@@ -29,7 +33,7 @@ DOCUMENTATION = r"""
       description:
         - Name of user for connection to ADM.
         - If the value is not specified, the value of environment variable C(ADM_USERNAME) will be used instead.
-      required: true
+        - Not needed with C(config_source).
       type: str
       env:
         - name: ADM_USERNAME
@@ -37,7 +41,7 @@ DOCUMENTATION = r"""
       description:
         - Password for user.
         - If the value is not specified, the value of environment variable C(ADM_PASSWORD) will be used instead.
-      required: true
+        - Not needed with C(config_source).
       type: str
       env:
         - name: ADM_PASSWORD
@@ -50,6 +54,98 @@ DOCUMENTATION = r"""
       ini:
         - section: netscaler_adc_servers_from_url
           key: external_dns
+    dns_workers:
+      description:
+        - Number of hostnames resolved at the same time before the terms are looked up, when there is more than one term.
+        - Answers are cached in the process for their TTL, names that do not exist for their negative TTL.
+      default: 16
+      type: int
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: dns_workers
+    dns_timeout:
+      description:
+        - Seconds all hostnames of the terms may take to resolve together.
+          Terms whose hostname is not resolved by then get no IP addresses, vservers or servers.
+      default: 30
+      type: float
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: dns_timeout
+    bulk:
+      description:
+        - Fetch the service binding, service, servicegroup member and server collections of an ADC once
+          and join them locally instead of requesting every binding, service and server separately.
+        - The number of NITRO calls no longer grows with the number of vserver members, but every
+          collection is listed in full, which only pays off on vservers with more than a few members.
+      default: false
+      type: bool
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: bulk
+    fields:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: fields
+    page_size:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: page_size
+    max_workers:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: max_workers
+    adc_timeout:
+      description:
+        - Seconds the ADCs behind the addresses of a URL have to return its backend servers. The ADCs are queried in parallel.
+        - An ADC that does not answer in time is reported in C(adc_timing) and not queried again by this lookup,
+          the servers of the other ADCs are still returned. C(0) waits for as long as it takes.
+        - It is also the read timeout of every NITRO request, an ADC that stops answering does not keep the task running,
+          and the requests left to an ADC that timed out are not sent.
+        - Failing ADCs are reported the same way, the lookup only fails when every ADC of a URL does.
+      default: 120
+      type: float
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: adc_timeout
+    pool_size:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: pool_size
+    nitro_login:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: nitro_login
+    session_ttl:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: session_ttl
+    cache:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: cache
+    cache_dir:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: cache_dir
+    cache_ttl:
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: cache_ttl
+    config_source:
+      description:
+        - Resolve URLs from saved configurations of the ADCs instead of ADM and the NITRO API.
+        - A directory holding one C(ns.conf) or C(.json) file of NITRO collections (saved NITRO responses merged into
+          one object, or a snapshot written by C(cache)) per ADC, named C(<adc_hostname>.conf) or C(<adc_hostname>.json),
+          with or without the domain. The vserver addresses in these files stand in for the ADM inventory.
+        - Only C(add)/C(bind) commands of lb and cs vservers, cs policies and actions, services, servicegroups and
+          servers are read from C(ns.conf), so the server records returned carry their name, address and configured
+          state but none of the runtime fields the API returns.
+        - Hostnames are still resolved through DNS. C(bulk), C(cache) and the connection options are ignored.
+      type: path
+      ini:
+        - section: netscaler_adc_servers_from_url
+          key: config_source
 """
 
 EXAMPLES = r"""
@@ -75,221 +171,194 @@ collections:
 
 RETURN = r"""
 returned_value:
-  description: List of server dictionaries
+  description:
+    - Dictionary for every url with the addresses its hostname resolves to, the vservers of those addresses and their backend servers.
+    - C(adc_timing) has the seconds every ADC took to resolve its vservers and the error, if any, it failed with.
   returned: always
   type: list
   elements: dict
   sample:
-    - servicegroupname: "www.amerisourcebergen.com_default_sg"
-      ip: "20.0.0.0"
-      port: 8080
-      svrstate: "UP"
-      statechangetimesec: "Wed Sep 20 14:41:12 2023"
-      tickssincelaststatechange: "187440408"
-      weight: "1"
-      servername: "20.0.0.0"
-      customserverid: "None"
-      serverid: "0"
-      state: "ENABLED"
-      hashid: "0"
-      graceful: "NO"
-      delay: "0"
-      delay1: "0"
-      nameserver: "0.0.0.0"
-      dbsttl: "0"
-      orderstr: "Default"
-      trofsdelay: "0"
+    - ip_address_list:
+        - ip_address: "10.0.0.10"
+          owner: "www.amerisourcebergen.com."
+      vserver_list:
+        - name: "www.amerisourcebergen.com-443_cs"
+          type: "cs"
+          load_balancer: "LADC-PFE02.myabcit.net"
+          ip_address: "10.0.0.10"
+      server_list:
+        - servicegroupname: "www.amerisourcebergen.com_default_sg"
+          ip: "20.0.0.0"
+          port: 8080
+          svrstate: "UP"
+          statechangetimesec: "Wed Sep 20 14:41:12 2023"
+          tickssincelaststatechange: "187440408"
+          weight: "1"
+          servername: "20.0.0.0"
+          customserverid: "None"
+          serverid: "0"
+          state: "ENABLED"
+          hashid: "0"
+          graceful: "NO"
+          delay: "0"
+          delay1: "0"
+          nameserver: "0.0.0.0"
+          dbsttl: "0"
+          orderstr: "Default"
+          trofsdelay: "0"
+      adc_timing:
+        - load_balancer: "LADC-PFE02.myabcit.net"
+          seconds: 0.412
+          error: null
 """
 
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-import requests
-from requests.auth import HTTPBasicAuth
+import time
 import urllib.parse
-from dns import resolver
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait
+from ansible_collections.cencora.itoa.plugins.module_utils.dns_cache import resolve_all, resolve_ip
+from ansible_collections.cencora.itoa.plugins.module_utils.nitro import DEFAULT_TIMEOUT, NitroClient, field_attrs, nitro_auth, project
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_policy import PolicyIndex, split_url
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import BACKEND_RESOURCES, RESOURCE_ATTRS
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_snapshot import adc_topology, adm_inventory, first_record
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_config import ConfigSource
 
 display = Display()
 
-api_path = '/nitro/v1/config/'
-adm_lbvservers_endpoint = api_path + 'ns_lbvserver'
-adm_csvservers_endpoint = api_path + 'ns_csvserver'
-adc_lbvserver_endpoint = api_path+ 'lbvserver'
-adc_csvserver_endpoint = api_path + 'csvserver'
-adc_csvserver_cspolicy_binding_endpoint = api_path + 'csvserver_cspolicy_binding'
-adc_lbvserver_service_binding_endpoint = api_path + 'lbvserver_service_binding'
-adc_lbvserver_servicegroup_binding_endpoint = api_path+ 'lbvserver_servicegroup_binding'
-adc_cspolicy_endpoint = api_path + 'cspolicy'
-adc_service_endpoint = api_path + 'service'
-adc_servicegroup_servicegroupmember_binding_endpoint = api_path + 'servicegroup_servicegroupmember_binding'
-adc_server_endpoint = api_path + 'server'
+def url_hostname(url):
+    return url.replace('https://','').replace('http://','').split("/")[0]
 
-def resolve_ip(hostname, nameserver=''):
-    ret = []
-    owner = ''
-    res = resolver.Resolver()
-    if nameserver:
-        display.v(f"Trying to resolve {hostname} using: {nameserver} dns server")
-        res.nameservers = [nameserver]
-    else:
-        display.v(f"Trying to resolve {hostname} using: default dns server")
+def timed(job):
+    start = time.perf_counter()
     try:
-        answer = res.query(hostname)
-        owner = answer.canonical_name.to_text()
-        ips = [ip.to_text() for ip in answer]
-        display.v(f"Hostname {hostname} resolved to: {','.join(ips)}")
-        ret = ips
+        return job(), None, time.perf_counter() - start
     except Exception as e:
-        display.v(f"Error resolving {hostname}: {e}")
-        if nameserver:
-            ret, owner = resolve_ip(hostname)
-    return ret, owner
-
-def api_call(url, auth):
-    display.vv(f"Fetching info from {url}")
-    response = requests.get(url, auth=auth, verify=False)
-    display.vvv(f"Response status code {str(response.status_code)}")
-    if response.status_code != 200:
-        raise AnsibleError(f"http error : {response.status_code}: {response.text}")
-    return response.json()
+        return None, e, time.perf_counter() - start
 
-open_list = ['(']
-close_list = [')']
-operator_list = ['|','&']
+def query_adcs(jobs, timeout, parallel=True):
+    """Run every job, keyed by ADC hostname, return ({ADC hostname: (result, exception, seconds)}, timed out ADC hostnames).
 
-def convert_to_advanced_expression(rule):
-    return rule.replace("req.http.url == '",'http.req.url.startswith("').replace("*'",'")')
-
-def eval_advanced_expression(rule, hostname, path):
-    rule = rule.replace(']','')
-    rule_split = rule.split('[')
-    first_part_split = rule_split[0].split('.')[2:]
-    eval_var = rule_split[1]
-    element = first_part_split[0]
-    test = first_part_split[1]
-    ret = False
-    display.vvv(f'Test: {element} {test} {eval_var}')
-    if element == 'hostname':
-        if test == 'eq':
-            ret = bool(hostname == eval_var)
-        elif test == 'ne':
-            ret = bool(hostname != eval_var)
-        elif test == 'contains':
-            ret = bool(eval_var in hostname)
-        else:
-            display.v(f"Test not supported: {test}.")
-    else:
-        if test == 'startswith':
-            ret = bool(path.startswith(eval_var))
-        elif test == 'contains':
-            ret = bool(eval_var in path)
+    In parallel every ADC gets its own thread, those still running after timeout seconds are left
+    behind and get an AnsibleError. The caller stops what they still do, see NitroClient.abandon.
+    """
+    if not parallel:
+        return {load_balancer: timed(job) for load_balancer, job in jobs.items()}, []
+    executor = ThreadPoolExecutor(max_workers=len(jobs))
+    start = time.perf_counter()
+    futures = {executor.submit(timed, job): load_balancer for load_balancer, job in jobs.items()}
+    done, not_done = wait(futures, timeout=timeout or None)
+    # a NITRO request in flight can not be interrupted, it ends with its own timeout
+    executor.shutdown(wait=False)
+    outcomes = dict()
+    for future, load_balancer in futures.items():
+        if future in done:
+            outcomes[load_balancer] = future.result()
         else:
-            display.v(f"Test not supported: {test}.")
-    return ret
-
-def eval_compound_advanced_expression(rule, hostname, path):
-    display.vvv(f'Expression: "{rule}"')
-    expression =  ''
-    previous_char = ''
-    previous_test = False
-    operator = 'or'
-    open_count = 0
-    result = False
-    for i in rule:
-        if i in open_list:
-            display.vvvv(f'Opening parenthesis found.')
-            open_count+=1
-            if expression:
-                expression += i
-        elif i in close_list:
-            display.vvvv(f'Closing parenthesis found.')
-            open_count-=1
-            if open_count == 0:
-                display.vvvv(f'Top most closing parenthesis found. Expression: "{expression}"')
-                if operator == 'or':
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    result = bool(previous_test or recursive_result)
-                else:
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    result = bool(previous_test and recursive_result)
-                previous_test = result
-                expression =  ''
-            else:
-                expression += i
-        elif i in operator_list and previous_char == i and open_count == 0:
-            display.vvvv(f'Full operator found "{i}{i}"')
-            if i == '|':
-                operator = 'or'
-            else:
-                operator = 'and'
-        elif i in operator_list and open_count == 0:
-            display.vvvv(f'Operator found "{i}"')
-            if expression:
-                display.vvvv(f'Completing expression: "{expression}"')
-                if operator == 'or':
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    display.vvvv(f'Recursive result: {recursive_result}')
-                    result = bool(previous_test or recursive_result)
-                else:
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    display.vvvv(f'Recursive result: {recursive_result}')
-                    result = bool(previous_test and recursive_result)
-                previous_test = result
-                expression =  ''
-        else:
-            expression += i
-        previous_char = i
-    if expression:
-        display.vvvv(f'Completing expression: "{expression}". Operator: "{operator}"')
-        if operator == 'or':
-            result = bool(previous_test or eval_advanced_expression(expression, hostname, path))
-        else:
-            result = bool(previous_test and eval_advanced_expression(expression, hostname, path))
-        previous_test = result
-        expression =  ''
-    display.vvvv(f'Returning result: {result}')
-    return result
-
-def policy_match(url, rule):
-    url = url.lower()
-    rule = rule.lower()
-    url_split = url.replace('https://','').replace('http://','').split("/")
-    hostname = url_split[0]
-    if len(url_split) > 1 and url_split[-1]:
-        path = '/' + '/'.join(url_split[1:])
-    else:
-        path = ''
-    display.vvv(f"Url: '{url}'")
-    display.vvv(f"Hostname: '{hostname}'")
-    display.vvv(f"Path: '{path}'")
-    display.vvv(f"Policy rule: '{rule}'")
-    if 'req.http' in rule: # classic policy expression
-        display.vvv(f"Classic policy expression: {rule} detected. Converting to advanced.")
-        rule = convert_to_advanced_expression(rule)
-    rule = rule.replace('("','[') # replacing parenthesis with brackets for better code control
-    rule = rule.replace('")',']') # replacing parenthesis with brackets for better code control
-    rule = rule.replace(' ','') # removing spaces
-    rule = rule.replace('url.path','url') # there are url.path and url clauses so replacing url.path with url
-    rule = rule.replace('get(1).','') # there are some rules that have fuction get(1) this is removed
-    rule = rule.replace('set_text_mode(ignorecase).','') # remove set_text_mode(ignorecase) since lower is used
-    display.vvv(f"Final optimized rule: '{rule}'")
-    try:
-        result = eval_compound_advanced_expression(rule, hostname, path)
-        display.vvv(f"Expression evaluated to {result}")
-    except Exception as e:
-         display.vvv(f"Error evaluating policy expression {rule}. Error: {e}. Setting result to false.")
-         result = False
-    return result
+            outcomes[load_balancer] = (None, AnsibleError(f"{load_balancer} did not answer within {timeout} seconds"), time.perf_counter() - start)
+    return outcomes, [futures[future] for future in not_done]
 
 class LookupModule(LookupBase):
     def run(self, terms, variables=None, **kwargs):
         self.set_options(var_options=variables, direct=kwargs)
-        adm_hostname = 'https://' + self.get_option('adm_hostname')
+        adm_hostname = self.get_option('adm_hostname')
         adc_domain = '.'.join(self.get_option('adm_hostname').split('.')[-2:])
         username = self.get_option('username')
         password = self.get_option('password')
         external_dns = self.get_option('external_dns')
-        auth = HTTPBasicAuth(username, password)
+        dns_workers = self.get_option('dns_workers')
+        dns_timeout = self.get_option('dns_timeout')
+        bulk = self.get_option('bulk')
+        max_workers = self.get_option('max_workers')
+        adc_timeout = self.get_option('adc_timeout')
+        cache = self.get_option('cache')
+        cache_dir = self.get_option('cache_dir')
+        cache_ttl = self.get_option('cache_ttl')
+        page_size = self.get_option('page_size')
+        server_attrs = field_attrs(self.get_option('fields'))
+        config_source = self.get_option('config_source')
+        if config_source:
+            source = ConfigSource(config_source)
+            adm = source.inventory(adc_domain)
+        else:
+            if not username or not password:
+                raise AnsibleError("username and password are required unless config_source is set")
+            auth = nitro_auth(
+                self.get_option,
+                max_workers,
+                # no request outlasts adc_timeout, the threads query_adcs leaves behind end with it
+                timeout=(min(DEFAULT_TIMEOUT[0], adc_timeout), adc_timeout) if adc_timeout > 0 else DEFAULT_TIMEOUT
+            )
+            adm = adm_inventory(NitroClient(adm_hostname, auth), cache, cache_dir, cache_ttl, page_size=page_size)
+        clients = dict()
+        topologies = dict()
+        policy_indexes = dict()
+        targets = dict()
+        backends = dict()
+        resolved = dict()
+        # ADCs that timed out, not queried again by this lookup
+        unavailable = dict()
+
+        def resolve_vserver(url, vserver):
+            """Backend servers of a vserver the url leads to."""
+            if vserver['load_balancer'] not in topologies:
+                if config_source:
+                    topologies[vserver['load_balancer']] = source.topology(vserver['load_balancer'])
+                else:
+                    topologies[vserver['load_balancer']] = adc_topology(
+                        clients.setdefault(vserver['load_balancer'], NitroClient(vserver['load_balancer'], auth)),
+                        cache,
+                        cache_dir,
+                        cache_ttl,
+                        dict(RESOURCE_ATTRS, server=server_attrs),
+                        BACKEND_RESOURCES if bulk else (),
+                        page_size
+                    )
+            topology = topologies[vserver['load_balancer']]
+            # addresses of a hostname often lead to the same vserver and many URLs share a hostname,
+            # targets and backend servers are resolved once per run
+            target_key = (vserver['load_balancer'], vserver['type'], vserver['name'])
+            if vserver['type'] == 'cs':
+                target_key += split_url(url)
+            target_lbvserver = targets.get(target_key)
+            if target_lbvserver is None:
+                if vserver['type'] == 'lb':
+                    lb_vserver = first_record(topology, 'lbvserver', vserver['name'], vserver['load_balancer'])
+                    target_lbvserver = lb_vserver['name']
+                else:
+                    cs_vserver = first_record(topology, 'csvserver', vserver['name'], vserver['load_balancer'])
+                    target_lbvserver = cs_vserver['lbvserver']
+                    # URLs behind the same csvserver share one index of its policies
+                    policy_index = policy_indexes.get((vserver['load_balancer'], vserver['name']))
+                    if policy_index is None:
+                        csvserver_policies = topology.fetch('csvserver_cspolicy_binding', vserver['name'])
+                        policy_index = PolicyIndex(csvserver_policies, topology.policy_rule)
+                        policy_indexes[vserver['load_balancer'], vserver['name']] = policy_index
+                    policy = policy_index.match(url)
+                    # advanced policies name no lb vserver in the binding, it is the target of their cs action
+                    policy_target = topology.policy_target(policy) if policy else None
+                    if policy_target:
+                        target_lbvserver = policy_target
+                        display.vv(f"Found matching policy {policy['policyname']}. Target loadbalancer {target_lbvserver}")
+                targets[target_key] = target_lbvserver
+            if (vserver['load_balancer'], target_lbvserver) not in backends:
+                # an offline topology is already in memory, threads would only slow the walk down
+                with ThreadPoolExecutor(max_workers=max_workers) if not config_source else nullcontext() as executor:
+                    backends[vserver['load_balancer'], target_lbvserver] = project(topology.servers(target_lbvserver, executor), server_attrs)
+            else:
+                display.vvv(f"Backend servers of {target_lbvserver} on {vserver['load_balancer']} already resolved")
+            return backends[vserver['load_balancer'], target_lbvserver]
+
+        if len(terms) > 1:
+            # resolve every hostname up front, concurrently, instead of one term after the other
+            resolved = resolve_all(
+                [url_hostname(term.lower()) for term in terms if isinstance(term, str) and term.lower().startswith(('https://', 'http://'))],
+                external_dns,
+                max_workers=dns_workers,
+                timeout=dns_timeout
+            )
         ret = []
         for term in terms:
             display.v("netscaler_adc_servers_from_url lookup term: %s" % term)
@@ -304,57 +373,54 @@ class LookupModule(LookupBase):
                     protocol = 'HTTP'
                 else:
                     raise AnsibleError(f"URL should start with 'http://' or 'https://'")
-                hostname = url.replace('https://','').replace('http://','').split("/")[0]
-                ip_addresses, owner = resolve_ip(hostname, external_dns)
+                hostname = url_hostname(url)
+                if len(terms) > 1:
+                    ip_addresses, owner = resolved.get(hostname, ([], ''))
+                else:
+                    ip_addresses, owner = resolve_ip(hostname, external_dns)
                 for ip_address in ip_addresses:
                     ip_address_list.append({'ip_address': ip_address, 'owner': owner})
-                    cs_vservers = api_call(adm_hostname + adm_csvservers_endpoint + '?filter=vsvr_ip_address:' + ip_address + ',vsvr_type:' + protocol, auth).get('ns_csvserver', [])
+                    cs_vservers = adm.fetch('ns_csvserver', (ip_address, protocol))
                     vserver_type = 'cs'
                     vserver = next(iter(cs_vservers), '')
                     if not vserver:
-                        lb_vservers = api_call(adm_hostname + adm_lbvservers_endpoint + '?filter=vsvr_ip_address:' + ip_address + ',vsvr_type:' + protocol, auth).get('ns_lbvserver', [])
+                        lb_vservers = adm.fetch('ns_lbvserver', (ip_address, protocol))
                         vserver = next(iter(lb_vservers), '')
                         vserver_type = 'lb'
                     if vserver:
                         vserver_list.append({'name': vserver['name'], 'type': vserver_type, 'load_balancer': vserver['hostname'] + '.' + adc_domain, 'ip_address': ip_address})
                     else:
                         display.vv(f"No lb or cs vservers found on ADM")
-                for vserver in  vserver_list:
-                    if vserver['type'] == 'lb':
-                        lb_vserver = api_call('https://' + vserver['load_balancer'] + adc_lbvserver_endpoint + '/' + vserver['name'], auth)['lbvserver'][0]
-                        target_lbvserver = lb_vserver['name']
-                    else:
-                        cs_vserver = api_call('https://' + vserver['load_balancer'] + adc_csvserver_endpoint + '/' + vserver['name'], auth)['csvserver'][0]
-                        target_lbvserver = cs_vserver['lbvserver']
-                        csvserver_policies = api_call('https://' + vserver['load_balancer'] + adc_csvserver_cspolicy_binding_endpoint + '/' + vserver['name'], auth).get('csvserver_cspolicy_binding', [])
-                        sorted_policies = sorted(csvserver_policies, key=lambda x: int(x['priority']))
-                        for policy in sorted_policies:
-                            policy_rule = policy.get('rule', '')
-                            if not policy_rule:
-                                display.vvv(f"Policy rule not found for {policy['policyname']} doing extra API call")
-                                cspolicy = api_call('https://' + vserver['load_balancer'] + adc_cspolicy_endpoint + '/' + policy['policyname'], auth).get('cspolicy', [])
-                                if cspolicy:
-                                    policy_rule = cspolicy[0].get('rule', '')
-                            display.vvv(f"Evaluating policy: {policy['policyname']}")
-                            if policy_match(url, policy_rule):
-                                target_lbvserver = policy['targetlbvserver']
-                                display.vv(f"Found matching policy. Target loadbalancer {target_lbvserver}")
-                                break
-                    service_bindings = api_call('https://' + vserver['load_balancer'] + adc_lbvserver_service_binding_endpoint + '/'  + target_lbvserver, auth).get('lbvserver_service_binding', [])
-                    for service_binding in service_bindings:
-                        services = api_call('https://' + vserver['load_balancer'] + adc_service_endpoint + '/'  + service_binding['servicename'], auth).get('service', [])
-                        for service in services:
-                            servers = api_call('https://' + vserver['load_balancer'] + adc_server_endpoint + '/'  + service['servername'], auth).get('server', [])
-                            for server in servers:
-                                server_list.append(server)
-                    servicegroup_bindings = api_call('https://' + vserver['load_balancer'] + adc_lbvserver_servicegroup_binding_endpoint + '/'  + target_lbvserver, auth).get('lbvserver_servicegroup_binding', [])
-                    for servicegroup_binding in servicegroup_bindings:
-                        servicegroup_members = api_call('https://' + vserver['load_balancer'] + adc_servicegroup_servicegroupmember_binding_endpoint + '/'  + servicegroup_binding['servicename'], auth).get('servicegroup_servicegroupmember_binding', [])
-                        for servicegroup_member in servicegroup_members:
-                            servers = api_call('https://' + vserver['load_balancer'] + adc_server_endpoint + '/'  + servicegroup_member['servername'], auth).get('server', [])
-                            for server in servers:
-                                server_list.append(server)
-                ret.append({'ip_address_list': ip_address_list, 'vserver_list': vserver_list, 'server_list': server_list})
+                adc_vservers = dict()
+                for vserver in vserver_list:
+                    adc_vservers.setdefault(vserver['load_balancer'], []).append(vserver)
+                jobs = dict()
+                for load_balancer, vservers in adc_vservers.items():
+                    if load_balancer not in unavailable:
+                        jobs[load_balancer] = lambda vservers=vservers: [resolve_vserver(url, vserver) for vserver in vservers]
+                # ADCs of different sites answer in parallel, an offline topology is already in memory
+                outcomes, timed_out = query_adcs(jobs, adc_timeout, parallel=not config_source) if jobs else (dict(), [])
+                for load_balancer in timed_out:
+                    unavailable[load_balancer] = outcomes[load_balancer][1]
+                    clients.setdefault(load_balancer, NitroClient(load_balancer, auth)).abandon()
+                adc_timing = []
+                errors = []
+                adc_servers = dict()
+                for load_balancer in adc_vservers:
+                    servers, error, seconds = outcomes.get(load_balancer, (None, unavailable.get(load_balancer), 0.0))
+                    if error is not None:
+                        errors.append((load_balancer, error))
+                    adc_timing.append({'load_balancer': load_balancer, 'seconds': round(seconds, 3), 'error': str(error) if error is not None else None})
+                    adc_servers[load_balancer] = iter(servers or [])
+                # servers stay in the order of vserver_list, whichever ADC answered first
+                for vserver in vserver_list:
+                    server_list.extend(next(adc_servers[vserver['load_balancer']], []))
+                # the lookup fails like before when no ADC could answer, otherwise the servers found are returned
+                if errors and len(errors) == len(adc_vservers):
+                    raise errors[0][1]
+                for load_balancer, error in errors:
+                    display.warning(f"Backend servers of {url} on {load_balancer} left out: {error}")
+                ret.append({'ip_address_list': ip_address_list, 'vserver_list': vserver_list, 'server_list': server_list, 'adc_timing': adc_timing})
             else:
                 raise AnsibleError(f"Input should be a string not '{type(term)}'")
-        return ret
\ No newline at end of file
+        return ret
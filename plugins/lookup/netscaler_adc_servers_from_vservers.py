@@ -14,6 +14,10 @@ DOCUMENTATION = r"""
       - To install it, use C(ansible-galaxy collection install git+https://github.com/abcorp-itops/automation-awx_plugins-itoa.git).
       - You'll also want to create C(collections/requirements.yml) in your AWX playbook that 
         contains this content
+  extends_documentation_fragment:
+    - cencora.itoa.nitro
+    - cencora.itoa.nitro.adc
+    - cencora.itoa.nitro.fields
   options:
     _terms:
       description: vserver name as appears in ADC
@@ -48,7 +52,7 @@ DOCUMENTATION = r"""
       description:
         - Name of user for connection to ADM.
         - If the value is not specified, the value of environment variable C(ADM_USERNAME) will be used instead.
-      required: true
+        - Not needed with C(config_source).
       type: str
       env:
         - name: ADM_USERNAME
@@ -56,10 +60,61 @@ DOCUMENTATION = r"""
       description:
         - Password for user.
         - If the value is not specified, the value of environment variable C(ADM_PASSWORD) will be used instead.
-      required: true
+        - Not needed with C(config_source).
       type: str
       env:
         - name: ADM_PASSWORD
+    bulk:
+      description:
+        - Fetch the service binding, service, servicegroup member and server collections of an ADC once
+          and join them locally instead of requesting every binding, service and server separately.
+        - The number of NITRO calls no longer grows with the number of vserver members, but every
+          collection is listed in full, which only pays off on vservers with more than a few members.
+      default: false
+      type: bool
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: bulk
+    fields:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: fields
+    page_size:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: page_size
+    max_workers:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: max_workers
+    pool_size:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: pool_size
+    nitro_login:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: nitro_login
+    session_ttl:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: session_ttl
+    cache:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: cache
+    cache_dir:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: cache_dir
+    cache_ttl:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: cache_ttl
+    config_source:
+      ini:
+        - section: netscaler_adc_servers_from_vservers
+          key: config_source
 """
 
 EXAMPLES = r"""
@@ -116,160 +171,18 @@ returned_value:
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-import requests
-from requests.auth import HTTPBasicAuth
 import urllib.parse
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from dns import resolver
+from ansible_collections.cencora.itoa.plugins.module_utils.nitro import NitroClient, field_attrs, nitro_auth, project
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_policy import PolicyIndex
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import BACKEND_RESOURCES, RESOURCE_ATTRS
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_snapshot import adc_topology, first_record
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_config import ConfigSource
 
 display = Display()
 
-api_path = '/nitro/v1/config/'
-adc_lbvserver_endpoint = api_path+ 'lbvserver'
-adc_csvserver_endpoint = api_path + 'csvserver'
-adc_csvserver_cspolicy_binding_endpoint = api_path + 'csvserver_cspolicy_binding'
-adc_lbvserver_service_binding_endpoint = api_path + 'lbvserver_service_binding'
-adc_lbvserver_servicegroup_binding_endpoint = api_path+ 'lbvserver_servicegroup_binding'
-adc_cspolicy_endpoint = api_path + 'cspolicy'
-adc_service_endpoint = api_path + 'service'
-adc_servicegroup_servicegroupmember_binding_endpoint = api_path + 'servicegroup_servicegroupmember_binding'
-adc_server_endpoint = api_path + 'server'
-
-def api_call(url, auth):
-    display.vv(f"Fetching info from {url}")
-    response = requests.get(url, auth=auth, verify=False)
-    display.vvv(f"Response status code {str(response.status_code)}")
-    if response.status_code != 200:
-        raise AnsibleError(f"http error : {response.status_code}: {response.text}")
-    return response.json()
-
-open_list = ['(']
-close_list = [')']
-operator_list = ['|','&']
-
-def convert_to_advanced_expression(rule):
-    return rule.replace("req.http.url == '",'http.req.url.startswith("').replace("*'",'")')
-
-def eval_advanced_expression(rule, hostname, path):
-    rule = rule.replace(']','')
-    rule_split = rule.split('[')
-    first_part_split = rule_split[0].split('.')[2:]
-    eval_var = rule_split[1]
-    element = first_part_split[0]
-    test = first_part_split[1]
-    ret = False
-    display.vvv(f'Test: {element} {test} {eval_var}')
-    if element == 'hostname':
-        if test == 'eq':
-            ret = bool(hostname == eval_var)
-        elif test == 'ne':
-            ret = bool(hostname != eval_var)
-        elif test == 'contains':
-            ret = bool(eval_var in hostname)
-        else:
-            display.v(f"Test not supported: {test}.")
-    else:
-        if test == 'startswith':
-            ret = bool(path.startswith(eval_var))
-        elif test == 'contains':
-            ret = bool(eval_var in path)
-        else:
-            display.v(f"Test not supported: {test}.")
-    return ret
-
-def eval_compound_advanced_expression(rule, hostname, path):
-    display.vvv(f'Expression: "{rule}"')
-    expression =  ''
-    previous_char = ''
-    previous_test = False
-    operator = 'or'
-    open_count = 0
-    result = False
-    for i in rule:
-        if i in open_list:
-            display.vvvv(f'Opening parenthesis found.')
-            open_count+=1
-            if expression:
-                expression += i
-        elif i in close_list:
-            display.vvvv(f'Closing parenthesis found.')
-            open_count-=1
-            if open_count == 0:
-                display.vvvv(f'Top most closing parenthesis found. Expression: "{expression}"')
-                if operator == 'or':
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    result = bool(previous_test or recursive_result)
-                else:
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    result = bool(previous_test and recursive_result)
-                previous_test = result
-                expression =  ''
-            else:
-                expression += i
-        elif i in operator_list and previous_char == i and open_count == 0:
-            display.vvvv(f'Full operator found "{i}{i}"')
-            if i == '|':
-                operator = 'or'
-            else:
-                operator = 'and'
-        elif i in operator_list and open_count == 0:
-            display.vvvv(f'Operator found "{i}"')
-            if expression:
-                display.vvvv(f'Completing expression: "{expression}"')
-                if operator == 'or':
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    display.vvvv(f'Recursive result: {recursive_result}')
-                    result = bool(previous_test or recursive_result)
-                else:
-                    recursive_result = eval_compound_advanced_expression(expression, hostname, path)
-                    display.vvvv(f'Recursive result: {recursive_result}')
-                    result = bool(previous_test and recursive_result)
-                previous_test = result
-                expression =  ''
-        else:
-            expression += i
-        previous_char = i
-    if expression:
-        display.vvvv(f'Completing expression: "{expression}". Operator: "{operator}"')
-        if operator == 'or':
-            result = bool(previous_test or eval_advanced_expression(expression, hostname, path))
-        else:
-            result = bool(previous_test and eval_advanced_expression(expression, hostname, path))
-        previous_test = result
-        expression =  ''
-    display.vvvv(f'Returning result: {result}')
-    return result
-
-def policy_match(url, rule):
-    url = url.lower()
-    rule = rule.lower()
-    url_split = url.replace('https://','').replace('http://','').split("/")
-    hostname = url_split[0]
-    if len(url_split) > 1 and url_split[-1]:
-        path = '/' + '/'.join(url_split[1:])
-    else:
-        path = ''
-    display.vvv(f"Url: '{url}'")
-    display.vvv(f"Hostname: '{hostname}'")
-    display.vvv(f"Path: '{path}'")
-    display.vvv(f"Policy rule: '{rule}'")
-    if 'req.http' in rule: # classic policy expression
-        display.vvv(f"Classic policy expression: {rule} detected. Converting to advanced.")
-        rule = convert_to_advanced_expression(rule)
-    rule = rule.replace('("','[') # replacing parenthesis with brackets for better code control
-    rule = rule.replace('")',']') # replacing parenthesis with brackets for better code control
-    rule = rule.replace(' ','') # removing spaces
-    rule = rule.replace('url.path','url') # there are url.path and url clauses so replacing url.path with url
-    rule = rule.replace('get(1).','') # there are some rules that have fuction get(1) this is removed
-    rule = rule.replace('set_text_mode(ignorecase).','') # remove set_text_mode(ignorecase) since lower is used
-    display.vvv(f"Final optimized rule: '{rule}'")
-    try:
-        result = eval_compound_advanced_expression(rule, hostname, path)
-        display.vvv(f"Expression evaluated to {result}")
-    except Exception as e:
-         display.vvv(f"Error evaluating policy expression {rule}. Error: {e}. Setting result to false.")
-         result = False
-    return result
-
 class LookupModule(LookupBase):
     def run(self, terms, variables=None, **kwargs):
         self.set_options(var_options=variables, direct=kwargs)
@@ -278,49 +191,47 @@ class LookupModule(LookupBase):
         vserver_type = self.get_option('vserver_type')
         username = self.get_option('username')
         password = self.get_option('password')
-        auth = HTTPBasicAuth(username, password)
+        max_workers = self.get_option('max_workers')
+        config_source = self.get_option('config_source')
+        server_attrs = field_attrs(self.get_option('fields'))
+        if config_source:
+            topology = ConfigSource(config_source).topology(adc_hostname)
+        else:
+            if not username or not password:
+                raise AnsibleError("username and password are required unless config_source is set")
+            auth = nitro_auth(self.get_option, max_workers)
+            topology = adc_topology(
+                NitroClient(adc_hostname, auth),
+                self.get_option('cache'),
+                self.get_option('cache_dir'),
+                self.get_option('cache_ttl'),
+                dict(RESOURCE_ATTRS, server=server_attrs),
+                BACKEND_RESOURCES if self.get_option('bulk') else (),
+                self.get_option('page_size')
+            )
         ret = []
         for term in terms:
             display.v("Looking up servers for vserver: %s" % term)
             if isinstance(term, str):
-                target_servers = []
                 if not (url.lower().startswith('https://') or url.lower().startswith('http://')):
                     raise AnsibleError(f"URL should start with 'http://' or 'https://'")
                 if vserver_type == 'lb':
-                    lb_vserver = api_call('https://' + adc_hostname + adc_lbvserver_endpoint + '/' + term, auth)['lbvserver'][0]
+                    lb_vserver = first_record(topology, 'lbvserver', term, adc_hostname)
                     target_lbvserver = lb_vserver['name']
                 else:
-                    cs_vserver = api_call('https://' + adc_hostname + adc_csvserver_endpoint + '/' + term, auth)['csvserver'][0]
+                    cs_vserver = first_record(topology, 'csvserver', term, adc_hostname)
                     target_lbvserver = cs_vserver['lbvserver']
-                    csvserver_policies = api_call('https://' + adc_hostname + adc_csvserver_cspolicy_binding_endpoint + '/' + term, auth).get('csvserver_cspolicy_binding', [])
-                    sorted_policies = sorted(csvserver_policies, key=lambda x: int(x['priority']))
-                    for policy in sorted_policies:
-                        policy_rule = policy.get('rule', '')
-                        if not policy_rule:
-                            display.vvv(f"Policy rule not found for {policy['policyname']} doing extra API call")
-                            cspolicy = api_call('https://' + adc_hostname + adc_cspolicy_endpoint + '/' + policy['policyname'], auth).get('cspolicy', [])
-                            if cspolicy:
-                                policy_rule = cspolicy[0].get('rule', '')
-                        display.vvv(f"Evaluating policy: {policy['policyname']}")
-                        if policy_match(url, policy_rule):
-                            target_lbvserver = policy['targetlbvserver']
-                            display.vv(f"Found matching policy. Target loadbalancer {target_lbvserver}")
-                            break
-                service_bindings = api_call('https://' + adc_hostname + adc_lbvserver_service_binding_endpoint + '/'  + target_lbvserver, auth).get('lbvserver_service_binding', [])
-                for service_binding in service_bindings:
-                    services = api_call('https://' + adc_hostname + adc_service_endpoint + '/'  + service_binding['servicename'], auth).get('service', [])
-                    for service in services:
-                        servers = api_call('https://' + adc_hostname + adc_server_endpoint + '/'  + service['servername'], auth).get('server', [])
-                        for server in servers:
-                            target_servers.append(server)
-                servicegroup_bindings = api_call('https://' + adc_hostname + adc_lbvserver_servicegroup_binding_endpoint + '/'  + target_lbvserver, auth).get('lbvserver_servicegroup_binding', [])
-                for servicegroup_binding in servicegroup_bindings:
-                    servicegroup_members = api_call('https://' + adc_hostname + adc_servicegroup_servicegroupmember_binding_endpoint + '/'  + servicegroup_binding['servicename'], auth).get('servicegroup_servicegroupmember_binding', [])
-                    for servicegroup_member in servicegroup_members:
-                        servers = api_call('https://' + adc_hostname + adc_server_endpoint + '/'  + servicegroup_member['servername'], auth).get('server', [])
-                        for server in servers:
-                            target_servers.append(server)
+                    csvserver_policies = topology.fetch('csvserver_cspolicy_binding', term)
+                    policy = PolicyIndex(csvserver_policies, topology.policy_rule).match(url)
+                    # advanced policies name no lb vserver in the binding, it is the target of their cs action
+                    policy_target = topology.policy_target(policy) if policy else None
+                    if policy_target:
+                        target_lbvserver = policy_target
+                        display.vv(f"Found matching policy {policy['policyname']}. Target loadbalancer {target_lbvserver}")
+                # an offline topology is already in memory, threads would only slow the walk down
+                with ThreadPoolExecutor(max_workers=max_workers) if not config_source else nullcontext() as executor:
+                    target_servers = project(topology.servers(target_lbvserver, executor), server_attrs)
                 ret.append(target_servers)
             else:
                 raise AnsibleError(f"Input should be a string not '{type(term)}'")
-        return ret
\ No newline at end of file
+        return ret
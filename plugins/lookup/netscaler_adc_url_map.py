@@ -0,0 +1,236 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+  name: netscaler_adc_url_map
+  author: Arnas Tamulionis arnas.tamulionis@amerisourcebergen.com
+  version_added: 1.1.10
+  short_description: This plugin exports the URL to backend server routing table of an ADC
+  description:
+      - This lookup returns every (hostname, path prefix) to lb vserver route of the cs vservers of an ADC,
+        and a route for every lb vserver with an address of its own, each with the servers behind the lb vserver.
+      - The configuration of the ADC is listed once and every lb vserver is walked once, however many routes lead to it,
+        so syncing many URLs does not need one C(netscaler_adc_servers_from_url) lookup per URL.
+  notes:
+      - This module is part of the cencora.itoa collection (version 1.1.10).
+      - To install it, use C(ansible-galaxy collection install git+https://github.com/abcorp-itops/automation-awx_plugins-itoa.git).
+      - You'll also want to create C(collections/requirements.yml) in your AWX playbook that
+        contains this content
+      - Routes of a cs vserver are listed in policy priority order, the first route a request matches is the one the ADC takes.
+  extends_documentation_fragment:
+    - cencora.itoa.nitro
+    - cencora.itoa.nitro.adc
+    - cencora.itoa.nitro.fields
+  options:
+    _terms:
+      description: Hostname of ADC
+      required: True
+    dest:
+      description:
+        - File the routes are written to as JSON lines, one route per line, instead of being returned.
+        - Routes of all ADCs go to the same file, it is replaced once complete.
+        - The file is created readable and writable only by the current user, the routes describe the internal topology.
+      type: path
+      ini:
+        - section: netscaler_adc_url_map
+          key: dest
+    username:
+      description:
+        - Name of user for connection to ADM.
+        - If the value is not specified, the value of environment variable C(ADM_USERNAME) will be used instead.
+        - Not needed with C(config_source).
+      type: str
+      env:
+        - name: ADM_USERNAME
+    password:
+      description:
+        - Password for user.
+        - If the value is not specified, the value of environment variable C(ADM_PASSWORD) will be used instead.
+        - Not needed with C(config_source).
+      type: str
+      env:
+        - name: ADM_PASSWORD
+    fields:
+      ini:
+        - section: netscaler_adc_url_map
+          key: fields
+    page_size:
+      ini:
+        - section: netscaler_adc_url_map
+          key: page_size
+    max_workers:
+      ini:
+        - section: netscaler_adc_url_map
+          key: max_workers
+    pool_size:
+      ini:
+        - section: netscaler_adc_url_map
+          key: pool_size
+    nitro_login:
+      ini:
+        - section: netscaler_adc_url_map
+          key: nitro_login
+    session_ttl:
+      ini:
+        - section: netscaler_adc_url_map
+          key: session_ttl
+    cache:
+      ini:
+        - section: netscaler_adc_url_map
+          key: cache
+    cache_dir:
+      ini:
+        - section: netscaler_adc_url_map
+          key: cache_dir
+    cache_ttl:
+      ini:
+        - section: netscaler_adc_url_map
+          key: cache_ttl
+    config_source:
+      ini:
+        - section: netscaler_adc_url_map
+          key: config_source
+"""
+
+EXAMPLES = r"""
+---
+collections:
+  - name: cencora.itoa
+    type: git
+    source: https://github.com/abcorp-itops/automation-awx_plugins-itoa
+    version: 1.1.10
+---
+- hosts: localhost
+  connection: local
+  gather_facts: true
+  collections:
+    - cencora.itoa
+  vars:
+    adc_hostnames:
+      - "LADC-PFE01.myabcit.net"
+      - "LADC-PFE02.myabcit.net"
+  tasks:
+    - name: Write the routing tables of both ADCs to url_map.jsonl
+      debug:
+        msg: "{{ lookup('cencora.itoa.netscaler_adc_url_map', adc_hostnames, dest='url_map.jsonl', fields=['name', 'ipaddress'], username=username, password=password) }}"
+"""
+
+RETURN = r"""
+returned_value:
+  description:
+    - List of route dictionaries for every ADC.
+    - With C(dest) a single summary dictionary for every ADC with the number of routes written instead.
+    - C(hostname) is null and C(path) empty where any hostname or path matches, C(exact) is false when the policy rule
+      tests more than the hostname and path prefix of the route.
+  returned: always
+  type: list
+  elements: dict
+  sample:
+    - adc_hostname: "LADC-PFE02.myabcit.net"
+      type: "cs"
+      vserver: "www.amerisourcebergen.com-443_cs"
+      ipv46: "10.0.0.10"
+      port: 443
+      priority: "100"
+      policyname: "www.amerisourcebergen.com_default_pol"
+      rule: "HTTP.REQ.HOSTNAME.EQ(\"www.amerisourcebergen.com\")"
+      exact: true
+      hostname: "www.amerisourcebergen.com"
+      path: ""
+      lbvserver: "www.amerisourcebergen.com_default_lb"
+      servers:
+        - name: "20.0.0.0"
+          ipaddress: "20.0.0.0"
+"""
+
+from ansible.errors import AnsibleError, AnsibleParserError
+from ansible.plugins.lookup import LookupBase
+from ansible.utils.display import Display
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ansible_collections.cencora.itoa.plugins.module_utils.nitro import NitroClient, field_attrs, nitro_auth, project
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import (
+    BACKEND_RESOURCES, FRONTEND_ATTRS, INDEX_FIELDS, ROUTE_RESOURCES, url_routes
+)
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_snapshot import adc_topology
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_config import ConfigSource
+
+display = Display()
+
+def adc_routes(adc_hostname, topology, server_attrs):
+    # many routes lead to the same lb vserver, each is walked once
+    servers = dict()
+    for route in url_routes(topology):
+        lbvserver = route['lbvserver']
+        if lbvserver not in servers:
+            servers[lbvserver] = project(topology.servers(lbvserver), server_attrs) if lbvserver else []
+        yield dict(route, adc_hostname=adc_hostname, servers=servers[lbvserver])
+
+class LookupModule(LookupBase):
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        dest = self.get_option('dest')
+        username = self.get_option('username')
+        password = self.get_option('password')
+        max_workers = self.get_option('max_workers')
+        config_source = self.get_option('config_source')
+        server_attrs = field_attrs(self.get_option('fields'))
+        for term in terms:
+            if not isinstance(term, str):
+                raise AnsibleError(f"Input should be a string not '{type(term)}'")
+        topologies = dict()
+        if config_source:
+            source = ConfigSource(config_source)
+            for adc_hostname in terms:
+                topologies[adc_hostname] = source.topology(adc_hostname)
+        else:
+            if not username or not password:
+                raise AnsibleError("username and password are required unless config_source is set")
+            auth = nitro_auth(self.get_option, max_workers)
+            for adc_hostname in terms:
+                topologies[adc_hostname] = adc_topology(
+                    NitroClient(adc_hostname, auth),
+                    self.get_option('cache'),
+                    self.get_option('cache_dir'),
+                    self.get_option('cache_ttl'),
+                    dict(FRONTEND_ATTRS, server=server_attrs),
+                    tuple(INDEX_FIELDS),
+                    self.get_option('page_size')
+                )
+            # every collection of every ADC is listed up front, in parallel
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(
+                    lambda args: args[0].index(args[1]),
+                    [(topology, resource) for topology in topologies.values() for resource in ROUTE_RESOURCES + BACKEND_RESOURCES]))
+        ret = []
+        if not dest:
+            for adc_hostname, topology in topologies.items():
+                display.v(f"Building routing table of {adc_hostname}")
+                ret.append(list(adc_routes(adc_hostname, topology, server_attrs)))
+            return ret
+        try:
+            # mkstemp creates the file with mode 0600
+            fd, path = tempfile.mkstemp(prefix='.url_map_', dir=os.path.dirname(os.path.abspath(dest)))
+        except OSError as e:
+            raise AnsibleError(f"Could not write {dest}: {e}")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for adc_hostname, topology in topologies.items():
+                    display.v(f"Writing routing table of {adc_hostname} to {dest}")
+                    count = 0
+                    for route in adc_routes(adc_hostname, topology, server_attrs):
+                        f.write(json.dumps(route) + '\n')
+                        count += 1
+                    ret.append({'adc_hostname': adc_hostname, 'dest': dest, 'routes': count})
+            os.replace(path, dest)
+        except OSError as e:
+            os.unlink(path)
+            raise AnsibleError(f"Could not write {dest}: {e}")
+        except BaseException:
+            # a failed ADC leaves the previous export in place
+            os.unlink(path)
+            raise
+        return ret
@@ -0,0 +1,244 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+  name: netscaler_adc_vservers_from_server
+  author: Arnas Tamulionis arnas.tamulionis@amerisourcebergen.com
+  version_added: 1.1.10
+  short_description: This plugin resolves what vservers are in front of a backend server
+  description:
+      - This lookup returns the services, servicegroups, lb vservers and cs vservers that send traffic to a backend server in NetScaler.
+      - The server, service, servicegroup member, binding and vserver collections of every ADC are listed once
+        and inverted locally, every term is then answered from that index without further NITRO calls.
+  notes:
+      - This module is part of the cencora.itoa collection (version 1.1.10).
+      - To install it, use C(ansible-galaxy collection install git+https://github.com/abcorp-itops/automation-awx_plugins-itoa.git).
+      - You'll also want to create C(collections/requirements.yml) in your AWX playbook that
+        contains this content
+  extends_documentation_fragment:
+    - cencora.itoa.nitro
+    - cencora.itoa.nitro.adc
+  options:
+    _terms:
+      description: Server name, IP address or domain as appears in ADC
+      required: True
+    adc_hostname:
+      description: Hostname of ADC, or list of ADC hostnames to search
+      required: true
+      type: list
+      elements: str
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: adc_hostname
+    username:
+      description:
+        - Name of user for connection to ADM.
+        - If the value is not specified, the value of environment variable C(ADM_USERNAME) will be used instead.
+        - Not needed with C(config_source).
+      type: str
+      env:
+        - name: ADM_USERNAME
+    password:
+      description:
+        - Password for user.
+        - If the value is not specified, the value of environment variable C(ADM_PASSWORD) will be used instead.
+        - Not needed with C(config_source).
+      type: str
+      env:
+        - name: ADM_PASSWORD
+    index_ttl:
+      description:
+        - Seconds the index of an ADC is kept for later lookups in the same process.
+        - Ansible runs the lookups of every task in a new forked worker process, so an index is only reused by lookups
+          of the same task (for example loop items), every task still lists the collections of its ADCs once.
+          Use C(cache) to keep the collections across tasks and runs.
+        - C(0) builds a new index on every lookup.
+      default: 300
+      type: int
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: index_ttl
+    page_size:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: page_size
+    max_workers:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: max_workers
+    pool_size:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: pool_size
+    nitro_login:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: nitro_login
+    session_ttl:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: session_ttl
+    cache:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: cache
+    cache_dir:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: cache_dir
+    cache_ttl:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: cache_ttl
+    config_source:
+      ini:
+        - section: netscaler_adc_vservers_from_server
+          key: config_source
+"""
+
+EXAMPLES = r"""
+---
+collections:
+  - name: cencora.itoa
+    type: git
+    source: https://github.com/abcorp-itops/automation-awx_plugins-itoa
+    version: 1.1.10
+---
+- hosts: localhost
+  connection: local
+  gather_facts: true
+  collections:
+    - cencora.itoa
+  vars:
+    adc_hostnames:
+      - "LADC-PFE01.myabcit.net"
+      - "LADC-PFE02.myabcit.net"
+    frontends: "{{ lookup('cencora.itoa.netscaler_adc_vservers_from_server', '20.0.0.0', adc_hostname=adc_hostnames, username=username, password=password) }}"
+  tasks:
+    - debug:
+        msg: "20.0.0.0 is behind {{ frontends | map(attribute='lbvserver') | list }}"
+"""
+
+RETURN = r"""
+returned_value:
+  description:
+    - List with one entry for every service or servicegroup the server is a member of and lb vserver it is bound to.
+    - C(lbvserver) is null for a service or servicegroup not bound to any lb vserver.
+    - C(hostnames) and C(paths) of a policy are the C(HOSTNAME.EQ) values and C(URL.STARTSWITH) prefixes of its rule.
+  returned: always
+  type: list
+  elements: dict
+  sample:
+    - adc_hostname: "LADC-PFE02.myabcit.net"
+      server: "20.0.0.0"
+      address: "20.0.0.0"
+      servicegroupname: "www.amerisourcebergen.com_default_sg"
+      port: 8080
+      lbvserver: "www.amerisourcebergen.com_default_lb"
+      lbvserver_ipv46: "0.0.0.0"
+      lbvserver_port: 0
+      csvservers:
+        - name: "www.amerisourcebergen.com-443_cs"
+          ipv46: "10.0.0.10"
+          port: 443
+          default: false
+          policies:
+            - policyname: "www.amerisourcebergen.com_default_pol"
+              priority: "100"
+              rule: "HTTP.REQ.HOSTNAME.EQ(\"www.amerisourcebergen.com\")"
+              hostnames:
+                - "www.amerisourcebergen.com"
+              paths: []
+"""
+
+from ansible.errors import AnsibleError, AnsibleParserError
+from ansible.plugins.lookup import LookupBase
+from ansible.utils.display import Display
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ansible_collections.cencora.itoa.plugins.module_utils.nitro import NitroClient, nitro_auth
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import (
+    FRONTEND_ATTRS, FRONTEND_RESOURCES, INDEX_FIELDS, FrontendIndex
+)
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_snapshot import adc_topology
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_config import ConfigSource
+
+display = Display()
+
+# fields the index reads from servers, the addresses terms are matched against
+SERVER_ATTRS = ('name', 'ipaddress', 'domain')
+
+# (adc hostname, username) -> (expires, FrontendIndex), shared by all lookups in the process
+frontend_indexes = dict()
+frontend_indexes_lock = threading.Lock()
+
+def cached_index(adc_hostname, username):
+    with frontend_indexes_lock:
+        cached = frontend_indexes.get((adc_hostname.lower(), username))
+    if cached is not None and cached[0] > time.monotonic():
+        display.vv(f"Using index of {adc_hostname} built by an earlier lookup")
+        return cached[1]
+    return None
+
+class LookupModule(LookupBase):
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        adc_hostnames = self.get_option('adc_hostname')
+        username = self.get_option('username')
+        password = self.get_option('password')
+        max_workers = self.get_option('max_workers')
+        config_source = self.get_option('config_source')
+        index_ttl = self.get_option('index_ttl')
+        indexes = dict()
+        topologies = dict()
+        if config_source:
+            source = ConfigSource(config_source)
+            for adc_hostname in adc_hostnames:
+                topologies[adc_hostname] = source.topology(adc_hostname)
+        else:
+            if not username or not password:
+                raise AnsibleError("username and password are required unless config_source is set")
+            auth = nitro_auth(self.get_option, max_workers)
+            for adc_hostname in adc_hostnames:
+                index = cached_index(adc_hostname, username) if index_ttl > 0 else None
+                if index is not None:
+                    indexes[adc_hostname] = index
+                    continue
+                # every collection the index reads is listed whole, with only the fields it reads
+                topologies[adc_hostname] = adc_topology(
+                    NitroClient(adc_hostname, auth),
+                    self.get_option('cache'),
+                    self.get_option('cache_dir'),
+                    self.get_option('cache_ttl'),
+                    dict(FRONTEND_ATTRS, server=SERVER_ATTRS),
+                    tuple(INDEX_FIELDS),
+                    self.get_option('page_size')
+                )
+        if topologies:
+            # every collection of every ADC is listed up front, in parallel, then inverted in memory
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(
+                    lambda args: args[0].index(args[1]),
+                    [(topology, resource) for topology in topologies.values() for resource in FRONTEND_RESOURCES]))
+            for adc_hostname, topology in topologies.items():
+                display.v(f"Building frontend index of {adc_hostname}")
+                indexes[adc_hostname] = FrontendIndex(topology)
+                if not config_source and index_ttl > 0:
+                    with frontend_indexes_lock:
+                        frontend_indexes[(adc_hostname.lower(), username)] = (time.monotonic() + index_ttl, indexes[adc_hostname])
+        ret = []
+        for term in terms:
+            display.v("Looking up vservers in front of server: %s" % term)
+            if isinstance(term, str):
+                frontends = []
+                for adc_hostname in adc_hostnames:
+                    for frontend in indexes[adc_hostname].frontends(term):
+                        frontends.append(dict(adc_hostname=adc_hostname, **frontend))
+                if not frontends:
+                    display.v(f"Server {term} not found on {', '.join(adc_hostnames)}")
+                ret.append(frontends)
+            else:
+                raise AnsibleError(f"Input should be a string not '{type(term)}'")
+        return ret
@@ -14,9 +14,13 @@ DOCUMENTATION = r"""
       - To install it, use C(ansible-galaxy collection install git+https://github.com/abcorp-itops/automation-awx_plugins-itoa.git).
       - You'll also want to create C(collections/requirements.yml) in your AWX playbook that 
         contains this content
+  extends_documentation_fragment:
+    - cencora.itoa.nitro
   options:
     _terms:
-      description: IP address of vserver
+      description:
+        - IP address of vserver
+        - A network in CIDR notation, e.g. C(10.1.2.0/24), returns the vservers of every address in it, ordered by address.
       required: True
     adm_hostname:
       description: Hostname of ADM
@@ -48,6 +52,44 @@ DOCUMENTATION = r"""
       ini:
         - section: netscaler_adm_vserver_from_ip
           key: protocol
+    bulk:
+      description:
+        - List the cs and lb vservers of C(protocol) from ADM once and look every IP address up locally,
+          instead of making up to two filtered ADM requests per IP address.
+        - Pays off from a handful of terms on. Networks are always looked up this way.
+      default: false
+      type: bool
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: bulk
+    page_size:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: page_size
+    pool_size:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: pool_size
+    nitro_login:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: nitro_login
+    session_ttl:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: session_ttl
+    cache:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: cache
+    cache_dir:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: cache_dir
+    cache_ttl:
+      ini:
+        - section: netscaler_adm_vserver_from_ip
+          key: cache_ttl
 """
 
 EXAMPLES = r"""
@@ -87,48 +129,84 @@ returned_value:
 from ansible.errors import AnsibleError, AnsibleParserError
 from ansible.plugins.lookup import LookupBase
 from ansible.utils.display import Display
-import requests
-from requests.auth import HTTPBasicAuth
+import bisect
 import ipaddress
+from ansible_collections.cencora.itoa.plugins.module_utils.nitro import NitroClient, nitro_auth
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_snapshot import adm_inventory
 
 display = Display()
 
-api_path = '/nitro/v1/config/'
-adm_lbvservers_endpoint = api_path + 'ns_lbvserver'
-adm_csvservers_endpoint = api_path + 'ns_csvserver'
+class AddressIndex:
+    """vserver of every address in an ADM inventory, sorted by address to look networks up.
 
-def api_call(url, auth):
-    display.vv(f"Fetching info from {url}")
-    response = requests.get(url, auth=auth, verify=False)
-    display.vvv(f"Response status code {str(response.status_code)}")
-    if response.status_code != 200:
-        raise AnsibleError(f"http error : {response.status_code}: {response.text}")
-    return response.json()
+    Like for single addresses a cs vserver is preferred over an lb vserver on the same address.
+    """
+
+    def __init__(self, adm, protocol):
+        self.vservers = dict()
+        for resource, vserver_type in (('ns_csvserver', 'cs'), ('ns_lbvserver', 'lb')):
+            for (ip_address, vsvr_type), vservers in adm.index(resource).items():
+                if vsvr_type != protocol:
+                    continue
+                try:
+                    address = ipaddress.ip_address(ip_address)
+                except ValueError:
+                    continue
+                self.vservers.setdefault(address, (vserver_type, vservers[0]))
+        self.addresses = sorted(self.vservers, key=lambda address: (address.version, int(address)))
+        self.keys = [(address.version, int(address)) for address in self.addresses]
+
+    def network(self, network):
+        start = bisect.bisect_left(self.keys, (network.version, int(network.network_address)))
+        end = bisect.bisect_right(self.keys, (network.version, int(network.broadcast_address)))
+        return [(address,) + self.vservers[address] for address in self.addresses[start:end]]
 
 class LookupModule(LookupBase):
     def run(self, terms, variables=None, **kwargs):
         self.set_options(var_options=variables, direct=kwargs)
-        adm_hostname = 'https://' + self.get_option('adm_hostname')
+        adm_hostname = self.get_option('adm_hostname')
         adc_domain = '.'.join(self.get_option('adm_hostname').split('.')[-2:])
-        username = self.get_option('username')
-        password = self.get_option('password')
         protocol = self.get_option('protocol')
-        auth = HTTPBasicAuth(username, password)
+        auth = nitro_auth(self.get_option)
+        adm = adm_inventory(
+            NitroClient(adm_hostname, auth),
+            self.get_option('cache'),
+            self.get_option('cache_dir'),
+            self.get_option('cache_ttl'),
+            self.get_option('bulk'),
+            protocol,
+            self.get_option('page_size')
+        )
+        address_index = None
         ret = []
         for term in terms:
             display.v("netscaler_adm_vserver_from_ip lookup term: %s" % term)
             if isinstance(term, str):
+                ret_list = []
                 try:
                     ip_address = ipaddress.ip_address(term)
                     display.v(f'{ip_address} is a correct IP{ip_address.version} address.')
                 except ValueError:
-                    display.v(f'IP address is invalid: {term}')
-                ret_list = []
-                cs_vservers = api_call(adm_hostname + adm_csvservers_endpoint + '?filter=vsvr_ip_address:' + str(ip_address) + ',vsvr_type:' + protocol, auth).get('ns_csvserver', [])
+                    try:
+                        network = ipaddress.ip_network(term, strict=False)
+                    except ValueError:
+                        display.v(f'IP address is invalid: {term}')
+                        ret.append(ret_list)
+                        continue
+                    display.v(f'{network} is a correct IP{network.version} network.')
+                    if address_index is None:
+                        address_index = AddressIndex(adm, protocol)
+                    for address, vserver_type, vserver in address_index.network(network):
+                        ret_list.append({'name': vserver['name'], 'type': vserver_type, 'load_balancer': vserver['hostname'] + '.' + adc_domain, 'ip_address': str(address)})
+                    if not ret_list:
+                        display.vv(f"No lb or cs vservers found on ADM")
+                    ret.append(ret_list)
+                    continue
+                cs_vservers = adm.fetch('ns_csvserver', (str(ip_address), protocol))
                 vserver_type = 'cs'
                 vserver = next(iter(cs_vservers), '')
                 if not vserver:
-                    lb_vservers = api_call(adm_hostname + adm_lbvservers_endpoint + '?filter=vsvr_ip_address:' + str(ip_address) + ',vsvr_type:' + protocol, auth).get('ns_lbvserver', [])
+                    lb_vservers = adm.fetch('ns_lbvserver', (str(ip_address), protocol))
                     vserver = next(iter(lb_vservers), '')
                     vserver_type = 'lb'
                 if vserver:
@@ -138,4 +216,4 @@ class LookupModule(LookupBase):
                 ret.append(ret_list)
             else:
                 raise AnsibleError(f"Input should be a string not '{type(term)}'")
-        return ret
\ No newline at end of file
+        return ret
@@ -3,8 +3,9 @@ from ansible.utils.display import Display
 from ansible.plugins.lookup import LookupBase
 from ansible.errors import AnsibleError
 import requests
-import json
-import base64
+from ansible_collections.cencora.itoa.plugins.module_utils.beyondtrust import (
+    BtApi, SecretCache, fetch_secrets, fetch_secrets_from_broker, get_bt_session
+)
 __metaclass__ = type
 
 DOCUMENTATION = r"""
@@ -14,6 +15,8 @@ author:
   - Matt Cengic matt.cengic@amerisourcebergen.com
   - Arnas Tamulionis arnas.tamulionis@amerisourcebergen.com
 short_description: This collection creates a lookup plugin for BeyondTrust teams passwords, texts, and files
+requirements:
+  - python cryptography (only when bt_cache is used)
 description:
   - This lookup plugin can be used to fetch credentials, text strings and files from BeyondTrust.
 notes:
@@ -37,6 +40,7 @@ options:
       description:
         - credential titles to fetch
         - can be specified with folder name e.g. folder/my_creds
+        - or with the full folder path for nested folders e.g. Team/Prod/DB/my_creds
       required: True
   bt_uri:
     description: 
@@ -51,6 +55,7 @@ options:
     description: 
       - folder location in BeyondTrust. If not set C(BT_FOLDER) environment variable will be used.
       - if folder is specified in term this is optional
+      - can be a folder name or a full folder path e.g. Team/Prod/DB
     type: str
     default: ''
     vars: 
@@ -93,6 +98,148 @@ options:
       - name: bt_cert_verify
     env: 
       - name: BT_CERT_VERIFY
+  bt_max_workers:
+    description:
+      - Maximum number of secrets fetched from BeyondTrust in parallel. If not set C(BT_MAX_WORKERS) environment variable will be used.
+      - Set to 1 to fetch secrets one after another.
+    type: int
+    default: 4
+    vars:
+      - name: bt_max_workers
+    env:
+      - name: BT_MAX_WORKERS
+  bt_session_ttl:
+    description:
+      - Seconds a signed in BeyondTrust session and its folder list are kept idle for reuse by later lookups in the same process.
+        If not set C(BT_SESSION_TTL) environment variable will be used.
+      - Cached sessions are signed out when the process exits.
+      - Ansible runs the lookups of every task in a new forked worker process, so a session is only reused by lookups
+        of the same task (for example loop items). Every task still signs in once, use C(bt_broker) to share one
+        session across tasks.
+      - Set to 0 to sign in and sign out on every lookup.
+    type: int
+    default: 300
+    vars:
+      - name: bt_session_ttl
+    env:
+      - name: BT_SESSION_TTL
+  bt_broker:
+    description:
+      - Fetch secrets through a local broker process shared by all forked workers on the controller.
+        If not set C(BT_BROKER) environment variable will be used.
+      - The broker is started on demand on a unix socket, holds one BeyondTrust session and combines
+        concurrent requests for the same secret into a single BeyondTrust call.
+      - A broker only serves lookups with the same BeyondTrust credentials, C(bt_cert_verify), C(bt_max_workers),
+        C(bt_session_ttl), C(bt_secret_search), C(bt_broker_cache_ttl) and C(bt_broker_idle_timeout).
+        Lookups with other values start a broker of their own.
+      - If the broker can not be used secrets are fetched directly.
+    type: bool
+    default: False
+    vars:
+      - name: bt_broker
+    env:
+      - name: BT_BROKER
+  bt_secret_search:
+    description:
+      - Find secrets with BeyondTrust filtered secret queries by title and folder path instead of listing whole folders.
+        If not set C(BT_SECRET_SEARCH) environment variable will be used.
+      - A filtered query is one request per secret, so only folders asked for at most 3 titles by a lookup are searched.
+        Folders asked for more titles are listed once, which costs a single request however many of its secrets are
+        wanted but transfers every secret of the folder.
+      - Folders are listed when the appliance does not support filtered queries.
+    type: bool
+    default: True
+    vars:
+      - name: bt_secret_search
+    env:
+      - name: BT_SECRET_SEARCH
+  bt_broker_cache_ttl:
+    description:
+      - Seconds the broker keeps fetched secrets in memory. If not set C(BT_BROKER_CACHE_TTL) environment variable will be used.
+      - Set to 0 to only combine requests that are in flight at the same time.
+    type: int
+    default: 30
+    vars:
+      - name: bt_broker_cache_ttl
+    env:
+      - name: BT_BROKER_CACHE_TTL
+  bt_broker_idle_timeout:
+    description:
+      - Seconds without requests after which the broker signs out and exits. If not set C(BT_BROKER_IDLE_TIMEOUT) environment variable will be used.
+    type: int
+    default: 120
+    vars:
+      - name: bt_broker_idle_timeout
+    env:
+      - name: BT_BROKER_IDLE_TIMEOUT
+  bt_cache:
+    description:
+      - Keep fetched secrets in an encrypted cache on disk so repeated runs skip BeyondTrust.
+        If not set C(BT_CACHE) environment variable will be used.
+      - Entries are encrypted with a key derived from the BeyondTrust uri, username, API key and password.
+      - C(refresh) always fetches from BeyondTrust and rewrites the cached entries.
+    type: str
+    default: 'off'
+    choices:
+      - 'off'
+      - 'on'
+      - refresh
+    vars:
+      - name: bt_cache
+    env:
+      - name: BT_CACHE
+  bt_cache_dir:
+    description:
+      - Directory of the secret cache. If not set C(BT_CACHE_DIR) environment variable will be used.
+    type: str
+    default: '~/.cache/cencora_itoa/secrets_safe'
+    vars:
+      - name: bt_cache_dir
+    env:
+      - name: BT_CACHE_DIR
+  bt_cache_ttl:
+    description:
+      - Seconds a cached secret is used before it is fetched again. If not set C(BT_CACHE_TTL) environment variable will be used.
+    type: int
+    default: 300
+    vars:
+      - name: bt_cache_ttl
+    env:
+      - name: BT_CACHE_TTL
+  bt_cache_max_entries:
+    description:
+      - Maximum number of secrets kept in the cache, least recently used secrets are removed first.
+        If not set C(BT_CACHE_MAX_ENTRIES) environment variable will be used.
+    type: int
+    default: 256
+    vars:
+      - name: bt_cache_max_entries
+    env:
+      - name: BT_CACHE_MAX_ENTRIES
+  file_output:
+    description:
+      - How File secrets are returned. If not set C(BT_FILE_OUTPUT) environment variable will be used.
+      - C(base64) returns the file content encoded in base64 in C(file).
+      - C(path) streams the file to a private temporary file readable only by the current user and returns its path in C(file_path).
+        The playbook is responsible for removing the file once it is no longer needed.
+    type: str
+    default: base64
+    choices:
+      - base64
+      - path
+    vars:
+      - name: bt_file_output
+    env:
+      - name: BT_FILE_OUTPUT
+  file_output_dir:
+    description:
+      - Directory where files are written when I(file_output=path). If not set C(BT_FILE_OUTPUT_DIR) environment variable will be used.
+      - Defaults to the system temporary directory.
+    type: str
+    vars:
+      - name: bt_file_output_dir
+    env:
+      - name: BT_FILE_OUTPUT_DIR
 """
 
 EXAMPLES = r"""
@@ -142,9 +289,14 @@ cred_title:
       sample: 'Lorem ipsum dolor sit amet, consectetur adipiscing elit'
     file:
       description: File data encoded in base64.
-      returned: when supported
+      returned: when supported and file_output is base64
       type: string
       sample: 'TWFueSBoYW5kcyBtYWtlIGxpZ2h0IHdvcmsu'
+    file_path:
+      description: Path to a temporary file with the file data, readable only by the current user.
+      returned: when supported and file_output is path
+      type: string
+      sample: '/tmp/bt_secret_4kq2u1x9'
 """
 
 display = Display()
@@ -160,155 +312,96 @@ class LookupModule(LookupBase):
         bt_apikey = self.get_option('bt_apikey')
         bt_username = self.get_option('bt_username')
         bt_password = self.get_option('bt_password')
-        bt_cert_verify = self.get_option('bt_cert_verify')
-        if bt_cert_verify is None or bt_cert_verify.lower()=="false":
-          bt_cert_verify=False
-        bt = BtApi(
-            bt_uri,
-            bt_apikey,
-            bt_username,
-            bt_password,
-            bt_cert_verify
-        )
-        display.vvv(f"Doing bt authenticate...")
-        bt.authenticate()
-        display.vvv(f"Get folders")
-        bt.get_folders()
+        file_output = self.get_option('file_output')
+        file_output_dir = self.get_option('file_output_dir')
         ret = []
         creds_dict = dict()
+        term_keys = dict()
         for term in terms:
             display.vvv(f"Searching for {term}")
             term_split = term.split('/')
             if len(term_split) > 1:
                 title = term_split[-1]
-                folder = term_split[-2]
+                folder = '/'.join(term_split[:-1])
             else:
                 title = term
                 if not bt_folder:
                     raise AnsibleError(f"bt_folder should be set if it is not specified in credential name")
                 folder = bt_folder
-            try:
-              folder_id = next(f['Id'] for f in bt.folders if f['Name'] == folder)
-            except:
-              raise AnsibleError(f"bt_folder={folder} not found in BeyondTrust")
-            bt.get_credentials(folder_id)
-            if len(bt.credentials)==0:
-                raise AnsibleError(f"Unable to find any credentials with parameters supplied.")
-            for credential in bt.credentials:
-                if credential['Title'] !=  title:
-                    continue
-                creds_dict[term] = dict()
-                if credential['SecretType']=="Credential":
-                    res = bt.get_credential(credential['Id'])
-                    creds_dict[term]['username'] = res['Username']
-                    creds_dict[term]['password'] = res['Password']
-                    
-                elif credential['SecretType']=="Text":
-                    res = bt.get_credential(credential['Id'])
-                    creds_dict[term]['text'] = res['Password']
-                elif credential['SecretType']=="File":
-                    res = bt.get_file(credential['Id'])
-                    creds_dict[term]['file'] = res['filecontent']
-                else:
-                    raise AnsibleError(f"Found a matching secret, but this is plugin is unable to handle its SecretType. The SecretType found was {credential['SecretType']}.")
+            term_keys[term] = (folder, title)
+        keys = list(dict.fromkeys(term_keys.values()))
+        bt_cache = self.get_option('bt_cache')
+        cache = None
+        cached = dict()
+        if bt_cache != 'off':
+            cache = SecretCache(
+                self.get_option('bt_cache_dir'),
+                [bt_uri, bt_username, bt_apikey, bt_password],
+                self.get_option('bt_cache_ttl'),
+                self.get_option('bt_cache_max_entries')
+            )
+            if bt_cache == 'on':
+                for key in keys:
+                    value = cache.get(key, file_output)
+                    if value is not None:
+                        cached[key] = value
+                display.vvv(f"Found {len(cached)} of {len(keys)} secret(s) in cache")
+        missing = [key for key in keys if key not in cached]
+        values = dict(cached)
+        if missing:
+            values.update(self.fetch_secrets(missing, file_output, file_output_dir))
+            if cache is not None:
+                for key in missing:
+                    if key in values:
+                        cache.put(key, file_output, values[key])
+        for term, key in term_keys.items():
+            if key in values:
+                creds_dict[term] = dict(values[key])
         ret.append(creds_dict)
-        bt.signout()
         if len(ret)==0:
           raise AnsibleError(f"Unable to find a secret matching the title supplied")
         return ret
 
-class BtApi:
-    def __init__(
-            self,
-            base_uri,
-            api_key,
-            username,
-            password,
-            bt_cert_verify
-            ):
-        self.base_uri = f"{base_uri}BeyondTrust/api/public/v3"
-        self.bt_cert_verify=bt_cert_verify
-        display.vvv(f"Base uri is: {self.base_uri}")
-        self.auth_header = {
-            "Authorization":
-            f"PS-Auth key={api_key}; runas={username}; pwd=[{password}];"
-        }
-        
-        self.session = requests.Session()
-
-    def get_folders(self):
-        display.vvv("Getting folder list for Team Passwords")
-        try:
-            response = self.session.get(
-                f"{self.base_uri}/Secrets-Safe/Folders")
-        except Exception as e:
-            raise AnsibleError(f"Unable to get Secrets-Safe folders. Error was {e}")
-        self.folders = self.__handle_reponse(response)
-
-    def get_credentials(self, folder_id):
-        display.vvv(f"Getting credential list for folder {folder_id}")
-        try:
-            response = self.session.get(
-                f"{self.base_uri}/Secrets-Safe/Folders/{folder_id}/secrets")
-        except Exception as e:
-            raise AnsibleError(f"Unable to get credential list. Error was {e}")
-        self.credentials = self.__handle_reponse(response)
-
-    def get_credential(self, credential_id):
-        display.vvv(f"Getting credential information for credential ID {credential_id}")
-        try:
-            response = self.session.get(
-                f"{self.base_uri}/Secrets-Safe/Secrets/{credential_id}")
-        except Exception as e:
-            raise AnsibleError(f"Unable to get credential list. Error was {e}")
-        return self.__handle_reponse(response)
-
-    def get_file(self, file_id):
-        display.vvv(f"Getting file for {file_id}")
-        try:
-            response = self.session.get(
-                f"{self.base_uri}/Secrets-Safe/Secrets/{file_id}/file/download")
-        except Exception as e:
-            raise AnsibleError(f"Unable to get credential list. Error was {e}")
-        return self.__handle_reponse_filecontents(response)
-
-    def authenticate(self):
-        display.vvv("Authenticating to BeyondTrust API")
-        url = f"{self.base_uri}/Auth/SignAppin"
-        try:
-            response = self.session.post(
-                url, headers=self.auth_header, verify=self.bt_cert_verify)
-        except Exception as e:
-            raise AnsibleError(f"Could not connect to {url} Error was: {e}")
-        self.__handle_reponse(response)
-        display.vvv("Succesfully authenticated to BeyondTrust API")
-
-    def signout(self):
-        display.vvv("Signing out from BeyondTrust API")
-        try:
-            self.session.post(
-                f"{self.base_uri}/Auth/SignOut", verify=self.bt_cert_verify)
-        except Exception as e:
-            raise AnsibleError(f"Could not connect to {self.base_uri}")
-        display.vvv("Succesfully signed out from BeyondTrust API")
-
-    def __handle_reponse(self, response):
-        if not response.status_code == 200:
-            raise AnsibleError(
-                f"Reponse {response.status_code} received from {response.request.url}")
-        try:
-            results = json.loads(response.text)
-        except Exception as e:
-            raise AnsibleError(f"Could not parse BeyondTrust response: {e}")
-        return results
-
-    def __handle_reponse_filecontents(self, response):
-        if not response.status_code == 200:
-            raise AnsibleError(
-                f"Reponse {response.status_code} received from {self.base_uri}")
-        try:
-            results = {"filecontent":base64.b64encode(response.content).decode('utf-8')}
-        except Exception as e:
-            raise AnsibleError(f"Could not parse BeyondTrust response: {e}")
-        return results
-
+    def fetch_secrets(self, keys, file_output, file_output_dir):
+        bt_uri = self.get_option('bt_uri')
+        bt_apikey = self.get_option('bt_apikey')
+        bt_username = self.get_option('bt_username')
+        bt_password = self.get_option('bt_password')
+        bt_cert_verify = self.get_option('bt_cert_verify')
+        bt_max_workers = max(1, self.get_option('bt_max_workers'))
+        bt_session_ttl = self.get_option('bt_session_ttl')
+        bt_secret_search = self.get_option('bt_secret_search')
+        if bt_cert_verify is None or bt_cert_verify.lower()=="false":
+          bt_cert_verify=False
+        values = None
+        if self.get_option('bt_broker'):
+            broker_config = {
+                'bt_uri': bt_uri,
+                'bt_apikey': bt_apikey,
+                'bt_username': bt_username,
+                'bt_password': bt_password,
+                'bt_cert_verify': bt_cert_verify,
+                'bt_max_workers': bt_max_workers,
+                'bt_session_ttl': bt_session_ttl,
+                'bt_secret_search': bt_secret_search,
+                'cache_ttl': self.get_option('bt_broker_cache_ttl'),
+                'idle_timeout': self.get_option('bt_broker_idle_timeout'),
+            }
+            values = fetch_secrets_from_broker(broker_config, keys, file_output, file_output_dir)
+        if values is None:
+            if bt_session_ttl > 0:
+                bt = get_bt_session(bt_uri, bt_apikey, bt_username, bt_password, bt_cert_verify, bt_max_workers, bt_session_ttl)
+            else:
+                bt = BtApi(
+                    bt_uri,
+                    bt_apikey,
+                    bt_username,
+                    bt_password,
+                    bt_cert_verify,
+                    pool_size=bt_max_workers
+                )
+                bt.open()
+            values = fetch_secrets(bt, keys, bt_max_workers, file_output, file_output_dir, bt_secret_search)
+            if bt_session_ttl <= 0:
+                bt.signout()
+        return values
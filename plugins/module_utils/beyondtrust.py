@@ -0,0 +1,682 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import base64
+import fcntl
+import hashlib
+import hmac
+import json
+import multiprocessing.util
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from ansible.errors import AnsibleError
+from ansible.utils.display import Display
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+display = Display()
+
+BROKER_START_TIMEOUT = 10
+BROKER_REQUEST_TIMEOUT = 300
+# broker configuration a broker is told apart by, its socket name and token are derived from these
+BROKER_SETTINGS = (
+    'bt_uri', 'bt_username', 'bt_apikey', 'bt_password', 'bt_cert_verify',
+    'bt_max_workers', 'bt_session_ttl', 'bt_secret_search', 'cache_ttl', 'idle_timeout',
+)
+FILE_CHUNK_SIZE = 1024 * 1024
+# (connect, read) seconds of every BeyondTrust request, read being the longest wait for the next bytes of a response
+DEFAULT_TIMEOUT = (10, 60)
+# folders asked for more titles than this are listed with one request instead of searched per title
+SECRET_SEARCH_MAX_TITLES = 3
+# status codes returned by appliances without filtered secret queries on /Secrets-Safe/Secrets
+SECRET_SEARCH_UNSUPPORTED = (400, 404, 405, 501)
+
+# signed in BtApi objects keyed by (bt_uri, username, apikey), shared by all lookups in the process.
+# Ansible forks a worker per task, so this only spans the lookups of one task, bt_broker spans tasks.
+bt_sessions = dict()
+bt_sessions_lock = threading.Lock()
+bt_sessions_pid = None
+
+
+def get_bt_session(bt_uri, bt_apikey, bt_username, bt_password, bt_cert_verify, pool_size, idle_ttl):
+    global bt_sessions_pid
+    key = (bt_uri, bt_username, bt_apikey)
+    expired = None
+    # the lock only guards the registry, signing in and out are network calls and run outside of it
+    # so that one slow sign in does not hold up every other thread
+    with bt_sessions_lock:
+        if bt_sessions_pid != os.getpid():
+            # forked workers exit through os._exit, so atexit handlers never run there
+            multiprocessing.util.Finalize(None, signout_bt_sessions, exitpriority=10)
+            bt_sessions_pid = os.getpid()
+        bt = bt_sessions.get(key)
+        if bt is not None and time.monotonic() - bt.last_used > idle_ttl:
+            display.vvv(f"Cached BeyondTrust session idle for more than {idle_ttl} seconds, signing in again")
+            expired = bt
+            bt = None
+        if bt is None:
+            bt = BtApi(
+                bt_uri,
+                bt_apikey,
+                bt_username,
+                bt_password,
+                bt_cert_verify,
+                pool_size=pool_size
+            )
+            bt_sessions[key] = bt
+        else:
+            display.vvv(f"Reusing BeyondTrust session for {bt_username}")
+            bt.mount_adapter(pool_size)
+        bt.last_used = time.monotonic()
+    if expired is not None:
+        expired.signout(ignore_errors=True)
+    bt.open()
+    return bt
+
+
+def signout_bt_sessions():
+    with bt_sessions_lock:
+        sessions = list(bt_sessions.values())
+        bt_sessions.clear()
+    for bt in sessions:
+        bt.signout(ignore_errors=True)
+
+
+def reset_bt_sessions_after_fork():
+    # connections are shared with the parent after a fork, the signed in session itself can still be used
+    for bt in bt_sessions.values():
+        bt.session.close()
+
+
+os.register_at_fork(after_in_child=reset_bt_sessions_after_fork)
+
+
+class SecretCache:
+    """Encrypted on-disk cache of secret values with a TTL and least recently used eviction."""
+
+    def __init__(self, directory, credentials, ttl, max_entries):
+        if not HAS_CRYPTOGRAPHY:
+            raise AnsibleError("python cryptography is required when bt_cache is used")
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        stat = os.lstat(self.directory)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            raise AnsibleError(f"bt_cache_dir={self.directory} must be owned by the current user and not accessible to others")
+        secret = '\0'.join(credentials).encode('utf-8')
+        salt = self.read_salt()
+        self.fernet = Fernet(base64.urlsafe_b64encode(self.derive_key(secret, salt, b'cencora.itoa.secrets_safe cache key')))
+        # entry file names are keyed hashes so folder and secret titles are not visible on disk
+        self.name_key = self.derive_key(secret, salt, b'cencora.itoa.secrets_safe cache names')
+
+    def derive_key(self, secret, salt, info):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info).derive(secret)
+
+    def read_salt(self):
+        path = os.path.join(self.directory, 'salt')
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(16))
+        except FileExistsError:
+            pass
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def entry_path(self, key, file_output):
+        name = hmac.new(self.name_key, json.dumps(list(key) + [file_output]).encode('utf-8'), hashlib.sha256).hexdigest()
+        return os.path.join(self.directory, f"{name}.entry")
+
+    def get(self, key, file_output):
+        path = self.entry_path(key, file_output)
+        try:
+            with open(path, 'rb') as f:
+                value = json.loads(self.fernet.decrypt(f.read(), ttl=self.ttl))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (InvalidToken, OSError, ValueError):
+            display.vvv(f"Cached secret {'/'.join(key)} expired or unreadable, removing it")
+            self.remove(path)
+            return None
+        return value
+
+    def put(self, key, file_output, value):
+        if 'file_path' in value:
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.fernet.encrypt(json.dumps(value).encode('utf-8')))
+            os.replace(tmp_path, self.entry_path(key, file_output))
+        except OSError as e:
+            display.vvv(f"Could not write secret cache entry. Error was {e}")
+            self.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.entry'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        for mtime, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def fetch_secrets(bt, keys, max_workers, file_output='base64', file_output_dir=None, secret_search=True):
+    """Fetch (folder, title) keys with a signed in BtApi, secrets that are not found are left out."""
+    folder_ids = dict()
+    for folder, title in keys:
+        if folder not in folder_ids:
+            folder_ids[folder] = bt.resolve_folder(folder)
+        if folder_ids[folder] is None:
+            raise AnsibleError(f"bt_folder={folder} not found in BeyondTrust")
+    secrets = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listed_keys = keys
+        if secret_search and bt.secret_search is not False:
+            titles_per_folder = Counter(folder for folder, title in set(keys))
+            # a folder many titles are asked from is listed once instead of searched title by title
+            searched_keys = [key for key in keys if titles_per_folder[key[0]] <= SECRET_SEARCH_MAX_TITLES]
+            listed_keys = [key for key in keys if titles_per_folder[key[0]] > SECRET_SEARCH_MAX_TITLES]
+            results = executor.map(lambda key: bt.search_secret(folder_ids[key[0]], key[1]), searched_keys)
+            for key, credential in zip(searched_keys, results):
+                if credential is False:
+                    listed_keys.append(key)
+                elif credential is not None:
+                    secrets[key] = credential
+        titles_by_folder = dict()
+        for folder, title in listed_keys:
+            titles_by_folder.setdefault(folder, set()).add(title)
+        for folder, titles in titles_by_folder.items():
+            credentials = bt.get_credentials(folder_ids[folder])
+            if len(credentials)==0:
+                raise AnsibleError(f"Unable to find any credentials with parameters supplied.")
+            # last secret wins when titles repeat, same as the previous linear scan
+            credentials_by_title = {credential['Title']: credential for credential in credentials}
+            for title in titles:
+                if title in credentials_by_title:
+                    secrets[(folder, title)] = credentials_by_title[title]
+        found = [key for key in keys if key in secrets]
+        display.vvv(f"Fetching {len(found)} secret(s) using {max_workers} worker(s)")
+        return dict(zip(found, executor.map(lambda key: get_secret_value(bt, secrets[key], file_output, file_output_dir), found)))
+
+
+def get_secret_value(bt, credential, file_output='base64', file_output_dir=None):
+    if credential['SecretType']=="Credential":
+        res = bt.get_credential(credential['Id'])
+        return {'username': res['Username'], 'password': res['Password']}
+    elif credential['SecretType']=="Text":
+        res = bt.get_credential(credential['Id'])
+        return {'text': res['Password']}
+    elif credential['SecretType']=="File" and file_output == 'path':
+        res = bt.download_file(credential['Id'], file_output_dir)
+        return {'file_path': res['filepath']}
+    elif credential['SecretType']=="File":
+        res = bt.get_file(credential['Id'])
+        return {'file': res['filecontent']}
+    raise AnsibleError(f"Found a matching secret, but this is plugin is unable to handle its SecretType. The SecretType found was {credential['SecretType']}.")
+
+
+# The broker is a short lived process listening on a unix socket. It is started on demand by the first
+# lookup that needs it, keeps one BeyondTrust session and a short in-memory cache for all forked workers,
+# and exits after it has been idle for bt_broker_idle_timeout seconds.
+BROKER_BOOTSTRAP = (
+    "import importlib.util, sys;"
+    "spec = importlib.util.spec_from_file_location('cencora_itoa_secrets_safe_broker', sys.argv[1]);"
+    "module = importlib.util.module_from_spec(spec);"
+    "spec.loader.exec_module(module);"
+    "module.run_broker(sys.stdin)"
+)
+def broker_token(config):
+    # a broker serves with the settings it was started with, lookups with other settings get a broker of their own
+    settings = [config[name] for name in BROKER_SETTINGS]
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()
+
+
+def broker_socket_path(token):
+    broker_dir = os.path.join(tempfile.gettempdir(), f"cencora_itoa_bt_broker_{os.getuid()}")
+    os.makedirs(broker_dir, mode=0o700, exist_ok=True)
+    stat = os.lstat(broker_dir)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise OSError(f"{broker_dir} must be a directory owned by the current user and not accessible to others")
+    return os.path.join(broker_dir, f"{token[:32]}.sock")
+
+
+def broker_request(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(BROKER_REQUEST_TIMEOUT)
+        client.connect(socket_path)
+        with client.makefile('rwb') as stream:
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            response = stream.readline()
+    if not response:
+        raise OSError("BeyondTrust broker closed the connection without a response")
+    return json.loads(response)
+
+
+def start_broker(config, socket_path):
+    with open(f"{socket_path}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            broker_request(socket_path, {'ping': True})
+            return
+        except OSError:
+            pass
+        display.vvv(f"Starting BeyondTrust broker on {socket_path}")
+        process = subprocess.Popen(
+            [sys.executable, '-c', BROKER_BOOTSTRAP, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        )
+        # credentials are handed over on stdin so they never show up in the process list
+        process.stdin.write(json.dumps(dict(config, socket_path=socket_path)).encode('utf-8'))
+        process.stdin.close()
+        deadline = time.monotonic() + BROKER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise OSError(f"BeyondTrust broker exited with code {process.returncode}")
+            try:
+                broker_request(socket_path, {'ping': True})
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise OSError(f"BeyondTrust broker did not start within {BROKER_START_TIMEOUT} seconds")
+
+
+def fetch_secrets_from_broker(config, keys, file_output='base64', file_output_dir=None):
+    """Fetch keys through the local broker, returns None when the broker can not be used."""
+    token = broker_token(config)
+    request = {'token': token, 'keys': keys, 'file_output': file_output, 'file_output_dir': file_output_dir}
+    try:
+        socket_path = broker_socket_path(token)
+        try:
+            response = broker_request(socket_path, request)
+        except OSError:
+            start_broker(config, socket_path)
+            response = broker_request(socket_path, request)
+    except (OSError, ValueError) as e:
+        display.vvv(f"BeyondTrust broker is not available, fetching secrets directly. Error was {e}")
+        return None
+    if 'error' in response:
+        raise AnsibleError(response['error'])
+    return {(folder, title): value for folder, title, value in response['values']}
+
+
+class BtBroker:
+    def __init__(self, config):
+        self.config = config
+        self.token = broker_token(config)
+        self.cache = dict()
+        self.inflight = dict()
+        self.lock = threading.Lock()
+        self.last_request = time.monotonic()
+
+    def get_secrets(self, keys, file_output='base64', file_output_dir=None):
+        now = time.monotonic()
+        # File secrets have a different shape per output mode, so the mode is part of the cache key
+        cache_keys = {key: key + (file_output, file_output_dir) for key in keys}
+        pending = dict()
+        fetch = []
+        with self.lock:
+            self.last_request = now
+            for cache_key, (expires, value) in list(self.cache.items()):
+                if expires <= now or ('file_path' in value and not os.path.exists(value['file_path'])):
+                    del self.cache[cache_key]
+            for key, cache_key in cache_keys.items():
+                if cache_key in self.cache:
+                    continue
+                if cache_key not in self.inflight:
+                    self.inflight[cache_key] = Future()
+                    fetch.append(key)
+                pending[key] = self.inflight[cache_key]
+            values = {key: self.cache[cache_key][1] for key, cache_key in cache_keys.items() if cache_key in self.cache}
+        if fetch:
+            self.fetch(fetch, file_output, file_output_dir)
+        # concurrent requests for the same secret wait for the single upstream call already in flight
+        for key, future in pending.items():
+            value = future.result()
+            if value is not None:
+                values[key] = value
+        return values
+
+    def fetch(self, keys, file_output, file_output_dir):
+        config = self.config
+        cache_keys = [key + (file_output, file_output_dir) for key in keys]
+        try:
+            bt = get_bt_session(
+                config['bt_uri'],
+                config['bt_apikey'],
+                config['bt_username'],
+                config['bt_password'],
+                config['bt_cert_verify'],
+                config['bt_max_workers'],
+                config['bt_session_ttl'] if config['bt_session_ttl'] > 0 else config['idle_timeout']
+            )
+            values = fetch_secrets(
+                bt, keys, config['bt_max_workers'], file_output, file_output_dir, config['bt_secret_search'])
+        except BaseException as e:
+            # every request waiting on these keys gets the error, none is left waiting for ever
+            with self.lock:
+                for cache_key in cache_keys:
+                    self.inflight.pop(cache_key).set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        expires = time.monotonic() + config['cache_ttl']
+        with self.lock:
+            for key, cache_key in zip(keys, cache_keys):
+                value = values.get(key)
+                if value is not None and config['cache_ttl'] > 0:
+                    self.cache[cache_key] = (expires, value)
+                self.inflight.pop(cache_key).set_result(value)
+
+    def handle(self, request):
+        if request.get('ping'):
+            return {}
+        if not hmac.compare_digest(request.get('token', ''), self.token):
+            return {'error': "BeyondTrust broker refused the request, credentials do not match"}
+        try:
+            values = self.get_secrets(
+                [tuple(key) for key in request['keys']],
+                request.get('file_output', 'base64'),
+                request.get('file_output_dir')
+            )
+        except Exception as e:
+            return {'error': str(e)}
+        return {'values': [[folder, title, value] for (folder, title), value in values.items()]}
+
+    def idle(self):
+        with self.lock:
+            return not self.inflight and time.monotonic() - self.last_request > self.config['idle_timeout']
+
+
+def run_broker(stream):
+    config = json.load(stream)
+    broker = BtBroker(config)
+
+    class BrokerRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = self.rfile.readline()
+            if not request:
+                return
+            response = broker.handle(json.loads(request))
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    socket_path = config['socket_path']
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, BrokerRequestHandler)
+    server.daemon_threads = True
+    os.chmod(socket_path, 0o600)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        while not broker.idle():
+            time.sleep(1)
+    finally:
+        server.shutdown()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        signout_bt_sessions()
+
+
+class BtApi:
+    def __init__(
+            self,
+            base_uri,
+            api_key,
+            username,
+            password,
+            bt_cert_verify,
+            pool_size=10,
+            timeout=DEFAULT_TIMEOUT
+            ):
+        self.base_uri = f"{base_uri}BeyondTrust/api/public/v3"
+        self.bt_cert_verify=bt_cert_verify
+        self.timeout = timeout
+        display.vvv(f"Base uri is: {self.base_uri}")
+        self.auth_header = {
+            "Authorization":
+            f"PS-Auth key={api_key}; runas={username}; pwd=[{password}];"
+        }
+        
+        self.session = requests.Session()
+        self.pool_size = 0
+        self.mount_adapter(pool_size)
+        self.auth_lock = threading.Lock()
+        self.auth_generation = 0
+        self.owner_pid = None
+        # None until the first filtered secret query tells whether the appliance supports it
+        self.secret_search = None
+        self.opened = False
+        self.last_used = time.monotonic()
+
+    def open(self):
+        """Sign in and read the folder list, the first thread to call it does both while the others wait."""
+        with self.auth_lock:
+            if self.opened:
+                return
+            display.vvv(f"Doing bt authenticate...")
+            self.authenticate()
+            display.vvv(f"Get folders")
+            self.get_folders()
+            # a failed sign in is tried again by the next caller
+            self.opened = True
+
+    def mount_adapter(self, pool_size):
+        # secrets are fetched from several threads over this one signed-in session
+        if pool_size <= self.pool_size:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def __get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        generation = self.auth_generation
+        response = self.session.get(url, **kwargs)
+        if response.status_code == 401:
+            response.close()
+            with self.auth_lock:
+                if generation == self.auth_generation:
+                    display.vvv("BeyondTrust session is no longer valid, signing in again")
+                    self.authenticate()
+            response = self.session.get(url, **kwargs)
+        return response
+
+    def get_folders(self):
+        display.vvv("Getting folder list for Team Passwords")
+        try:
+            response = self.__get(
+                f"{self.base_uri}/Secrets-Safe/Folders")
+        except Exception as e:
+            raise AnsibleError(f"Unable to get Secrets-Safe folders. Error was {e}")
+        self.folders = self.__handle_reponse(response)
+        folders_by_id = {folder['Id']: folder for folder in self.folders}
+        # full path -> id, every trailing part of a path (down to the folder name) -> ids, id -> queryable path
+        self.folder_path_ids = dict()
+        self.folder_suffix_ids = dict()
+        self.folder_paths = dict()
+        for folder in self.folders:
+            names = []
+            parent = folder
+            while parent is not None and len(names) <= len(self.folders):
+                names.insert(0, parent['Name'])
+                parent = folders_by_id.get(parent.get('ParentId'))
+            path = '/'.join(names)
+            self.folder_path_ids.setdefault(path, folder['Id'])
+            for start in range(len(names)):
+                self.folder_suffix_ids.setdefault('/'.join(names[start:]), []).append(folder['Id'])
+            # a path can not be queried when one of its folder names contains the separator
+            if not any('/' in name for name in names):
+                self.folder_paths[folder['Id']] = path
+
+    def resolve_folder(self, folder):
+        """Return the id of a folder given by full path, by the trailing part of its path or by name."""
+        if folder in self.folder_path_ids:
+            return self.folder_path_ids[folder]
+        folder_ids = self.folder_suffix_ids.get(folder)
+        if not folder_ids:
+            return None
+        if len(folder_ids) > 1:
+            display.warning(f"bt_folder={folder} matches {len(folder_ids)} folders in BeyondTrust, using the first one. "
+                            f"Use the full folder path to select a single folder.")
+        return folder_ids[0]
+
+    def get_credentials(self, folder_id):
+        display.vvv(f"Getting credential list for folder {folder_id}")
+        try:
+            response = self.__get(
+                f"{self.base_uri}/Secrets-Safe/Folders/{folder_id}/secrets")
+        except Exception as e:
+            raise AnsibleError(f"Unable to get credential list. Error was {e}")
+        self.credentials = self.__handle_reponse(response)
+        return self.credentials
+
+    def search_secret(self, folder_id, title):
+        """Find a secret by title with a filtered query, returns False when filtered queries can not be used."""
+        folder_path = self.folder_paths.get(folder_id)
+        if self.secret_search is False or folder_path is None:
+            return False
+        display.vvv(f"Searching for secret {title} in folder {folder_path}")
+        try:
+            response = self.__get(
+                f"{self.base_uri}/Secrets-Safe/Secrets",
+                params={'Path': folder_path, 'Separator': '/', 'Title': title})
+        except Exception as e:
+            raise AnsibleError(f"Unable to search for secret. Error was {e}")
+        if response.status_code in SECRET_SEARCH_UNSUPPORTED:
+            display.vvv(f"Filtered secret queries are not supported, listing folders instead")
+            self.secret_search = False
+            return False
+        credentials = self.__handle_reponse(response)
+        self.secret_search = True
+        match = None
+        for credential in credentials:
+            if credential['Title'] == title and credential.get('FolderId', folder_id) == folder_id:
+                match = credential
+        return match
+
+    def get_credential(self, credential_id):
+        display.vvv(f"Getting credential information for credential ID {credential_id}")
+        try:
+            response = self.__get(
+                f"{self.base_uri}/Secrets-Safe/Secrets/{credential_id}")
+        except Exception as e:
+            raise AnsibleError(f"Unable to get credential list. Error was {e}")
+        return self.__handle_reponse(response)
+
+    def get_file(self, file_id):
+        display.vvv(f"Getting file for {file_id}")
+        try:
+            response = self.__get(
+                f"{self.base_uri}/Secrets-Safe/Secrets/{file_id}/file/download")
+        except Exception as e:
+            raise AnsibleError(f"Unable to get credential list. Error was {e}")
+        return self.__handle_reponse_filecontents(response)
+
+    def download_file(self, file_id, directory=None):
+        display.vvv(f"Downloading file for {file_id}")
+        url = f"{self.base_uri}/Secrets-Safe/Secrets/{file_id}/file/download"
+        try:
+            response = self.__get(url, stream=True)
+        except Exception as e:
+            raise AnsibleError(f"Unable to download file from {url}. Error was {e}")
+        with response:
+            if not response.status_code == 200:
+                raise AnsibleError(
+                    f"Reponse {response.status_code} received from {url}")
+            # mkstemp creates the file with mode 0600
+            fd, path = tempfile.mkstemp(prefix='bt_secret_', dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=FILE_CHUNK_SIZE):
+                        f.write(chunk)
+            except Exception as e:
+                os.unlink(path)
+                raise AnsibleError(f"Could not download BeyondTrust file: {e}")
+        return {"filepath": path}
+
+    def authenticate(self):
+        display.vvv("Authenticating to BeyondTrust API")
+        url = f"{self.base_uri}/Auth/SignAppin"
+        try:
+            response = self.session.post(
+                url, headers=self.auth_header, verify=self.bt_cert_verify, timeout=self.timeout)
+        except Exception as e:
+            raise AnsibleError(f"Could not connect to {url} Error was: {e}")
+        self.__handle_reponse(response)
+        self.auth_generation += 1
+        self.owner_pid = os.getpid()
+        display.vvv("Succesfully authenticated to BeyondTrust API")
+
+    def signout(self, ignore_errors=False):
+        if self.owner_pid != os.getpid():
+            display.vvv("BeyondTrust session was signed in by another process, leaving it signed in")
+            return
+        display.vvv("Signing out from BeyondTrust API")
+        try:
+            self.session.post(
+                f"{self.base_uri}/Auth/SignOut", verify=self.bt_cert_verify, timeout=self.timeout)
+        except Exception as e:
+            if ignore_errors:
+                display.vvv(f"Could not sign out from {self.base_uri}. Error was {e}")
+                return
+            raise AnsibleError(f"Could not connect to {self.base_uri}")
+        display.vvv("Succesfully signed out from BeyondTrust API")
+
+    def __handle_reponse(self, response):
+        if not response.status_code == 200:
+            raise AnsibleError(
+                f"Reponse {response.status_code} received from {response.request.url}")
+        try:
+            results = json.loads(response.text)
+        except Exception as e:
+            raise AnsibleError(f"Could not parse BeyondTrust response: {e}")
+        return results
+
+    def __handle_reponse_filecontents(self, response):
+        if not response.status_code == 200:
+            raise AnsibleError(
+                f"Reponse {response.status_code} received from {self.base_uri}")
+        try:
+            results = {"filecontent":base64.b64encode(response.content).decode('utf-8')}
+        except Exception as e:
+            raise AnsibleError(f"Could not parse BeyondTrust response: {e}")
+        return results
+
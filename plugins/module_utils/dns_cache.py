@@ -0,0 +1,101 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dns import resolver
+from ansible.utils.display import Display
+
+display = Display()
+
+# seconds a failed resolution is remembered when the answer carries no SOA to take it from
+NEGATIVE_TTL = 60
+
+# Resolver objects keyed by nameserver ('' for the system resolver), resolv.conf is read once per process
+resolvers = dict()
+# (hostname, nameserver) -> (expires, ips, owner), shared by all lookups in the process
+answers = dict()
+dns_lock = threading.Lock()
+
+
+def get_resolver(nameserver):
+    with dns_lock:
+        res = resolvers.get(nameserver)
+        if res is None:
+            res = resolver.Resolver()
+            if nameserver:
+                res.nameservers = [nameserver]
+            resolvers[nameserver] = res
+    return res
+
+
+def negative_ttl(error):
+    """Seconds a NXDOMAIN or NoAnswer may be cached, from the SOA of the response as RFC 2308 has it."""
+    try:
+        responses = error.responses().values() if isinstance(error, resolver.NXDOMAIN) else [error.response()]
+        for response in responses:
+            for rrset in response.authority:
+                if rrset.rdtype == 6:  # SOA
+                    return min(rrset.ttl, rrset[0].minimum)
+    except Exception:
+        pass
+    return NEGATIVE_TTL
+
+
+def resolve_ip(hostname, nameserver=''):
+    """Return (ips, owner) of hostname, retrying with the system resolver when nameserver fails.
+
+    Answers are cached for their TTL and names that do not exist for their negative TTL.
+    """
+    key = (hostname, nameserver)
+    with dns_lock:
+        cached = answers.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        display.vv(f"Hostname {hostname} resolved to: {','.join(cached[1])} (cached)")
+        return cached[1], cached[2]
+    ret = []
+    owner = ''
+    ttl = None
+    if nameserver:
+        display.v(f"Trying to resolve {hostname} using: {nameserver} dns server")
+    else:
+        display.v(f"Trying to resolve {hostname} using: default dns server")
+    try:
+        answer = get_resolver(nameserver).resolve(hostname, search=True)
+        owner = answer.canonical_name.to_text()
+        ips = [ip.to_text() for ip in answer]
+        display.v(f"Hostname {hostname} resolved to: {','.join(ips)}")
+        ret = ips
+        ttl = answer.rrset.ttl
+    except Exception as e:
+        display.v(f"Error resolving {hostname}: {e}")
+        if isinstance(e, (resolver.NXDOMAIN, resolver.NoAnswer)):
+            ttl = negative_ttl(e)
+        if nameserver:
+            ret, owner = resolve_ip(hostname)
+    # timeouts and unreachable servers are not remembered
+    if ttl is not None:
+        with dns_lock:
+            answers[key] = (time.monotonic() + ttl, ret, owner)
+    return ret, owner
+
+
+def resolve_all(hostnames, nameserver='', max_workers=16, timeout=30):
+    """Resolve hostnames concurrently, return {hostname: (ips, owner)}.
+
+    Hostnames still unresolved after timeout seconds in total are left out.
+    """
+    hostnames = list(dict.fromkeys(hostnames))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(resolve_ip, hostname, nameserver): hostname for hostname in hostnames}
+    done, not_done = wait(futures, timeout=timeout)
+    # queries still running end on the resolver lifetime, nothing waits for them
+    executor.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        pending = sorted(futures[future] for future in not_done)
+        display.warning(f"DNS resolution of {len(pending)} hostnames did not finish within {timeout} seconds: {', '.join(pending[:10])}"
+                        + (', ...' if len(pending) > 10 else ''))
+    return {futures[future]: future.result() for future in done}
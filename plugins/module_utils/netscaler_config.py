@@ -0,0 +1,238 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+# Offline ADC configuration: ns.conf files and saved NITRO JSON exports turned into the same
+# collections of NITRO records the lookups otherwise list over the API, so vservers can be
+# resolved without connecting to the ADC or ADM.
+
+import functools
+import ipaddress
+import json
+import os
+import shlex
+
+from ansible.errors import AnsibleError
+from ansible.utils.display import Display
+
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import INDEX_FIELDS, AdcTopology
+
+display = Display()
+
+CONFIG_SUFFIXES = ('.conf', '.json')
+CONFIG_CACHE_SIZE = 32
+
+# ADC collections an offline topology serves, the ADM inventory is built separately
+ADC_RESOURCES = tuple(resource for resource in INDEX_FIELDS if not resource.startswith('ns_'))
+
+
+def split_command(line):
+    """Split an ns.conf line into positional arguments and lower cased -option values."""
+    tokens = shlex.split(line) if '"' in line or "'" in line else line.split()
+    arguments = []
+    options = dict()
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        if token.startswith('-'):
+            break
+        arguments.append(token)
+        position += 1
+    while position < len(tokens):
+        name = tokens[position][1:].lower()
+        if position + 1 < len(tokens) and not tokens[position + 1].startswith('-'):
+            options[name] = tokens[position + 1]
+            position += 2
+        else:
+            options[name] = ''
+            position += 1
+    return arguments, options
+
+
+def port_number(value):
+    return int(value) if value.isdigit() else value
+
+
+def parse_ns_conf(lines):
+    """Collections of NITRO records described by the add and bind commands of an ns.conf."""
+    collections = {resource: [] for resource in ADC_RESOURCES + ('servicegroup',)}
+    lb_bindings = []
+    cs_defaults = dict()
+    for line in lines:
+        line = line.strip()
+        if not line.startswith(('add ', 'bind ')):
+            continue
+        try:
+            arguments, options = split_command(line)
+        except ValueError as e:
+            display.vvv(f"Skipping ns.conf line that can not be read: {line}. Error: {e}")
+            continue
+        command = [argument.lower() for argument in arguments[:3]]
+        if command[:2] in (['add', 'service'], ['add', 'servicegroup'], ['add', 'server'], ['bind', 'servicegroup']):
+            kind, values = ' '.join(command[:2]), arguments[2:]
+        else:
+            kind, values = ' '.join(command), arguments[3:]
+        if not values:
+            continue
+        name = values[0]
+        if kind in ('add lb vserver', 'add cs vserver'):
+            record = {'name': name, 'servicetype': values[1] if len(values) > 1 else ''}
+            if len(values) > 3:
+                record['ipv46'] = values[2]
+                record['port'] = port_number(values[3])
+            collections['lbvserver' if kind == 'add lb vserver' else 'csvserver'].append(record)
+        elif kind == 'add cs action':
+            collections['csaction'].append({'name': name, 'targetlbvserver': options.get('targetlbvserver', '')})
+        elif kind == 'add cs policy':
+            record = {'policyname': name, 'rule': options.get('rule', '')}
+            for option in ('action', 'url', 'domain'):
+                if option in options:
+                    record[option] = options[option]
+            collections['cspolicy'].append(record)
+        elif kind == 'bind cs vserver':
+            if 'policyname' in options:
+                record = {
+                    'name': name,
+                    'policyname': options['policyname'],
+                    'priority': options.get('priority', '0'),
+                }
+                if 'targetlbvserver' in options:
+                    record['targetlbvserver'] = options['targetlbvserver']
+                collections['csvserver_cspolicy_binding'].append(record)
+            elif options.get('lbvserver') or len(values) > 1:
+                cs_defaults[name] = options.get('lbvserver') or values[1]
+        elif kind == 'bind lb vserver':
+            if len(values) > 1:
+                lb_bindings.append((name, values[1]))
+        elif kind == 'add service':
+            if len(values) > 3:
+                collections['service'].append({
+                    'name': name,
+                    'servername': values[1],
+                    'servicetype': values[2],
+                    'port': port_number(values[3]),
+                })
+        elif kind == 'add servicegroup':
+            collections['servicegroup'].append({'servicegroupname': name, 'servicetype': values[1] if len(values) > 1 else ''})
+        elif kind == 'bind servicegroup':
+            if len(values) > 2:
+                collections['servicegroup_servicegroupmember_binding'].append({
+                    'servicegroupname': name,
+                    'servername': values[1],
+                    'port': port_number(values[2]),
+                    'weight': options.get('weight', '1'),
+                })
+        elif kind == 'add server' and len(values) > 1:
+            record = {'name': name, 'state': options.get('state', 'ENABLED').upper()}
+            try:
+                ipaddress.ip_address(values[1])
+                record['ipaddress'] = values[1]
+            except ValueError:
+                record['domain'] = values[1]
+            collections['server'].append(record)
+    # ns.conf writes the add commands before the binds, but a binding only tells a service from
+    # a servicegroup once both are known
+    servicegroups = {record['servicegroupname'] for record in collections['servicegroup']}
+    for lbvserver, servicename in lb_bindings:
+        if servicename in servicegroups:
+            collections['lbvserver_servicegroup_binding'].append({'name': lbvserver, 'servicename': servicename, 'servicegroupname': servicename})
+        else:
+            collections['lbvserver_service_binding'].append({'name': lbvserver, 'servicename': servicename})
+    for record in collections['csvserver']:
+        if record['name'] in cs_defaults:
+            record['lbvserver'] = cs_defaults[record['name']]
+    # policies bound without a target send requests to the lb vserver of their action
+    actions = {record['name']: record['targetlbvserver'] for record in collections['csaction']}
+    policy_actions = {record['policyname']: record.get('action') for record in collections['cspolicy']}
+    for record in collections['csvserver_cspolicy_binding']:
+        if 'targetlbvserver' not in record:
+            record['targetlbvserver'] = actions.get(policy_actions.get(record['policyname']), '')
+    return collections
+
+
+def parse_nitro_export(data):
+    """Collections of a saved NITRO response, several responses merged into one object or a lookup snapshot."""
+    if isinstance(data, dict) and isinstance(data.get('collections'), dict):
+        data = data['collections']
+    if not isinstance(data, dict):
+        raise ValueError('expected a JSON object of NITRO collections')
+    return {resource: records for resource, records in data.items() if isinstance(records, list)}
+
+
+@functools.lru_cache(maxsize=CONFIG_CACHE_SIZE)
+def read_config(path, mtime_ns, size):
+    # keyed on modification time and size as well, a rewritten file is read again
+    display.vv(f"Reading NetScaler configuration {path}")
+    try:
+        with open(path) as f:
+            if path.endswith('.json'):
+                return parse_nitro_export(json.load(f))
+            return parse_ns_conf(f)
+    except (OSError, ValueError) as e:
+        raise AnsibleError(f"Could not read NetScaler configuration {path}: {e}")
+
+
+def load_config(path):
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise AnsibleError(f"Could not read NetScaler configuration {path}: {e}")
+    return read_config(path, stat.st_mtime_ns, stat.st_size)
+
+
+class ConfigSource:
+    """ns.conf files or NITRO JSON exports standing in for the ADCs and ADM.
+
+    path is a single configuration, used for every ADC, or a directory holding one
+    <adc hostname>.conf or <adc hostname>.json per ADC, named with or without the domain.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.files = dict()
+        if os.path.isdir(self.path):
+            for filename in sorted(os.listdir(self.path)):
+                stem, suffix = os.path.splitext(filename)
+                if suffix in CONFIG_SUFFIXES:
+                    self.files.setdefault(stem.lower(), os.path.join(self.path, filename))
+        elif os.path.isfile(self.path):
+            stem = os.path.splitext(os.path.basename(self.path))[0]
+            self.files[stem.lower()] = self.path
+        else:
+            raise AnsibleError(f"NetScaler configuration source {path} does not exist")
+
+    def config_path(self, adc_hostname):
+        if not os.path.isdir(self.path):
+            return self.path
+        hostname = adc_hostname.lower()
+        for name in (hostname, hostname.split('.')[0]):
+            if name in self.files:
+                return self.files[name]
+        raise AnsibleError(f"No configuration for {adc_hostname} in {self.path}")
+
+    def collections(self, adc_hostname):
+        return load_config(self.config_path(adc_hostname))
+
+    def topology(self, adc_hostname):
+        collections = self.collections(adc_hostname)
+        return AdcTopology(lambda resource: collections.get(resource, []), resources=ADC_RESOURCES)
+
+    def inventory(self, adc_domain):
+        """ADM like inventory of the cs and lb vservers of every configuration, as an AdcTopology."""
+        inventory = {'ns_csvserver': [], 'ns_lbvserver': []}
+        for stem, path in self.files.items():
+            # ADM reports ADC hostnames without the domain
+            hostname = os.path.splitext(os.path.basename(path))[0]
+            if hostname.lower().endswith('.' + adc_domain.lower()):
+                hostname = hostname[:-len(adc_domain) - 1]
+            collections = load_config(path)
+            for resource, vservers in (('ns_csvserver', 'csvserver'), ('ns_lbvserver', 'lbvserver')):
+                for vserver in collections.get(vservers, []):
+                    if 'ipv46' in vserver:
+                        inventory[resource].append({
+                            'name': vserver['name'],
+                            'vsvr_ip_address': vserver['ipv46'],
+                            'vsvr_type': vserver.get('servicetype', ''),
+                            'hostname': hostname,
+                        })
+        return AdcTopology(lambda resource: inventory.get(resource, []), resources=tuple(inventory))
@@ -0,0 +1,357 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+# Content switching policy rules compiled once into predicates on (hostname, path).
+#
+# Rules are normalised the way the lookups always did (lower case, classic expressions converted,
+# ("...") string arguments turned into [...], spaces removed) and parsed with || and && applied
+# strictly left to right, without precedence, as the former character by character evaluator did.
+# A rule that does not parse, or holds a clause that can not be read, never matches.
+
+import functools
+
+from ansible.utils.display import Display
+
+display = Display()
+
+RULE_CACHE_SIZE = 4096
+
+
+class PolicySyntaxError(ValueError):
+    pass
+
+
+def normalize_rule(rule):
+    rule = rule.lower()
+    if 'req.http' in rule:  # classic policy expression
+        rule = rule.replace("req.http.url == '", 'http.req.url.startswith("').replace("*'", '")')
+    rule = rule.replace('("', '[')
+    rule = rule.replace('")', ']')
+    rule = rule.replace(' ', '')
+    rule = rule.replace('url.path', 'url')  # url.path and url clauses are evaluated the same way
+    rule = rule.replace('get(1).', '')
+    rule = rule.replace('set_text_mode(ignorecase).', '')  # everything is compared in lower case
+    return rule
+
+
+def split_url(url):
+    """Return the (hostname, path) pair rules are evaluated against."""
+    url_split = url.lower().replace('https://', '').replace('http://', '').split('/')
+    hostname = url_split[0]
+    if len(url_split) > 1 and url_split[-1]:
+        path = '/' + '/'.join(url_split[1:])
+    else:
+        path = ''
+    return hostname, path
+
+
+def tokenize(rule):
+    """Split a normalised rule into '(', ')', '&&', '||' and clause tokens."""
+    tokens = []
+    clause = ''
+    position = 0
+    length = len(rule)
+    while position < length:
+        char = rule[position]
+        if char == '[':
+            end = rule.find(']', position)
+            if end < 0:
+                raise PolicySyntaxError(f"unterminated string at {position}")
+            clause += rule[position:end + 1]
+            position = end + 1
+            continue
+        if char == '(' and clause:
+            # arguments of a function call belong to the clause
+            end = closing_parenthesis(rule, position)
+            clause += rule[position:end + 1]
+            position = end + 1
+            continue
+        if char in '()':
+            if clause:
+                tokens.append(clause)
+                clause = ''
+            tokens.append(char)
+        elif char in '&|':
+            if rule[position + 1:position + 2] != char:
+                raise PolicySyntaxError(f"single '{char}' at {position}")
+            if clause:
+                tokens.append(clause)
+                clause = ''
+            tokens.append(char * 2)
+            position += 1
+        else:
+            clause += char
+        position += 1
+    if clause:
+        tokens.append(clause)
+    return tokens
+
+
+def closing_parenthesis(rule, position):
+    depth = 0
+    while position < len(rule):
+        char = rule[position]
+        if char == '[':
+            position = rule.find(']', position)
+            if position < 0:
+                break
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return position
+        position += 1
+    raise PolicySyntaxError('unbalanced parenthesis')
+
+
+def parse(tokens):
+    """Parse tokens into a tree of ('or'|'and', left, right), ('clause', element, test, value) and ('false',)."""
+    tree, position = parse_expression(tokens, 0)
+    if position != len(tokens):
+        raise PolicySyntaxError(f"unexpected '{tokens[position]}'")
+    return tree
+
+
+def parse_expression(tokens, position):
+    tree, position = parse_term(tokens, position)
+    while position < len(tokens) and tokens[position] in ('&&', '||'):
+        operator = 'and' if tokens[position] == '&&' else 'or'
+        right, position = parse_term(tokens, position + 1)
+        tree = (operator, tree, right)
+    return tree, position
+
+
+def parse_term(tokens, position):
+    if position >= len(tokens):
+        raise PolicySyntaxError('unexpected end of rule')
+    token = tokens[position]
+    if token == '(':
+        if position + 1 < len(tokens) and tokens[position + 1] == ')':
+            return ('false',), position + 2
+        tree, position = parse_expression(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ')':
+            raise PolicySyntaxError('missing closing parenthesis')
+        return tree, position + 1
+    if token in (')', '&&', '||'):
+        raise PolicySyntaxError(f"unexpected '{token}'")
+    return parse_clause(token), position + 1
+
+
+def parse_clause(clause):
+    # http.req.<element>.<test>[value], anything before the first '[' past http.req is ignored
+    parts = clause.replace(']', '').split('[')
+    attributes = parts[0].split('.')[2:]
+    if len(parts) < 2 or len(attributes) < 2:
+        raise PolicySyntaxError(f"can not read clause '{clause}'")
+    element = 'hostname' if attributes[0] == 'hostname' else 'url'
+    test = attributes[1]
+    if (element, test) not in CLAUSE_TESTS:
+        display.v(f"Test not supported: {test}.")
+        return ('false',)
+    return ('clause', element, test, parts[1])
+
+
+CLAUSE_TESTS = {
+    ('hostname', 'eq'): lambda value: lambda hostname, path: hostname == value,
+    ('hostname', 'ne'): lambda value: lambda hostname, path: hostname != value,
+    ('hostname', 'contains'): lambda value: lambda hostname, path: value in hostname,
+    ('url', 'startswith'): lambda value: lambda hostname, path: path.startswith(value),
+    ('url', 'contains'): lambda value: lambda hostname, path: value in path,
+}
+
+
+def never(hostname, path):
+    return False
+
+
+def build_predicate(tree):
+    kind = tree[0]
+    if kind == 'clause':
+        return CLAUSE_TESTS[tree[1], tree[2]](tree[3])
+    if kind == 'false':
+        return never
+    left = build_predicate(tree[1])
+    right = build_predicate(tree[2])
+    if kind == 'or':
+        return lambda hostname, path: left(hostname, path) or right(hostname, path)
+    return lambda hostname, path: left(hostname, path) and right(hostname, path)
+
+
+class CompiledRule:
+    """A parsed rule, match(hostname, path) evaluates it."""
+
+    __slots__ = ('rule', 'tree', 'match')
+
+    def __init__(self, rule, tree):
+        self.rule = rule
+        self.tree = tree
+        self.match = build_predicate(tree)
+
+
+@functools.lru_cache(maxsize=RULE_CACHE_SIZE)
+def compile_rule(rule):
+    normalized = normalize_rule(rule)
+    if not normalized:
+        return CompiledRule(normalized, ('false',))
+    try:
+        tree = parse(tokenize(normalized))
+    except PolicySyntaxError as e:
+        display.vvv(f"Error parsing policy expression {normalized}. Error: {e}. Policy never matches.")
+        tree = ('false',)
+    return CompiledRule(normalized, tree)
+
+
+def policy_match(url, rule):
+    hostname, path = split_url(url)
+    result = compile_rule(rule).match(hostname, path)
+    if display.verbosity > 2:
+        display.vvv(f"Policy rule '{rule}' evaluated to {result} for hostname '{hostname}' and path '{path}'")
+    return result
+
+
+def rule_patterns(rule):
+    """Return the sorted hostname.eq values and url.startswith prefixes a rule tests, what its URLs look like."""
+    hostnames = set()
+    paths = set()
+    trees = [compile_rule(rule).tree]
+    while trees:
+        tree = trees.pop()
+        if tree[0] in ('and', 'or'):
+            trees.extend(tree[1:])
+        elif tree[1:3] == ('hostname', 'eq'):
+            hostnames.add(tree[3])
+        elif tree[1:3] == ('url', 'startswith'):
+            paths.add(tree[3])
+    return sorted(hostnames), sorted(paths)
+
+
+def tree_routes(tree):
+    """Return (routes, exact) of a tree, see rule_routes."""
+    kind = tree[0]
+    if kind == 'false':
+        return [], True
+    if kind == 'clause':
+        if tree[1:3] == ('hostname', 'eq'):
+            return [(tree[3], '')], True
+        if tree[1:3] == ('url', 'startswith'):
+            return [(None, tree[3])], True
+        return [(None, '')], False
+    left, left_exact = tree_routes(tree[1])
+    right, right_exact = tree_routes(tree[2])
+    if kind == 'or':
+        return list(dict.fromkeys(left + right)), left_exact and right_exact
+    routes = []
+    for left_hostname, left_path in left:
+        for right_hostname, right_path in right:
+            if left_hostname and right_hostname and left_hostname != right_hostname:
+                continue
+            # both prefixes hold only when one extends the other
+            if left_path.startswith(right_path):
+                path = left_path
+            elif right_path.startswith(left_path):
+                path = right_path
+            else:
+                continue
+            routes.append((left_hostname or right_hostname, path))
+    return list(dict.fromkeys(routes)), left_exact and right_exact
+
+
+def rule_routes(rule):
+    """Return (routes, exact), the (hostname, path prefix) pairs of which one matches whenever the rule does.
+
+    hostname is None where any hostname matches and the path prefix '' where any path does. exact is
+    False when the rule tests more than hostname.eq and url.startswith, its routes then only tell
+    where requests can match it.
+    """
+    return tree_routes(compile_rule(rule).tree)
+
+
+def index_keys(tree):
+    """Keys of which at least one holds whenever the tree matches, None when there are none to index on.
+
+    A key is ('hostname', value) for hostname.eq clauses or ('prefix', value) for url.startswith.
+    """
+    kind = tree[0]
+    if kind == 'false':
+        return []
+    if kind == 'clause':
+        if tree[1:3] == ('hostname', 'eq'):
+            return [('hostname', tree[3])]
+        if tree[1:3] == ('url', 'startswith'):
+            return [('prefix', tree[3])]
+        return None
+    left = index_keys(tree[1])
+    right = index_keys(tree[2])
+    if kind == 'or':
+        return None if left is None or right is None else left + right
+    # either side of an and is enough, prefer the one with the fewest and most selective keys
+    candidates = [keys for keys in (left, right) if keys is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda keys: (len(keys), sum(key[0] == 'prefix' for key in keys)))
+
+
+class PolicyIndex:
+    """Content switching policies of one csvserver indexed for evaluating many URLs.
+
+    bindings are csvserver_cspolicy_binding records. Policies are looked up through a hash of
+    hostname.eq values, a trie of url.startswith prefixes and a list of policies that can not
+    be indexed, then the candidates are evaluated in priority order. The first match is the
+    same policy a scan of all bindings in priority order returns. A binding without a rule is
+    kept in the list and its rule is read with load_rule(policyname) when first reached.
+    """
+
+    def __init__(self, bindings, load_rule=None):
+        self.load_rule = load_rule
+        self.entries = sorted(bindings, key=lambda binding: int(binding['priority']))
+        self.rules = [None] * len(self.entries)
+        self.hostnames = dict()
+        self.prefixes = [dict(), []]
+        self.fallback = []
+        for position, binding in enumerate(self.entries):
+            rule = binding.get('rule', '')
+            if not rule:
+                self.fallback.append(position)
+                continue
+            self.rules[position] = compile_rule(rule)
+            keys = index_keys(self.rules[position].tree)
+            if keys is None:
+                self.fallback.append(position)
+                continue
+            for kind, value in set(keys):
+                if kind == 'hostname':
+                    self.hostnames.setdefault(value, []).append(position)
+                else:
+                    node = self.prefixes
+                    for char in value:
+                        node = node[0].setdefault(char, [dict(), []])
+                    node[1].append(position)
+
+    def candidates(self, hostname, path):
+        positions = set(self.fallback)
+        positions.update(self.hostnames.get(hostname, ()))
+        node = self.prefixes
+        positions.update(node[1])
+        for char in path:
+            node = node[0].get(char)
+            if node is None:
+                break
+            positions.update(node[1])
+        return sorted(positions)
+
+    def rule(self, position):
+        if self.rules[position] is None:
+            policyname = self.entries[position]['policyname']
+            display.vvv(f"Policy rule not found for {policyname} doing extra API call")
+            self.rules[position] = compile_rule(self.load_rule(policyname) if self.load_rule else '')
+        return self.rules[position]
+
+    def match(self, url):
+        """Return the binding of the first policy matching url, None when no policy does."""
+        hostname, path = split_url(url)
+        for position in self.candidates(hostname, path):
+            if self.rule(position).match(hostname, path):
+                return self.entries[position]
+        return None
@@ -0,0 +1,196 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from ansible.errors import AnsibleError
+from ansible.utils.display import Display
+
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_topology import (
+    BACKEND_RESOURCES, INDEX_FIELDS, RESOURCE_ATTRS, AdcTopology
+)
+
+display = Display()
+
+# ADM inventory collections, both indexed by vserver address
+ADM_RESOURCES = ('ns_csvserver', 'ns_lbvserver')
+
+
+def snapshot_path(directory, host, username):
+    digest = hashlib.sha256(f"{host}\0{username}".encode('utf-8')).hexdigest()[:16]
+    return os.path.join(os.path.expanduser(directory), f"{host}-{digest}.json")
+
+
+class TopologySnapshot:
+    """NITRO collections of one ADC or ADM kept on disk between runs.
+
+    collection(resource) serves a collection from the snapshot and lists it with
+    fetch_all(resource) the first time it is needed. Once a snapshot is older than ttl seconds
+    config_marker() is compared with the value saved with the snapshot, an unchanged marker
+    keeps the snapshot for another ttl and anything else starts a new one. Without a
+    config_marker the snapshot is simply dropped after ttl. With refresh the snapshot on disk
+    is never read, only replaced.
+    """
+
+    def __init__(self, path, fetch_all, ttl, config_marker=None, refresh=False):
+        self.path = path
+        self.fetch_all = fetch_all
+        self.ttl = ttl
+        self.config_marker = config_marker
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.data = None
+
+    def marker(self):
+        if self.config_marker is None:
+            return None
+        return self.config_marker()
+
+    def load(self):
+        data = None
+        if not self.refresh:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                display.vvv(f"Ignoring unreadable NetScaler snapshot {self.path}: {e}")
+        now = time.time()
+        marker = None
+        checked = False
+        if data is not None and now - data.get('checked', 0) > self.ttl:
+            marker = self.marker()
+            checked = True
+            if marker is not None and marker == data.get('marker'):
+                display.vvv(f"Configuration unchanged since snapshot {self.path} was taken, keeping it")
+                data['checked'] = now
+                self.save(data)
+            else:
+                display.vvv(f"NetScaler snapshot {self.path} expired")
+                data = None
+        elif data is not None:
+            display.vvv(f"Using NetScaler snapshot {self.path}")
+        if data is None:
+            if not checked:
+                marker = self.marker()
+            data = {'marker': marker, 'checked': now, 'collections': dict()}
+        self.data = data
+
+    def save(self, data):
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # mkstemp creates the file readable by the owner only
+            fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError as e:
+            display.warning(f"Could not save NetScaler snapshot {self.path}: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(path, self.path)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+    def collection(self, resource):
+        with self.lock:
+            if self.data is None:
+                self.load()
+            records = self.data['collections'].get(resource)
+        if records is not None:
+            return records
+        records = self.fetch_all(resource)
+        with self.lock:
+            self.data['collections'][resource] = records
+            self.save(self.data)
+        return records
+
+
+def adc_fetch(client, attrs):
+    def fetch(resource, name):
+        return client.get(resource, name, attrs=attrs.get(resource))
+    return fetch
+
+
+def adc_fetch_all(client, attrs, page_size=0):
+    def fetch_all(resource):
+        return client.get_all(resource, attrs=attrs.get(resource), page_size=page_size)
+    return fetch_all
+
+
+def adc_config_marker(client):
+    def config_marker():
+        try:
+            nsconfig = client.request('nsconfig', attrs=['lastconfigchangedtime']).get('nsconfig', {})
+        except AnsibleError as e:
+            display.vvv(f"Could not read last configuration change of {client.hostname}: {e}")
+            return None
+        return nsconfig.get('lastconfigchangedtime')
+    return config_marker
+
+
+def adc_topology(client, cache, cache_dir, cache_ttl, attrs=RESOURCE_ATTRS, resources=BACKEND_RESOURCES, page_size=0):
+    """AdcTopology of the ADC behind a NitroClient.
+
+    With cache other than off the collections come from a TopologySnapshot, listed with
+    RESOURCE_ATTRS so that every lookup can share it. Otherwise resources are listed in full and
+    anything else is fetched one object at a time, both with attrs.
+    """
+    if cache != 'off':
+        # servers are kept whole, the fields asked for can change from one run to the next
+        snapshot = TopologySnapshot(
+            snapshot_path(cache_dir, client.hostname, client.auth.username),
+            adc_fetch_all(client, RESOURCE_ATTRS, page_size),
+            cache_ttl,
+            config_marker=adc_config_marker(client),
+            refresh=cache == 'refresh'
+        )
+        return AdcTopology(snapshot.collection, resources=tuple(INDEX_FIELDS))
+    return AdcTopology(adc_fetch_all(client, attrs, page_size), adc_fetch(client, attrs), resources=resources)
+
+
+def adm_fetch(client):
+    def fetch(resource, address):
+        ip_address, protocol = address
+        return client.get(resource, filter={'vsvr_ip_address': ip_address, 'vsvr_type': protocol}, attrs=RESOURCE_ATTRS[resource])
+    return fetch
+
+
+def adm_fetch_all(client, protocol=None, page_size=0):
+    def fetch_all(resource):
+        return client.get_all(resource, attrs=RESOURCE_ATTRS[resource], filter={'vsvr_type': protocol} if protocol else None, page_size=page_size)
+    return fetch_all
+
+
+def adm_inventory(client, cache, cache_dir, cache_ttl, bulk=False, protocol=None, page_size=0):
+    """AdcTopology of the vservers in the inventory of the ADM behind a NitroClient, keyed by (address, protocol)."""
+    if cache != 'off':
+        # ADM has no configuration change time to check, its snapshot is simply renewed after cache_ttl
+        snapshot = TopologySnapshot(
+            snapshot_path(cache_dir, client.hostname, client.auth.username),
+            adm_fetch_all(client, page_size=page_size),
+            cache_ttl,
+            refresh=cache == 'refresh'
+        )
+        return AdcTopology(snapshot.collection, resources=ADM_RESOURCES)
+    # networks are looked up in the listed inventory even when single addresses are not
+    return AdcTopology(
+        adm_fetch_all(client, protocol, page_size),
+        adm_fetch(client),
+        resources=ADM_RESOURCES if bulk else ()
+    )
+
+
+def first_record(topology, resource, name, hostname):
+    records = topology.fetch(resource, name)
+    if not records:
+        raise AnsibleError(f"{resource} {name} not found on {hostname}")
+    return records[0]
@@ -0,0 +1,266 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+
+from ansible_collections.cencora.itoa.plugins.module_utils.netscaler_policy import rule_patterns, rule_routes
+
+# Backend resolution shared by the NetScaler lookups: an lb vserver is followed through its
+# service and servicegroup bindings down to the server objects, in binding order.
+
+BACKEND_RESOURCES = (
+    'lbvserver_service_binding',
+    'lbvserver_servicegroup_binding',
+    'service',
+    'servicegroup_servicegroupmember_binding',
+    'server',
+)
+
+# field, or tuple of fields, each collection is keyed on when it is indexed locally
+INDEX_FIELDS = {
+    'lbvserver_service_binding': 'name',
+    'lbvserver_servicegroup_binding': 'name',
+    'service': 'name',
+    'servicegroup_servicegroupmember_binding': 'servicegroupname',
+    'server': 'name',
+    'lbvserver': 'name',
+    'csvserver': 'name',
+    'csvserver_cspolicy_binding': 'name',
+    'cspolicy': 'policyname',
+    'csaction': 'name',
+    # ADM inventory, looked up by (vsvr_ip_address, vsvr_type) like the filtered ADM queries
+    'ns_csvserver': ('vsvr_ip_address', 'vsvr_type'),
+    'ns_lbvserver': ('vsvr_ip_address', 'vsvr_type'),
+}
+
+# collections a FrontendIndex is built from
+FRONTEND_RESOURCES = BACKEND_RESOURCES + ('lbvserver', 'csvserver', 'csvserver_cspolicy_binding')
+
+
+# collections url_routes reads
+ROUTE_RESOURCES = ('lbvserver', 'csvserver', 'csvserver_cspolicy_binding')
+
+
+# the only fields read from these resources, requested alone with attrs
+RESOURCE_ATTRS = {
+    'lbvserver_service_binding': ('name', 'servicename'),
+    'lbvserver_servicegroup_binding': ('name', 'servicename'),
+    'service': ('name', 'servername', 'port'),
+    'servicegroup_servicegroupmember_binding': ('servicegroupname', 'servername', 'port'),
+    'ns_csvserver': ('name', 'hostname', 'vsvr_ip_address', 'vsvr_type'),
+    'ns_lbvserver': ('name', 'hostname', 'vsvr_ip_address', 'vsvr_type'),
+}
+
+# the fields url_routes and FrontendIndex read from the vserver and policy collections, listed with nothing else
+FRONTEND_ATTRS = dict(
+    RESOURCE_ATTRS,
+    lbvserver=('name', 'ipv46', 'port'),
+    csvserver=('name', 'ipv46', 'port', 'lbvserver'),
+    csvserver_cspolicy_binding=('name', 'policyname', 'priority', 'rule', 'targetlbvserver'),
+    cspolicy=('policyname', 'rule', 'action'),
+    csaction=('name', 'targetlbvserver'),
+)
+
+
+def walk_backend_servers(fetch, lbvserver, executor=None):
+    """Servers behind an lb vserver, fetch(resource, name) returns the records of one object.
+
+    With an executor the objects of each level (bindings, services and servicegroup members,
+    servers) are fetched in parallel, the servers are still returned in binding order.
+    """
+    run = executor.map if executor is not None else map
+    service_bindings, servicegroup_bindings = run(
+        lambda resource: fetch(resource, lbvserver),
+        ('lbvserver_service_binding', 'lbvserver_servicegroup_binding'))
+    members = run(
+        lambda args: fetch(*args),
+        [('service', binding['servicename']) for binding in service_bindings]
+        + [('servicegroup_servicegroupmember_binding', binding['servicename']) for binding in servicegroup_bindings])
+    server_names = [member['servername'] for records in members for member in records]
+    return [server for servers in run(lambda name: fetch('server', name), server_names) for server in servers]
+
+
+class AdcTopology:
+    """Collections of one ADC or ADM fetched in bulk and joined in memory.
+
+    fetch_all(resource) returns every record of a collection. Each collection is requested the
+    first time a walk needs it, so an ADC without servicegroups never lists servicegroup members.
+    Resources outside of resources are passed on to fetch(resource, name) one object at a time.
+    """
+
+    def __init__(self, fetch_all, fetch=None, resources=BACKEND_RESOURCES):
+        self.fetch_all = fetch_all
+        self.fetch_one = fetch
+        self.resources = resources
+        self.indexes = dict()
+        # walks run on several threads, each collection is still listed only once
+        self.locks = {resource: threading.Lock() for resource in INDEX_FIELDS}
+
+    def index(self, resource):
+        with self.locks[resource]:
+            if resource not in self.indexes:
+                index = dict()
+                field = INDEX_FIELDS[resource]
+                for record in self.fetch_all(resource):
+                    if isinstance(field, tuple):
+                        key = tuple(record.get(name) for name in field)
+                    else:
+                        key = record.get(field)
+                    index.setdefault(key, []).append(record)
+                self.indexes[resource] = index
+        return self.indexes[resource]
+
+    def fetch(self, resource, name):
+        if resource not in self.resources:
+            return self.fetch_one(resource, name)
+        return self.index(resource).get(name, [])
+
+    def policy_rule(self, policyname):
+        cspolicy = self.fetch('cspolicy', policyname)
+        return cspolicy[0].get('rule', '') if cspolicy else ''
+
+    def policy_target(self, binding):
+        """lb vserver a csvserver_cspolicy_binding sends requests to."""
+        if binding.get('targetlbvserver'):
+            return binding['targetlbvserver']
+        # advanced policies reach their lb vserver through a cs action
+        cspolicy = self.fetch('cspolicy', binding['policyname'])
+        action = cspolicy[0].get('action') if cspolicy else None
+        csaction = self.fetch('csaction', action) if action else []
+        return csaction[0].get('targetlbvserver') if csaction else None
+
+    def servers(self, lbvserver, executor=None):
+        return walk_backend_servers(self.fetch, lbvserver, executor)
+
+
+class FrontendIndex:
+    """Vservers in front of every server of one ADC, the backend walk of AdcTopology inverted.
+
+    Built from whole collections of the topology: servers lead to the services and servicegroups
+    they are members of, those to the lb vservers they are bound to and the lb vservers to the
+    cs vservers using them as default or as target of a content switching policy.
+    """
+
+    def __init__(self, topology):
+        self.topology = topology
+        # server name -> [(member resource, service or servicegroup name, port)]
+        self.members = dict()
+        for name, records in topology.index('service').items():
+            for record in records:
+                self.members.setdefault(record.get('servername'), []).append(('service', name, record.get('port')))
+        for name, records in topology.index('servicegroup_servicegroupmember_binding').items():
+            for record in records:
+                self.members.setdefault(record.get('servername'), []).append(('servicegroup', name, record.get('port')))
+        # (member resource, name) -> lb vserver names, in binding order
+        self.lbvservers = dict()
+        for resource, member in (('lbvserver_service_binding', 'service'), ('lbvserver_servicegroup_binding', 'servicegroup')):
+            for lbvserver, records in topology.index(resource).items():
+                for record in records:
+                    self.lbvservers.setdefault((member, record.get('servicename')), []).append(lbvserver)
+        # lb vserver name -> {cs vserver name: {'default': bool, 'policies': [bindings]}}
+        self.csvservers = dict()
+        for name, records in topology.index('csvserver').items():
+            for record in records:
+                if record.get('lbvserver'):
+                    self.csvserver(record['lbvserver'], name)['default'] = True
+        for name, bindings in topology.index('csvserver_cspolicy_binding').items():
+            for binding in bindings:
+                target = self.topology.policy_target(binding)
+                if target:
+                    self.csvserver(target, name)['policies'].append(binding)
+        # lower cased address or domain -> server names
+        self.addresses = dict()
+        for name, records in topology.index('server').items():
+            for record in records:
+                for field in ('ipaddress', 'domain'):
+                    if record.get(field):
+                        self.addresses.setdefault(record[field].lower(), []).append(name)
+
+    def csvserver(self, lbvserver, name):
+        return self.csvservers.setdefault(lbvserver, dict()).setdefault(name, {'default': False, 'policies': []})
+
+    def server_names(self, server):
+        """Names of the servers called server, or with server as address or domain."""
+        names = [server] if server in self.members or self.topology.fetch('server', server) else []
+        return names + [name for name in self.addresses.get(server.lower(), []) if name != server]
+
+    def frontends(self, server):
+        """One entry for every service or servicegroup membership of the server and lb vserver it is bound to."""
+        ret = []
+        for name in self.server_names(server):
+            records = self.topology.fetch('server', name)
+            address = records[0].get('ipaddress') or records[0].get('domain') if records else name
+            for member, member_name, port in self.members.get(name, []):
+                lbvservers = self.lbvservers.get((member, member_name)) or [None]
+                for lbvserver in lbvservers:
+                    vserver = self.vserver('lbvserver', lbvserver)
+                    ret.append({
+                        'server': name,
+                        'address': address,
+                        member + 'name': member_name,
+                        'port': port,
+                        'lbvserver': lbvserver,
+                        'lbvserver_ipv46': vserver.get('ipv46'),
+                        'lbvserver_port': vserver.get('port'),
+                        'csvservers': self.frontend_csvservers(lbvserver),
+                    })
+        return ret
+
+    def frontend_csvservers(self, lbvserver):
+        ret = []
+        for name, use in self.csvservers.get(lbvserver, {}).items():
+            vserver = self.vserver('csvserver', name)
+            policies = []
+            for binding in sorted(use['policies'], key=lambda binding: int(binding.get('priority', 0))):
+                rule = binding.get('rule') or self.topology.policy_rule(binding['policyname'])
+                hostnames, paths = rule_patterns(rule)
+                policies.append({
+                    'policyname': binding['policyname'],
+                    'priority': binding.get('priority'),
+                    'rule': rule,
+                    'hostnames': hostnames,
+                    'paths': paths,
+                })
+            ret.append({
+                'name': name,
+                'ipv46': vserver.get('ipv46'),
+                'port': vserver.get('port'),
+                'default': use['default'],
+                'policies': policies,
+            })
+        return ret
+
+    def vserver(self, resource, name):
+        records = self.topology.fetch(resource, name) if name else []
+        return records[0] if records else {}
+
+
+def url_routes(topology):
+    """Routing table of an ADC, one dict per (hostname, path prefix) -> lb vserver route.
+
+    Every cs vserver gives the routes of its policies in priority order, a route with neither
+    hostname nor path to its default lb vserver last, then every lb vserver with an address of
+    its own gives a route to itself. hostname is None and path '' where anything matches, exact
+    is False when the policy rule tests more than the hostname and path prefix of its routes.
+    """
+    for name, records in topology.index('csvserver').items():
+        csvserver = records[0]
+        route = {'type': 'cs', 'vserver': name, 'ipv46': csvserver.get('ipv46'), 'port': csvserver.get('port')}
+        bindings = sorted(topology.fetch('csvserver_cspolicy_binding', name), key=lambda binding: int(binding.get('priority', 0)))
+        for binding in bindings:
+            rule = binding.get('rule') or topology.policy_rule(binding['policyname'])
+            target = topology.policy_target(binding)
+            routes, exact = rule_routes(rule)
+            for hostname, path in routes:
+                yield dict(route, priority=binding.get('priority'), policyname=binding['policyname'], rule=rule,
+                           exact=exact, hostname=hostname, path=path, lbvserver=target)
+        if csvserver.get('lbvserver'):
+            yield dict(route, priority=None, policyname=None, rule=None, exact=True, hostname=None, path='',
+                       lbvserver=csvserver['lbvserver'])
+    for name, records in topology.index('lbvserver').items():
+        lbvserver = records[0]
+        # 0.0.0.0 lb vservers are only reached through cs vservers
+        if lbvserver.get('ipv46') and lbvserver['ipv46'] != '0.0.0.0':
+            yield {'type': 'lb', 'vserver': name, 'ipv46': lbvserver['ipv46'], 'port': lbvserver.get('port'), 'priority': None,
+                   'policyname': None, 'rule': None, 'exact': True, 'hostname': None, 'path': '', 'lbvserver': name}
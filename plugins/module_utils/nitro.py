@@ -0,0 +1,415 @@
+# python 3 headers, required if submitting to Ansible
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import codecs
+import json
+import multiprocessing.util
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.auth import HTTPBasicAuth
+from ansible.errors import AnsibleError
+from ansible.utils.display import Display
+
+display = Display()
+
+api_path = '/nitro/v1/config/'
+
+# bytes read from a streamed response at a time
+STREAM_CHUNK_SIZE = 65536
+WHITESPACE = re.compile(r'[ \t\r\n]*')
+# (connect, read) seconds of every NITRO request unless NitroAuth is given others
+DEFAULT_TIMEOUT = (10, 60)
+# cookies a NITRO login returns its session in, NITRO_AUTH_TOKEN on an ADC and SESSID on ADM
+TOKEN_COOKIES = ('NITRO_AUTH_TOKEN', 'SESSID')
+
+
+class NitroAuth:
+    """Credentials and connection settings NitroClient uses for every ADC and ADM host.
+
+    timeout is the (connect, read) timeout in seconds of every NITRO request, read being the
+    longest wait for the next bytes of a response, not for the whole of it.
+    """
+
+    def __init__(self, username, password, pool_size=10, login=True, session_ttl=300, verify=False, timeout=DEFAULT_TIMEOUT):
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.login = login
+        self.session_ttl = session_ttl
+        self.verify = verify
+        self.timeout = timeout
+
+
+def nitro_auth(get_option, workers=0, timeout=DEFAULT_TIMEOUT):
+    """NitroAuth from the options of the cencora.itoa.nitro doc fragment of a lookup.
+
+    get_option is the get_option of the lookup, connection pools are grown to workers.
+    """
+    return NitroAuth(
+        get_option('username'),
+        get_option('password'),
+        pool_size=max(get_option('pool_size'), workers),
+        login=get_option('nitro_login'),
+        session_ttl=get_option('session_ttl'),
+        timeout=timeout
+    )
+
+
+# NitroSession objects keyed by (base url, username, password), shared by all lookups in the process
+nitro_sessions = dict()
+nitro_sessions_lock = threading.Lock()
+nitro_sessions_pid = None
+
+
+def get_nitro_session(url, auth):
+    global nitro_sessions_pid
+    parts = urllib.parse.urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}"
+    key = (base_url, auth.username, auth.password)
+    expired = None
+    # the lock only guards the registry, logins and logouts are network calls and run outside of it
+    # so that a slow or dead ADC does not hold up sessions to the others
+    with nitro_sessions_lock:
+        if nitro_sessions_pid != os.getpid():
+            # forked workers exit through os._exit, so atexit handlers never run there
+            multiprocessing.util.Finalize(None, logout_nitro_sessions, exitpriority=10)
+            nitro_sessions_pid = os.getpid()
+        nitro = nitro_sessions.get(key)
+        if nitro is not None and time.monotonic() - nitro.last_used > auth.session_ttl:
+            display.vvv(f"Cached NITRO session to {base_url} idle for more than {auth.session_ttl} seconds, opening a new one")
+            expired = nitro
+            nitro = None
+        if nitro is None:
+            nitro = NitroSession(base_url, auth)
+            nitro_sessions[key] = nitro
+        else:
+            nitro.mount_adapter(auth.pool_size)
+            # the session is keyed on the credentials only, the connection settings are the caller's
+            nitro.verify = auth.verify
+            nitro.timeout = auth.timeout
+        nitro.last_used = time.monotonic()
+    if expired is not None:
+        expired.logout(ignore_errors=True)
+    nitro.open()
+    return nitro
+
+
+def logout_nitro_sessions():
+    with nitro_sessions_lock:
+        sessions = list(nitro_sessions.values())
+        nitro_sessions.clear()
+    for nitro in sessions:
+        nitro.logout(ignore_errors=True)
+
+
+def reset_nitro_sessions_after_fork():
+    # connections are shared with the parent after a fork, the login token itself can still be used
+    for nitro in nitro_sessions.values():
+        nitro.session.close()
+
+
+os.register_at_fork(after_in_child=reset_nitro_sessions_after_fork)
+
+
+class NitroSession:
+    """Keep-alive connections to one ADC or ADM, authenticated with a NITRO login token when possible.
+
+    Nothing is sent before open(), the first thread to call it logs in while the others wait for it.
+    """
+
+    def __init__(self, base_url, auth):
+        self.base_url = base_url
+        self.username = auth.username
+        self.password = auth.password
+        self.session = requests.Session()
+        # NITRO compresses responses when asked, large collections shrink several times
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.verify = auth.verify
+        self.timeout = auth.timeout
+        self.pool_size = 0
+        self.mount_adapter(auth.pool_size)
+        self.auth_lock = threading.Lock()
+        self.auth_generation = 0
+        self.owner_pid = None
+        self.token = False
+        self.use_login = auth.login
+        self.opened = False
+        self.last_used = time.monotonic()
+
+    def open(self):
+        with self.auth_lock:
+            if self.opened:
+                return
+            if self.use_login:
+                self.login()
+            else:
+                self.session.auth = HTTPBasicAuth(self.username, self.password)
+            # a login that failed with an exception is tried again by the next caller
+            self.opened = True
+
+    def mount_adapter(self, pool_size):
+        if pool_size <= self.pool_size:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def login(self):
+        display.vvv(f"Logging in to NITRO API on {self.base_url}")
+        response = self.session.post(
+            self.base_url + api_path + 'login',
+            json={'login': {'username': self.username, 'password': self.password}},
+            verify=self.verify,
+            timeout=self.timeout)
+        if response.status_code in (200, 201) and not self.has_token():
+            # some proxies drop the cookie, the session is still named in the body,
+            # as sessionid by an ADC and as login[0].sessionid by ADM
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            body = body if isinstance(body, dict) else dict()
+            login = body.get('login')
+            if body.get('sessionid'):
+                self.session.cookies.set('NITRO_AUTH_TOKEN', body['sessionid'])
+            elif isinstance(login, list) and login and isinstance(login[0], dict) and login[0].get('sessionid'):
+                self.session.cookies.set('SESSID', login[0]['sessionid'])
+        if response.status_code not in (200, 201) or not self.has_token():
+            display.vv(f"NITRO login to {self.base_url} returned {response.status_code}, using basic authentication")
+            self.session.auth = HTTPBasicAuth(self.username, self.password)
+            self.token = False
+            return
+        self.token = True
+        self.auth_generation += 1
+        self.owner_pid = os.getpid()
+
+    def has_token(self):
+        return any(name in self.session.cookies for name in TOKEN_COOKIES)
+
+    def get(self, url, **kwargs):
+        # passed on every request, a session level verify loses against REQUESTS_CA_BUNDLE
+        kwargs.setdefault('verify', self.verify)
+        kwargs.setdefault('timeout', self.timeout)
+        generation = self.auth_generation
+        response = self.session.get(url, **kwargs)
+        if response.status_code == 401 and self.token:
+            response.close()
+            with self.auth_lock:
+                if generation == self.auth_generation:
+                    display.vvv(f"NITRO session to {self.base_url} is no longer valid, logging in again")
+                    self.session.cookies.clear()
+                    self.login()
+            response = self.session.get(url, **kwargs)
+        return response
+
+    def logout(self, ignore_errors=False):
+        if not self.token or self.owner_pid != os.getpid():
+            self.session.close()
+            return
+        display.vvv(f"Logging out from NITRO API on {self.base_url}")
+        try:
+            self.session.post(self.base_url + api_path + 'logout', json={'logout': {}}, verify=self.verify, timeout=self.timeout)
+        except requests.RequestException as e:
+            if not ignore_errors:
+                raise
+            display.vvv(f"Could not log out from {self.base_url}. Error was {e}")
+        self.session.close()
+
+
+class JsonStream:
+    """JSON text arriving in chunks, read one value at a time with only the unread part kept."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        # json.loads shares the key strings of all objects of a document, values decoded one by
+        # one would each get their own copies
+        share_key = dict().setdefault
+        self.decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: {share_key(key, key): value for key, value in pairs})
+
+    def fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        # the text already decoded is dropped once it outgrows a chunk
+        if self.position > STREAM_CHUNK_SIZE:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """Next character past whitespace, '' at the end of the text."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"expected one of {characters!r} at {self.position}, got {character!r}")
+        self.position += 1
+        return character
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_records(chunks, resource):
+    """Records of the resource array of a NITRO response, decoded one at a time as the chunks of text arrive."""
+    stream = JsonStream(chunks)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == resource and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.expect(',]') == ']':
+                        break
+        else:
+            # errorcode, message and severity
+            stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+
+def project(records, attrs):
+    """Keep only attrs of each record, like a NITRO query with attrs does."""
+    if not attrs:
+        return records
+    return [{field: record[field] for field in attrs if field in record} for record in records]
+
+
+def field_attrs(fields):
+    """attrs to request server records with for the fields option of a lookup, None for every field."""
+    # records are joined on name, it is always kept
+    return tuple(dict.fromkeys(['name'] + fields)) if fields else None
+
+
+class NitroClient:
+    """GET requests against the NITRO configuration API of one ADC or ADM.
+
+    Queries are written the way NITRO documents them (filter=name:value,name:value,
+    attrs=name,name), values are not URL encoded.
+    """
+
+    def __init__(self, hostname, auth):
+        self.hostname = hostname
+        self.auth = auth
+        self.base_url = 'https://' + hostname + api_path
+        self.abandoned = False
+
+    def abandon(self):
+        """Fail every later request of this client, for work still running after its caller stopped waiting."""
+        self.abandoned = True
+
+    def check_abandoned(self):
+        if self.abandoned:
+            raise AnsibleError(f"Requests to {self.hostname} were abandoned")
+
+    def url(self, resource, name=None, **query):
+        url = self.base_url + resource
+        if name is not None:
+            url += '/' + name
+        arguments = []
+        for argument, value in query.items():
+            if value is None or value is False:
+                continue
+            if argument == 'filter':
+                value = ','.join(f"{field}:{field_value}" for field, field_value in value.items())
+            elif argument == 'attrs':
+                value = ','.join(value)
+            elif value is True:
+                value = 'yes'
+            arguments.append(f"{argument}={value}")
+        if arguments:
+            url += '?' + '&'.join(arguments)
+        return url
+
+    def request(self, resource, name=None, **query):
+        self.check_abandoned()
+        url = self.url(resource, name, **query)
+        display.vv(f"Fetching info from {url}")
+        response = get_nitro_session(url, self.auth).get(url)
+        display.vvv(f"Response status code {str(response.status_code)}")
+        if response.status_code != 200:
+            raise AnsibleError(f"http error : {response.status_code}: {response.text}")
+        return response.json()
+
+    def get(self, resource, name=None, attrs=None, filter=None, bulkbindings=False):
+        """Records of one object, or of a whole collection when name is None."""
+        return self.request(resource, name, attrs=attrs, filter=filter, bulkbindings=bulkbindings).get(resource, [])
+
+    def stream(self, resource, attrs=None, **query):
+        """Records of a collection, decoded from the response as it arrives and reduced to attrs one by one.
+
+        The response body and the fields of a record not in attrs are never held in memory all at once.
+        """
+        self.check_abandoned()
+        url = self.url(resource, attrs=attrs, **query)
+        display.vv(f"Streaming info from {url}")
+        response = get_nitro_session(url, self.auth).get(url, stream=True)
+        try:
+            display.vvv(f"Response status code {str(response.status_code)}")
+            if response.status_code != 200:
+                raise AnsibleError(f"http error : {response.status_code}: {response.text}")
+            # NITRO sends JSON without a charset, it is always UTF-8
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            chunks = (decoder.decode(chunk) for chunk in response.iter_content(STREAM_CHUNK_SIZE))
+            try:
+                for record in iter_records(chunks, resource):
+                    yield {field: record[field] for field in attrs if field in record} if attrs else record
+            except ValueError as e:
+                raise AnsibleError(f"Could not decode {resource} from {self.hostname}: {e}")
+        finally:
+            response.close()
+
+    def get_all(self, resource, attrs=None, filter=None, page_size=0):
+        """Every record of a collection, page_size records per request when it is set.
+
+        Responses are decoded as they stream in, see stream. NITRO only lists binding resources
+        with bulkbindings, it is added for them.
+        """
+        bulkbindings = resource.endswith('_binding')
+        if not page_size:
+            return list(self.stream(resource, attrs=attrs, filter=filter, bulkbindings=bulkbindings))
+        records = []
+        page = 1
+        while True:
+            count = len(records)
+            records.extend(self.stream(resource, attrs=attrs, filter=filter, bulkbindings=bulkbindings, pagesize=page_size, pageno=page))
+            # a short page is the last one
+            if len(records) - count < page_size:
+                return records
+            page += 1